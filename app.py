@@ -12,16 +12,17 @@ Fecha: julio 2025
 """
 
 import streamlit as st
-from utils.llm_utils import clasificar_intencion, llm_genera_sql, llm_sql_respuesta, obtener_contexto_chat, responder_interaccion
-from utils.db_utils import ejecutar_sql
-from utils.img_utils import mostrar_imagenes_en_chat, mostrar_detalle_imagen, load_banner
-from utils.rag_utils import construir_retriever, generar_respuesta_rag
-import psycopg2
+from utils.llm_utils import clasificar_intencion, llm_genera_sql, llm_sql_respuesta_stream, obtener_contexto_chat, responder_interaccion_stream
+from utils.sql_utils import ejecutar_sql_cacheado
+from utils.img_utils import mostrar_imagenes_en_chat, mostrar_detalle_imagen, load_banner, prefetch_miniaturas
+from utils.rag_utils import recuperar_contexto, generar_respuesta_rag_stream
+from utils.recursos import registrar_recursos_app, precalentar, obtener
+from utils.pipeline_utils import clasificar_con_especulacion
+from utils.intencion_utils import clasificar_local, UMBRAL_CONFIANZA
+from utils.trazas_utils import tramo, trazar_stream, iniciar_traza, traza_actual, cerrar_traza, iniciar_servidor_metricas
 import os
 from dotenv import load_dotenv
-from groq import Groq
 import uuid
-import boto3
 
 # Configuración de la página de Streamlit
 st.set_page_config(page_title="SoroIA", layout="wide")
@@ -55,56 +56,34 @@ uso_pinecone = False # True o False, para usar Pinecone o FAISS
 modo_desarrollo = False # True o False, para mostrar mensajes de depuración
 llm_modelname = "llama-3.3-70b-versatile" # llama-3.3-70b-versatile o mistral-saba-24b
 historial_activo = False # para activar el historial de chat
+uso_cache_respuestas = True # True o False, para reutilizar respuestas a preguntas equivalentes
+precarga_fichas = False # True o False, para cargar todas las fichas en memoria al arrancar
+especulacion_rag = True # True o False, para recuperar el contexto RAG mientras se clasifica la consulta (solo si el clasificador local duda o se inclina por RAG)
+metricas_prometheus = True # True o False, para servir las métricas de latencia en /metrics (puerto PUERTO_METRICAS)
 
 # Cargar variables de entorno
 load_dotenv('./.env')
 
-# Función para obtener conexión a la base de datos 
-def get_db_connection(version_app):
-    if version_app == 'local':
-        conn = psycopg2.connect(
-            dbname=os.getenv("DB_NAME"),
-            user=os.getenv("DB_USER"),
-            password=os.getenv("DB_PASSWORD"),
-            host=os.getenv("DB_HOST"),
-            port=os.getenv("DB_PORT")
-        )
-    elif version_app == 'aws':
-        db_host = os.getenv("RDS_HOST")
-        db_port = os.getenv("RDS_PORT")
-        db_user = os.getenv("RDS_USER_IAM")
-        db_name =  os.getenv("RDS_NAME")
-        region = os.getenv("RDS_REGION")
-
-        client = boto3.client('rds', region_name=region)
-        token = client.generate_db_auth_token(DBHostname=db_host, Port=db_port, DBUsername=db_user, Region=region)
-
-        conn = psycopg2.connect(
-            host=db_host,
-            port=db_port,
-            database=db_name,
-            user=db_user,
-            password=token,
-            sslmode='require'
-        )
-
-    else:
-        raise ValueError("Versión de app no soportada")
-    return conn
-
-# Cliente de Groq en caché
+# Recursos pesados compartidos por todas las sesiones (clientes, modelo de embeddings, índice, pool de
+# PostgreSQL, cachés). Se registran una vez por proceso y se precalientan en segundo plano con la primera sesión;
+# cada recurso se crea al pedirlo si el precalentado aún no ha llegado a él.
 @st.cache_resource(show_spinner=False)
-def get_groq_client():
-    return Groq(api_key=os.getenv("GROQ_API_KEY"))
+def get_recursos():
+    registrar_recursos_app(version_app, uso_pinecone=uso_pinecone, precarga_fichas=precarga_fichas)
+    return precalentar(en_segundo_plano=True)
 
-# Cliente de S3 en caché
+# Servidor de métricas Prometheus, uno por proceso
 @st.cache_resource(show_spinner=False)
-def get_s3_client():
-	return boto3.client('s3')
-
-# Inicializar clientes Groq y S3
-groq_client = get_groq_client()
-s3_client = get_s3_client()
+def get_servidor_metricas():
+    return iniciar_servidor_metricas()
+
+# Obtener los clientes Groq y S3 compartidos
+get_recursos()
+groq_client = obtener("groq")
+s3_client = obtener("s3")
+cache_respuestas = obtener("cache_respuestas") if uso_cache_respuestas else None
+if metricas_prometheus:
+    get_servidor_metricas()
 print('New session SET UP Done!')
 # Configuración de la página de Streamlit
 
@@ -118,48 +97,109 @@ if "messages" not in st.session_state:
 if "vista_detalle" not in st.session_state:
     st.session_state.vista_detalle = None
 
-# Inicializar el retriever si no se usa Pinecone y no existe en el estado
-if not uso_pinecone:
-    if "retriever" not in st.session_state:
-        st.session_state.retriever = construir_retriever()
+# Función para mostrar un mensaje del historial en el chat
+def mostrar_mensaje(message):
+    with st.chat_message(message["role"]):
+        st.write(message["content"])
+
+        # Mostrar imágenes en el chat si existen
+        if "imagenes" in message:
+            mostrar_imagenes_en_chat(message["imagenes"], message.get("query_id", "default"), version_app, s3_client=s3_client)
+        
+        # Mostrar detalle de la imagen si se ha seleccionado
+        if (
+            "vista_detalle" in st.session_state
+            and st.session_state.vista_detalle
+            and any(
+                st.session_state.vista_detalle["path"] == img["path"]
+                for img in message.get("imagenes", [])
+            )):
+            mostrar_detalle_imagen(version_app, s3_client=s3_client)
+
+# Función para añadir un mensaje al historial y mostrarlo
+def agregar_mensaje(message):
+    st.session_state.messages.append(message)
+    mostrar_mensaje(message)
+
+# Función para mostrar una respuesta del LLM a medida que se genera y guardarla en el historial
+# Las miniaturas se preparan en segundo plano mientras se genera la respuesta
+def responder_en_streaming(generador, imagenes=None, **campos):
+    miniaturas = prefetch_miniaturas(imagenes, version_app, s3_client=s3_client) if imagenes else None
+    with st.chat_message("assistant"):
+        respuesta = st.write_stream(trazar_stream("respuesta", generador)).strip()
+        if imagenes:
+            mostrar_imagenes_en_chat(imagenes, campos.get("query_id", "default"), version_app, s3_client=s3_client, miniaturas=miniaturas)
+    message = {"role": "assistant", "content": respuesta, **campos}
+    if imagenes:
+        message["imagenes"] = imagenes
+    st.session_state.messages.append(message)
+    return respuesta
 
 # Función principal para manejar la consulta del usuario
 def manejar_consulta(consulta):
     st.session_state.query_id = str(uuid.uuid4())  # Nuevo id para cada consulta
+    iniciar_traza(st.session_state.query_id)  # Los tramos del pipeline se registran con este id
     if not uso_pinecone:
-        retriever = st.session_state.retriever # Recuperar el retriever del estado si no se usa Pinecone
+        retriever = obtener("retriever") # Retriever FAISS compartido por todas las sesiones
     
     if historial_activo:
         contexto = obtener_contexto_chat(n=2) # Obtener contexto de las últimas 2 interacciones
     else:
         contexto = ""
 
-    # Clasificar la intención de la consulta
-    tipo = clasificar_intencion(groq_client, llm_modelname, consulta, contexto=contexto) 
+    # Buscar una respuesta a una pregunta equivalente en la caché.
+    # Con historial no se usa, porque la misma pregunta puede significar otra cosa según la conversación.
+    usar_cache = uso_cache_respuestas and not contexto
+    if usar_cache:
+        en_cache = cache_respuestas.buscar(consulta)
+        if en_cache:
+            if modo_desarrollo:
+                agregar_mensaje({"role": "system", "content": f"Respuesta desde caché ({en_cache['tipo']}, similitud {en_cache['similitud']:.3f})"})
+            mensaje = {"role": "assistant", "content": en_cache["respuesta"]}
+            if en_cache["imagenes"]:
+                mensaje["imagenes"] = en_cache["imagenes"]
+                mensaje["query_id"] = st.session_state.query_id
+            agregar_mensaje(mensaje)
+            return
+
+    # Recuperación del contexto RAG (embedding de la consulta y búsqueda en el índice)
+    def recuperar():
+        if uso_pinecone:
+            return recuperar_contexto(consulta)
+        return recuperar_contexto(consulta, retriever=retriever)
+
+    # Clasificar la intención de la consulta. Si el clasificador local no está seguro o se inclina por RAG, se
+    # recupera mientras tanto el contexto RAG de forma especulativa; si la consulta no es RAG, se descarta.
+    # El clasificador local no ve el historial, así que con contexto siempre decide el LLM.
+    prediccion_local = clasificar_local(consulta) if not contexto else (None, 0.0)
+    etiqueta_local, confianza_local = prediccion_local
+    especular = especulacion_rag and (etiqueta_local == "RAG" or confianza_local < UMBRAL_CONFIANZA)
+    tipo, contexto_rag = clasificar_con_especulacion(
+        lambda: clasificar_intencion(groq_client, llm_modelname, consulta, contexto=contexto, prediccion_local=prediccion_local),
+        {"RAG": recuperar} if especular else {}
+    )
 
     if modo_desarrollo:
-        st.session_state.messages.append({"role": "system", "content": f"Clasificación: {tipo}"}) # para el modo desarrollador
+        agregar_mensaje({"role": "system", "content": f"Clasificación: {tipo}"}) # para el modo desarrollador
 
     if modo_desarrollo:
-            st.session_state.messages.append({"role": "system", "content": f"contexto: {contexto}"}) # para el modo desarrollador
+            agregar_mensaje({"role": "system", "content": f"contexto: {contexto}"}) # para el modo desarrollador
     
     # Procesar según el tipo de consulta detectado
     if tipo == "SQL":
         # Usamos la función llm_genera_sql para generar la consulta SQL
-        # y la función ejecutar_sql para ejecutarla en la base de datos.
+        # y la función ejecutar_sql_cacheado para ejecutarla en la base de datos (solo lectura, con tiempo y filas
+        # máximos), reutilizando el resultado si la misma consulta se ejecutó hace poco.
         # Mostramos las imágenes asociadas a los resultados si existen
-        # y generamos una respuesta con llm_sql_respuesta.
+        # y generamos en streaming una respuesta con llm_sql_respuesta_stream.
         # Si hay imágenes, las mostramos en el chat.
         # Si hay un error, lo capturamos y mostramos un mensaje de error.
         try:
-            conn = get_db_connection(version_app)
-            cursor = conn.cursor()
             sql_generado = llm_genera_sql(groq_client, llm_modelname, consulta, contexto=contexto)
             if modo_desarrollo:
-                st.session_state.messages.append({"role": "system", "content": f"SQL generado:\n{sql_generado}"})
-            resultados = ejecutar_sql(cursor, sql_generado)
-            conn.close()
-            columnas = [desc[0] for desc in cursor.description]
+                agregar_mensaje({"role": "system", "content": f"SQL generado:\n{sql_generado}"})
+            # La conexión se toma del pool compartido solo si el resultado no está en la caché
+            columnas, resultados = ejecutar_sql_cacheado(version_app, sql_generado)
 
             imagenes = []
             if "imagenes" in columnas:
@@ -171,86 +211,71 @@ def manejar_consulta(consulta):
                             "titulo": fila[columnas.index("inventario")] if "inventario" in columnas else "Sin título"
                         })
 
-            respuesta = llm_sql_respuesta(groq_client,llm_modelname, consulta, sql_generado, resultados)
-
-            # Agregamos mensaje con imágenes si hay
-            if imagenes:
-                st.session_state.messages.append({
-                    "role": "assistant", 
-                    "content": respuesta,
-                    "imagenes": imagenes,
-                    "query_id": st.session_state.query_id # Campo adicional para las imágenes
-                })
-            else:
-                st.session_state.messages.append({"role": "assistant", 
-                                                  "content": respuesta,
-                                                  "query_id": st.session_state.query_id
-                                                  })
+            # Mostramos la respuesta a medida que se genera, con las imágenes si hay
+            respuesta = responder_en_streaming(
+                llm_sql_respuesta_stream(groq_client, llm_modelname, consulta, sql_generado, resultados, columnas=columnas),
+                imagenes=imagenes,
+                query_id=st.session_state.query_id # Campo adicional para las imágenes
+            )
+            if usar_cache:
+                cache_respuestas.guardar(consulta, tipo, respuesta, sql=sql_generado, imagenes=imagenes)
 
         except Exception as e:
-            st.session_state.messages.append({
+            agregar_mensaje({
                 "role": "assistant",
                 "content": f"Error al procesar la consulta SQL: {e}"
             })
 
     elif tipo == "RAG":
-        # Usamos la función generar_respuesta_rag para generar una respuesta
-        # basada en recuperación de documentos. Si se usa Pinecone, no pasamos el retriever.
-        # Si no se usa Pinecone, pasamos el retriever construido anteriormente.
+        # Usamos el contexto recuperado durante la clasificación (o lo recuperamos ahora si no se especuló)
+        # y generamos en streaming una respuesta basada en esos documentos. Si se usa Pinecone, no pasamos
+        # el retriever. Si no se usa Pinecone, pasamos el retriever construido anteriormente.
         # Si estamos en modo desarrollo, mostramos el contexto obtenido.
-        if uso_pinecone:
-            respuesta, contexto = generar_respuesta_rag(groq_client,llm_modelname, consulta,  contexto_anterior=contexto)
-        else:
-            respuesta, contexto = generar_respuesta_rag(groq_client, llm_modelname, consulta, retriever=retriever)
-            #guardar_interaccion_csv(consulta, contexto, respuesta)
+        contexto_anterior = contexto if uso_pinecone else ""
+        contexto = contexto_rag if contexto_rag is not None else recuperar()
+        #guardar_interaccion_csv(consulta, contexto, respuesta)
 
         if modo_desarrollo:
-            st.session_state.messages.append({"role": "system", "content": f"Documentos obtenidos:\n{contexto}"})
-        st.session_state.messages.append({"role": "assistant", "content": respuesta})
+            agregar_mensaje({"role": "system", "content": f"Documentos obtenidos:\n{contexto}"})
+        respuesta = responder_en_streaming(
+            generar_respuesta_rag_stream(groq_client, llm_modelname, consulta, contexto, contexto_anterior=contexto_anterior)
+        )
+        if usar_cache:
+            cache_respuestas.guardar(consulta, tipo, respuesta, contexto=contexto)
     
     elif tipo == "INTERACCION":
-        # Usamos la función responder_interaccion para generar una respuesta amable.
-        respuesta = responder_interaccion(groq_client,llm_modelname, consulta)
-        st.session_state.messages.append({"role": "assistant", "content": respuesta})
+        # Usamos la función responder_interaccion_stream para generar una respuesta amable.
+        respuesta = responder_en_streaming(responder_interaccion_stream(groq_client, llm_modelname, consulta))
+        if usar_cache:
+            cache_respuestas.guardar(consulta, tipo, respuesta)
 
     else:
         # Si la consulta no se clasifica como SQL, RAG o INTERACCION,
         # mostramos un mensaje indicando que no se reconoce la pregunta.
-        st.session_state.messages.append({
-            "role": "assistant",
-            "content": "Lo siento, la pregunta no parece estar relacionada con el Museo Sorolla o Joaquín Sorolla."
-        })
+        respuesta = "Lo siento, la pregunta no parece estar relacionada con el Museo Sorolla o Joaquín Sorolla."
+        agregar_mensaje({"role": "assistant", "content": respuesta})
+        if usar_cache:
+            cache_respuestas.guardar(consulta, "NO", respuesta)
     
 
 # Entrada del usuario
-if prompt := st.chat_input("Escribe tu mensaje aquí:"):
+prompt = st.chat_input("Escribe tu mensaje aquí:")
+if prompt:
     # Limpiar vista anterior al hacer nueva consulta
     if "vista_detalle" in st.session_state:
         st.session_state.vista_detalle = None
 
-    # Agregar mensaje del usuario al historial
-    st.session_state.messages.append({"role": "user", "content": prompt})
-    manejar_consulta(prompt)
-
-
 # Mostrar historial del chat
 for message in st.session_state.messages:
-    with st.chat_message(message["role"]):
-        st.write(message["content"])
-
-        # Mostrar imágenes en el chat si existen
-        if "imagenes" in message:
-            mostrar_imagenes_en_chat(message["imagenes"], message.get("query_id", "default"), version_app, s3_client=s3_client)
-        
-        # Mostrar detalle de la imagen si se ha seleccionado
-        if (
-            "vista_detalle" in st.session_state
-            and st.session_state.vista_detalle
-            and any(
-                st.session_state.vista_detalle["path"] == img["path"]
-                for img in message.get("imagenes", [])
-            )):
-            conn = get_db_connection(version_app)
-            cursor = conn.cursor()
-            mostrar_detalle_imagen(cursor, version_app)
-            conn.close()
+    mostrar_mensaje(message)
+
+if prompt:
+    # Agregar mensaje del usuario al historial y responder; la respuesta se muestra mientras se genera
+    agregar_mensaje({"role": "user", "content": prompt})
+    with tramo("consulta"):
+        manejar_consulta(prompt)
+
+    # Desglose de latencia de la consulta para el modo desarrollador
+    if modo_desarrollo and traza_actual():
+        agregar_mensaje({"role": "system", "content": traza_actual().desglose()})
+    cerrar_traza()
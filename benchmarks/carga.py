@@ -0,0 +1,177 @@
+"""
+Prueba de carga de SoroIA sin red.
+
+Ejecuta app.py sin navegador (streamlit.testing AppTest) con N sesiones concurrentes que repiten las preguntas
+de evaluacion/data/*.csv. Groq, PostgreSQL y S3 se sustituyen por los simulados de benchmarks/simulados.py,
+con latencias configurables. Al terminar muestra la latencia p50/p95/p99 de cada intención y el rendimiento
+(preguntas por segundo).
+
+Requisitos: las dependencias de la app instaladas, el modelo de embeddings descargado y el índice FAISS
+construido (python -m utils.indice_utils).
+
+Uso:
+    python -m benchmarks.carga --sesiones 8 --preguntas 20
+    python -m benchmarks.carga --sesiones 1 2 4 8 16 --sin-cache --salida resultados_carga.json
+"""
+import os
+import csv
+import json
+import time
+import random
+import argparse
+import tempfile
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+DATOS_EVALUACION = os.path.join("evaluacion", "data")
+APP = "app.py"
+
+
+def cargar_preguntas(directorio=DATOS_EVALUACION):
+    """
+    Lee las preguntas de evaluación con su intención etiquetada.
+
+    Returns:
+        list: Lista de (pregunta, intención).
+    """
+    preguntas = []
+    with open(os.path.join(directorio, "clasificacion_intenciones_museo_sorolla.csv"), encoding="utf-8") as f:
+        preguntas += [(fila["pregunta"], fila["intencion"].strip().upper()) for fila in csv.DictReader(f)]
+    for nombre in ("interacciones.csv", "interacciones_respuesta.csv"):
+        ruta = os.path.join(directorio, nombre)
+        if os.path.exists(ruta):
+            with open(ruta, encoding="utf-8") as f:
+                preguntas += [(fila["user_input"], "RAG") for fila in csv.DictReader(f)]
+    return preguntas
+
+
+def percentil(valores, p):
+    """
+    Percentil p (0-100) con interpolación lineal.
+    """
+    if not valores:
+        return float("nan")
+    ordenados = sorted(valores)
+    posicion = (len(ordenados) - 1) * p / 100
+    inferior = int(posicion)
+    superior = min(inferior + 1, len(ordenados) - 1)
+    return ordenados[inferior] + (ordenados[superior] - ordenados[inferior]) * (posicion - inferior)
+
+
+def instalar_simulados(args, intenciones):
+    """
+    Sustituye Groq, S3 y PostgreSQL por los simulados antes de que la app los cree.
+    """
+    import groq
+    import boto3
+    from benchmarks.simulados import GroqSimulado, S3Local, BaseSQLite
+
+    cliente_groq = GroqSimulado(
+        intenciones, primer_token=args.primer_token, tokens_por_segundo=args.tokens_por_segundo,
+        tokens_respuesta=args.tokens_respuesta
+    )
+    groq.Groq = lambda *a, **kw: cliente_groq
+
+    s3 = S3Local(args.s3_dir, latencia=args.latencia_s3)
+    cliente_boto3 = boto3.client
+    boto3.client = lambda servicio, *a, **kw: s3 if servicio == "s3" else cliente_boto3(servicio, *a, **kw)
+
+    base = BaseSQLite(os.path.join(tempfile.gettempdir(), "soroia_carga.sqlite"), latencia=args.latencia_db)
+    base.instalar()
+
+    if args.sin_cache:
+        from utils.cache_utils import CacheRespuestas
+        CacheRespuestas.buscar = lambda self, consulta: None
+    return cliente_groq, s3, base
+
+
+def sesion(preguntas, timeout):
+    """
+    Simula un visitante: abre la app y hace sus preguntas una detrás de otra.
+
+    Returns:
+        list: (intención, segundos, error) de cada pregunta.
+    """
+    from streamlit.testing.v1 import AppTest
+
+    app = AppTest.from_file(APP, default_timeout=timeout)
+    app.run()
+    medidas = []
+    for pregunta, intencion in preguntas:
+        inicio = time.perf_counter()
+        app.chat_input[0].set_value(pregunta).run()
+        medidas.append((intencion, time.perf_counter() - inicio, bool(app.exception)))
+    return medidas
+
+
+def ejecutar_carga(preguntas, sesiones, por_sesion, timeout, semilla=42):
+    """
+    Lanza `sesiones` visitantes concurrentes con `por_sesion` preguntas cada uno.
+
+    Returns:
+        dict: Latencias por intención, errores, preguntas totales, duración y rendimiento.
+    """
+    azar = random.Random(semilla)
+    lotes = [[azar.choice(preguntas) for _ in range(por_sesion)] for _ in range(sesiones)]
+    inicio = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=sesiones) as executor:
+        resultados = list(executor.map(lambda lote: sesion(lote, timeout), lotes))
+    duracion = time.perf_counter() - inicio
+
+    medidas = [m for lote in resultados for m in lote]
+    por_intencion = {}
+    for intencion, segundos, _ in medidas:
+        por_intencion.setdefault(intencion, []).append(segundos)
+    return {
+        "sesiones": sesiones,
+        "preguntas": len(medidas),
+        "errores": sum(1 for m in medidas if m[2]),
+        "duracion": duracion,
+        "rendimiento": len(medidas) / duracion,
+        "latencias": {
+            intencion: {
+                "n": len(valores),
+                "p50": percentil(valores, 50), "p95": percentil(valores, 95), "p99": percentil(valores, 99),
+            }
+            for intencion, valores in sorted(por_intencion.items())
+        },
+    }
+
+
+def mostrar(resultado):
+    print(f"\nSesiones concurrentes: {resultado['sesiones']}  |  preguntas: {resultado['preguntas']}"
+          f"  |  errores: {resultado['errores']}  |  {resultado['rendimiento']:.2f} preguntas/s")
+    print(f"{'intención':>12} {'n':>5} {'p50 (s)':>9} {'p95 (s)':>9} {'p99 (s)':>9}")
+    for intencion, lat in resultado["latencias"].items():
+        print(f"{intencion:>12} {lat['n']:>5} {lat['p50']:>9.3f} {lat['p95']:>9.3f} {lat['p99']:>9.3f}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Prueba de carga de SoroIA con servicios simulados.")
+    parser.add_argument("--sesiones", type=int, nargs="+", default=[4], help="Sesiones concurrentes (una o varias)")
+    parser.add_argument("--preguntas", type=int, default=10, help="Preguntas por sesión")
+    parser.add_argument("--primer-token", type=float, default=0.3, help="Segundos hasta el primer token de Groq")
+    parser.add_argument("--tokens-por-segundo", type=float, default=250.0, help="Velocidad de generación de Groq")
+    parser.add_argument("--tokens-respuesta", type=int, default=120, help="Tokens de cada respuesta")
+    parser.add_argument("--latencia-db", type=float, default=0.01, help="Segundos por consulta a la base de datos")
+    parser.add_argument("--latencia-s3", type=float, default=0.05, help="Segundos por descarga de S3")
+    parser.add_argument("--s3-dir", default="./data", help="Directorio que hace de bucket S3")
+    parser.add_argument("--sin-cache", action="store_true", help="Desactivar la caché semántica de respuestas")
+    parser.add_argument("--timeout", type=float, default=120, help="Tiempo máximo por ejecución de la app")
+    parser.add_argument("--salida", help="Fichero JSON donde guardar los resultados")
+    args = parser.parse_args()
+
+    preguntas = cargar_preguntas()
+    cliente_groq, _, base = instalar_simulados(args, dict(preguntas))
+    print(f"{len(preguntas)} preguntas de evaluación, {base.filas} fichas en SQLite")
+
+    resultados = []
+    for sesiones in args.sesiones:
+        resultado = ejecutar_carga(preguntas, sesiones, args.preguntas, args.timeout)
+        mostrar(resultado)
+        resultados.append(resultado)
+    print(f"\nLlamadas a Groq simuladas: {cliente_groq.llamadas}  |  consultas SQL: {base.consultas}")
+
+    if args.salida:
+        with open(args.salida, "w", encoding="utf-8") as f:
+            json.dump(resultados, f, ensure_ascii=False, indent=4)
@@ -0,0 +1,190 @@
+"""
+Sustitutos locales de los servicios externos de SoroIA para las pruebas de carga, sin red:
+
+- GroqSimulado: cliente con la interfaz de Groq (chat.completions.create) con latencia hasta el primer token
+  y velocidad de generación configurables. Reconoce los prompts de la app (clasificación, generación de SQL y
+  respuestas) y devuelve respuestas plausibles.
+- S3Local: cliente S3 que sirve los objetos desde un directorio local (download_file).
+- BaseSQLite: tabla fichas_raw en SQLite que sustituye a PostgreSQL en utils.sql_utils.
+"""
+import os
+import re
+import glob
+import json
+import time
+import shutil
+import random
+import sqlite3
+import hashlib
+import threading
+from types import SimpleNamespace
+from contextlib import contextmanager
+
+# Consultas representativas de las que genera el LLM para las preguntas SQL
+SQL_SIMULADAS = [
+    "SELECT COUNT(*) FROM fichas_raw WHERE coleccion ILIKE '%pintura%'",
+    "SELECT coleccion, COUNT(*) AS total FROM fichas_raw GROUP BY coleccion",
+    "SELECT inventario, titulo, imagenes FROM fichas_raw WHERE coleccion ILIKE '%pintura%' AND fecha_ano = 1905 LIMIT 10",
+    "SELECT inventario, titulo, imagenes FROM fichas_raw WHERE descripcion ILIKE '%mar%' OR clasificacion_razonada ILIKE '%mar%' OR historia_del_objeto ILIKE '%mar%' LIMIT 10",
+    "SELECT * FROM fichas_raw WHERE tecnica ILIKE '%oleo%' LIMIT 10",
+    "SELECT inventario, titulo, fecha_ano FROM fichas_raw WHERE fecha_ano IS NOT NULL ORDER BY fecha_ano ASC LIMIT 10",
+]
+PALABRAS = "sorolla pinto esta obra en valencia con la luz del mediterraneo y la familia en la playa".split()
+
+
+class GroqSimulado:
+    """
+    Cliente con la interfaz de groq.Groq que simula la latencia del servicio.
+
+    Args:
+        intenciones (dict, optional): Pregunta -> intención que devuelve el clasificador. Por defecto "RAG".
+        primer_token (float, optional): Segundos hasta el primer token. Por defecto 0.3.
+        tokens_por_segundo (float, optional): Velocidad de generación. Por defecto 250.
+        tokens_respuesta (int, optional): Longitud de las respuestas en streaming. Por defecto 120.
+    """
+
+    def __init__(self, intenciones=None, primer_token=0.3, tokens_por_segundo=250.0, tokens_respuesta=120, **_):
+        self.intenciones = intenciones or {}
+        self.primer_token = primer_token
+        self.tokens_por_segundo = tokens_por_segundo
+        self.tokens_respuesta = tokens_respuesta
+        self.llamadas = {"clasificacion": 0, "sql": 0, "respuesta": 0}
+        self._lock = threading.Lock()
+        self.chat = SimpleNamespace(completions=SimpleNamespace(create=self._crear))
+
+    def _contar(self, tipo):
+        with self._lock:
+            self.llamadas[tipo] += 1
+
+    def _texto(self, prompt):
+        """
+        Decide qué contestaría el LLM según el prompt recibido.
+        """
+        if "Respuesta (solo responde" in prompt:
+            self._contar("clasificacion")
+            pregunta = re.search(r"Pregunta: (.*)", prompt)
+            pregunta = pregunta.group(1).strip() if pregunta else ""
+            return self.intenciones.get(pregunta, "RAG")
+        if "Genera una consulta SQL" in prompt:
+            self._contar("sql")
+            pregunta = re.search(r"Pregunta del usuario: (.*)", prompt)
+            semilla = int(hashlib.sha256((pregunta.group(1) if pregunta else "").encode()).hexdigest(), 16)
+            return SQL_SIMULADAS[semilla % len(SQL_SIMULADAS)]
+        self._contar("respuesta")
+        azar = random.Random(len(prompt))
+        return " ".join(azar.choice(PALABRAS) for _ in range(self.tokens_respuesta))
+
+    def _crear(self, model=None, messages=None, stream=False, **_):
+        texto = self._texto(messages[-1]["content"])
+        tokens = re.findall(r"\S+\s*", texto)
+        time.sleep(self.primer_token)
+        if not stream:
+            time.sleep(len(tokens) / self.tokens_por_segundo)
+            return SimpleNamespace(choices=[SimpleNamespace(message=SimpleNamespace(content=texto))])
+        return self._fragmentos(tokens)
+
+    def _fragmentos(self, tokens):
+        for token in tokens:
+            yield SimpleNamespace(choices=[SimpleNamespace(delta=SimpleNamespace(content=token))])
+            time.sleep(1.0 / self.tokens_por_segundo)
+
+
+class S3Local:
+    """
+    Cliente S3 mínimo que sirve los objetos de un directorio local, con una latencia opcional por descarga.
+    """
+
+    def __init__(self, directorio, latencia=0.05):
+        self.directorio = directorio
+        self.latencia = latencia
+        self.descargas = 0
+
+    def download_file(self, bucket, key, destino):
+        time.sleep(self.latencia)
+        origen = os.path.join(self.directorio, key)
+        if not os.path.exists(origen):
+            raise FileNotFoundError(f"s3://{bucket}/{key} no existe en {self.directorio}")
+        shutil.copyfile(origen, destino)
+        self.descargas += 1
+
+
+class BaseSQLite:
+    """
+    Tabla fichas_raw en SQLite, creada a partir de fichas/*.json (si existen) o de fichas sintéticas.
+
+    Args:
+        ruta (str): Fichero SQLite.
+        archivos (list, optional): Ficheros fichas/<coleccion>.json de los scrapers.
+        sinteticas (int, optional): Número de fichas sintéticas si no hay ficheros. Por defecto 3000.
+        latencia (float, optional): Segundos añadidos a cada consulta (ida y vuelta a la base de datos).
+    """
+
+    def __init__(self, ruta, archivos=None, sinteticas=3000, latencia=0.01):
+        from utils.carga_fichas import COLUMNAS, normalizar_ficha
+
+        self.ruta = ruta
+        self.latencia = latencia
+        self.consultas = 0
+        self._local = threading.local()
+        archivos = archivos if archivos is not None else sorted(glob.glob("fichas/*.json"))
+
+        filas = []
+        for archivo in archivos:
+            coleccion = os.path.splitext(os.path.basename(archivo))[0]
+            with open(archivo, "r", encoding="utf-8") as f:
+                filas += [normalizar_ficha(inv, ficha, coleccion) for inv, ficha in json.load(f).items()]
+        if not filas:
+            azar = random.Random(42)
+            colecciones = ["pintura", "dibujo", "cartas", "ceramica", "fotografia", "textiles"]
+            for n in range(sinteticas):
+                ano = azar.randint(1870, 1923)
+                ficha = {
+                    "Título": f"obra {n}", "Autor/a": "Sorolla y Bastida, Joaquín", "Datación": str(ano),
+                    "Técnica": azar.choice(["óleo", "acuarela", "gouache"]),
+                    "Descripción": " ".join(azar.choice(PALABRAS + ["mar", "barca"]) for _ in range(60)),
+                    "Imagenes": [f"imagenes/{n:05d}/{n:05d}_1.jpg"],
+                }
+                filas.append(normalizar_ficha(f"{n:05d}", ficha, azar.choice(colecciones)))
+
+        if os.path.exists(ruta):
+            os.remove(ruta)
+        conn = sqlite3.connect(ruta)
+        conn.execute(f"CREATE TABLE fichas_raw ({', '.join(COLUMNAS)})")
+        conn.executemany(f"INSERT INTO fichas_raw VALUES ({', '.join('?' for _ in COLUMNAS)})", filas)
+        conn.commit()
+        conn.close()
+        self.filas = len(filas)
+
+    def _conexion(self):
+        if not hasattr(self._local, "conn"):
+            self._local.conn = sqlite3.connect(f"file:{self.ruta}?mode=ro", uri=True, check_same_thread=False)
+        return self._local.conn
+
+    @contextmanager
+    def conexion(self, version_app=None):
+        yield self._conexion()
+
+    def ejecutar(self, conn, sql, max_filas=500, **_):
+        """
+        Sustituto de utils.sql_utils.ejecutar_sql_seguro: valida la consulta igual y la traduce al dialecto de SQLite.
+        """
+        from utils.sql_utils import validar_sql
+
+        sql = validar_sql(sql)
+        sql = re.sub(r"\bilike\b", "like", sql)  # LIKE de SQLite no distingue mayúsculas en ASCII
+        sql = re.sub(r"::\w+", "", sql)
+        time.sleep(self.latencia)
+        cursor = conn.execute(sql)
+        filas = cursor.fetchmany(max_filas)
+        self.consultas += 1
+        return [desc[0] for desc in cursor.description], filas
+
+    def instalar(self):
+        """
+        Sustituye PostgreSQL por esta base de datos en utils.sql_utils.
+        """
+        import utils.sql_utils as sql_utils
+
+        sql_utils.conexion = self.conexion
+        sql_utils.ejecutar_sql_seguro = self.ejecutar
+        sql_utils.version_datos = lambda version_app: 0
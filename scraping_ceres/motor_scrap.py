@@ -0,0 +1,764 @@
+'''
+Motor común de scraping de las colecciones del Museo Sorolla en CER.es.
+Procesa las fichas con un pool de hilos de tamaño acotado, limita la tasa de peticiones por host con un
+token bucket (en lugar de esperas aleatorias fijas) y guarda un checkpoint con las páginas y fichas completadas,
+de modo que una ejecución interrumpida continúa donde se quedó.
+Las fichas se escriben en streaming en un fichero JSON Lines (coste constante por ficha) y al terminar se compactan
+en fichas/<coleccion>.json, junto con las de ejecuciones anteriores, y el JSON Lines se vacía. Para compactar a mano
+un fichero parcial:
+    python motor_scrap.py compactar fichas/<coleccion>.jsonl
+Las peticiones reutilizan conexiones (una sesión HTTP por hilo, con reintentos y backoff) y guardan en disco los
+validadores ETag/Last-Modified, de modo que un refresco del catálogo solo transfiere lo que ha cambiado.
+Las imágenes se guardan una sola vez en un almacén direccionado por contenido (imagenes/_blobs/<sha256>.jpg, con
+el hash calculado mientras se descargan); las rutas imagenes/<id>/<id>_n.jpg son enlaces a esos blobs y cada
+carpeta tiene un manifest.json con el hash de cada imagen.
+Se ha respetado la licencia de uso de los datos del museo desde CER.es, usados para un uso privado y académico.
+Cualquier uso comercial o redistribución de los datos debe ser autorizado por el museo.
+'''
+import os
+import json
+import time
+import shutil
+import hashlib
+import threading
+from urllib.parse import urlparse
+from concurrent.futures import ThreadPoolExecutor
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+from bs4 import BeautifulSoup
+
+BASE_URL = "https://ceres.mcu.es/pages/"
+FICHA_URL = "https://ceres.mcu.es/pages/ResultSearch"
+BLOBS_DIR = "imagenes/_blobs"  # Almacén de imágenes direccionado por contenido (SHA-256)
+
+
+class TokenBucket:
+    """
+    Token bucket: permite ráfagas de hasta `capacidad` peticiones y una tasa media de `tasa` peticiones por segundo.
+    """
+
+    def __init__(self, tasa, capacidad):
+        self.tasa = tasa
+        self.capacidad = capacidad
+        self.tokens = capacidad
+        self.ultimo = time.monotonic()
+        self.lock = threading.Lock()
+
+    def esperar(self):
+        """
+        Bloquea hasta que hay un token disponible y lo consume.
+        """
+        while True:
+            with self.lock:
+                ahora = time.monotonic()
+                self.tokens = min(self.capacidad, self.tokens + (ahora - self.ultimo) * self.tasa)
+                self.ultimo = ahora
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                espera = (1 - self.tokens) / self.tasa
+            time.sleep(espera)
+
+
+class LimitadorPorHost:
+    """
+    Un token bucket por host, compartido por todos los hilos del scraper.
+    """
+
+    def __init__(self, tasa=2.0, capacidad=4):
+        self.tasa = tasa
+        self.capacidad = capacidad
+        self.buckets = {}
+        self.lock = threading.Lock()
+
+    def esperar(self, url):
+        """
+        Espera el turno para hacer una petición a la URL indicada.
+        :param url: URL de la petición
+        """
+        host = urlparse(url).netloc
+        with self.lock:
+            if host not in self.buckets:
+                self.buckets[host] = TokenBucket(self.tasa, self.capacidad)
+            bucket = self.buckets[host]
+        bucket.esperar()
+
+
+class ClienteHTTP:
+    """
+    Cliente HTTP compartido por los hilos del scraper: una requests.Session por hilo (keep-alive), reintentos con
+    backoff exponencial, limitación de tasa por host y caché en disco con validación ETag/Last-Modified.
+    """
+
+    def __init__(self, headers, limitador, cache_dir="./.cache_http", reintentos=3, backoff=1.0):
+        self.headers = headers
+        self.limitador = limitador
+        self.cache_dir = cache_dir
+        self.reintentos = reintentos
+        self.backoff = backoff
+        self.local = threading.local()
+        os.makedirs(cache_dir, exist_ok=True)
+
+    def sesion(self):
+        """
+        Devuelve la sesión HTTP del hilo actual, creándola la primera vez.
+        """
+        if not hasattr(self.local, "sesion"):
+            sesion = requests.Session()
+            sesion.headers.update(self.headers)
+            reintentos = Retry(
+                total=self.reintentos, backoff_factor=self.backoff,
+                status_forcelist=[429, 500, 502, 503, 504], allowed_methods=["GET", "POST"]
+            )
+            sesion.mount("https://", HTTPAdapter(max_retries=reintentos))
+            sesion.mount("http://", HTTPAdapter(max_retries=reintentos))
+            self.local.sesion = sesion
+        return self.local.sesion
+
+    def get(self, url, headers=None, timeout=30, stream=False):
+        self.limitador.esperar(url)
+        return self.sesion().get(url, headers=headers, timeout=timeout, stream=stream)
+
+    def post(self, url, data, timeout=30):
+        self.limitador.esperar(url)
+        return self.sesion().post(url, data=data, timeout=timeout)
+
+    def _ruta_cache(self, url):
+        return os.path.join(self.cache_dir, hashlib.sha256(url.encode("utf-8")).hexdigest())
+
+    def validadores(self, url):
+        """
+        Cabeceras condicionales (If-None-Match / If-Modified-Since) guardadas para la URL.
+        """
+        try:
+            with open(self._ruta_cache(url) + ".json", "r", encoding="utf-8") as f:
+                meta = json.load(f)
+        except (FileNotFoundError, json.JSONDecodeError):
+            return {}
+        condicionales = {}
+        if meta.get("etag"):
+            condicionales["If-None-Match"] = meta["etag"]
+        if meta.get("last_modified"):
+            condicionales["If-Modified-Since"] = meta["last_modified"]
+        return condicionales
+
+    def guardar_validadores(self, url, respuesta, cuerpo=None):
+        """
+        Guarda los validadores de una respuesta (y opcionalmente su cuerpo) para la próxima petición condicional.
+        """
+        meta = {"etag": respuesta.headers.get("ETag"), "last_modified": respuesta.headers.get("Last-Modified")}
+        if not meta["etag"] and not meta["last_modified"]:
+            return
+        ruta = self._ruta_cache(url)
+        if cuerpo is not None:
+            with open(ruta + ".tmp", "w", encoding="utf-8") as f:
+                f.write(cuerpo)
+            os.replace(ruta + ".tmp", ruta)
+        with open(ruta + ".json.tmp", "w", encoding="utf-8") as f:
+            json.dump(meta, f)
+        os.replace(ruta + ".json.tmp", ruta + ".json")
+
+    def get_condicional(self, url, timeout=30):
+        """
+        GET que reutiliza la copia en disco si el servidor responde 304 Not Modified.
+        :param url: URL de la página
+        :return: (código de estado, texto de la página); un 304 se devuelve como 200 con el texto guardado
+        """
+        condicionales = {}
+        if os.path.exists(self._ruta_cache(url)):
+            condicionales = self.validadores(url)
+        respuesta = self.get(url, headers=condicionales, timeout=timeout)
+        if respuesta.status_code == 304:
+            with open(self._ruta_cache(url), "r", encoding="utf-8") as f:
+                return 200, f.read()
+        if respuesta.status_code == 200:
+            self.guardar_validadores(url, respuesta, cuerpo=respuesta.text)
+        return respuesta.status_code, respuesta.text
+
+
+class Checkpoint:
+    """
+    Registro en disco de las páginas y fichas completadas, para poder reanudar el scraping.
+
+    Cada ficha o página completada se añade como una línea a un log (`<ruta>.log`), con fsync por lotes; cada
+    `compactar_cada` entradas, y al cerrar, el estado completo se vuelca en `<ruta>` y el log se vacía. Al
+    reanudar se lee el volcado y se aplican encima las entradas del log.
+    """
+
+    def __init__(self, ruta, compactar_cada=500, lote_fsync=20):
+        self.ruta = ruta
+        self.ruta_log = ruta + ".log"
+        self.compactar_cada = compactar_cada
+        self.lote_fsync = lote_fsync
+        self.lock = threading.Lock()
+        datos = {"paginas": [], "fichas": {}}
+        if os.path.exists(ruta):
+            with open(ruta, "r", encoding="utf-8") as f:
+                datos = json.load(f)
+        self.paginas = set(datos["paginas"])
+        self.fichas = datos["fichas"]  # id de la ficha en el listado -> número de inventario
+        self._aplicar_log()
+        if self.paginas or self.fichas:
+            print(f"Reanudando desde {ruta}: {len(self.paginas)} páginas y {len(self.fichas)} fichas completadas.")
+        self.entradas_log = 0
+        self.pendientes_fsync = 0
+        self._compactar()  # Empieza con el log vacío
+        self.log = open(self.ruta_log, "a", encoding="utf-8")
+
+    def _aplicar_log(self):
+        if not os.path.exists(self.ruta_log):
+            return
+        with open(self.ruta_log, "r", encoding="utf-8") as f:
+            for linea in f:
+                try:
+                    entrada = json.loads(linea)
+                except json.JSONDecodeError:
+                    continue  # Última línea a medias tras una interrupción
+                if "pagina" in entrada:
+                    self.paginas.add(entrada["pagina"])
+                else:
+                    self.fichas[entrada["ficha"]] = entrada["inventario"]
+
+    def pagina_completada(self, page_num):
+        return page_num in self.paginas
+
+    def ficha_completada(self, id_value):
+        return id_value in self.fichas
+
+    def marcar_ficha(self, id_value, inventario_id):
+        with self.lock:
+            self.fichas[id_value] = inventario_id
+            self._anotar({"ficha": id_value, "inventario": inventario_id})
+
+    def marcar_pagina(self, page_num):
+        with self.lock:
+            self.paginas.add(page_num)
+            self._anotar({"pagina": page_num})
+
+    def _anotar(self, entrada):
+        self.log.write(json.dumps(entrada, ensure_ascii=False) + "\n")
+        self.log.flush()
+        self.entradas_log += 1
+        self.pendientes_fsync += 1
+        if self.pendientes_fsync >= self.lote_fsync:
+            os.fsync(self.log.fileno())
+            self.pendientes_fsync = 0
+        if self.entradas_log >= self.compactar_cada:
+            self.log.close()
+            self._compactar()
+            self.log = open(self.ruta_log, "a", encoding="utf-8")
+
+    def _compactar(self):
+        # Escritura atómica del estado completo y, después, log vacío: si se interrumpe entre ambos pasos,
+        # volver a aplicar el log sobre el volcado no cambia nada
+        temporal = self.ruta + ".tmp"
+        with open(temporal, "w", encoding="utf-8") as f:
+            json.dump({"paginas": sorted(self.paginas), "fichas": self.fichas}, f, ensure_ascii=False)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(temporal, self.ruta)
+        open(self.ruta_log, "w").close()
+        self.entradas_log = 0
+        self.pendientes_fsync = 0
+
+    def cerrar(self):
+        with self.lock:
+            self.log.close()
+            self._compactar()
+
+
+class EscritorFichas:
+    """
+    Escritor append-only de fichas en formato JSON Lines: una línea completa por ficha, con fsync por lotes.
+    """
+
+    def __init__(self, ruta, lote_fsync=20):
+        self.ruta = ruta
+        self.lote_fsync = lote_fsync
+        self.pendientes = 0
+        self.lock = threading.Lock()
+        self.archivo = open(ruta, "a", encoding="utf-8")
+
+    def escribir(self, inventario_id, objeto):
+        """
+        Añade una ficha al final del fichero.
+        :param inventario_id: Número de inventario de la ficha
+        :param objeto: Diccionario Campo->Valor de la ficha
+        """
+        linea = json.dumps({"inventario": inventario_id, "ficha": objeto}, ensure_ascii=False)
+        with self.lock:
+            self.archivo.write(linea + "\n")
+            self.archivo.flush()
+            self.pendientes += 1
+            if self.pendientes >= self.lote_fsync:
+                os.fsync(self.archivo.fileno())
+                self.pendientes = 0
+
+    def cerrar(self):
+        with self.lock:
+            self.archivo.flush()
+            os.fsync(self.archivo.fileno())
+            self.archivo.close()
+
+
+def leer_fichas_jsonl(ruta):
+    """
+    Lee un fichero JSON Lines de fichas. Si una ficha aparece varias veces se queda la última, y una
+    última línea incompleta (escritura interrumpida) se ignora.
+    :param ruta: Ruta del fichero .jsonl
+    :return: Diccionario inventario -> ficha
+    """
+    fichas = {}
+    with open(ruta, "r", encoding="utf-8") as f:
+        for num_linea, linea in enumerate(f, start=1):
+            if not linea.strip():
+                continue
+            try:
+                registro = json.loads(linea)
+            except json.JSONDecodeError:
+                print(f"Línea {num_linea} incompleta en {ruta}, se ignora.")
+                continue
+            fichas[registro["inventario"]] = registro["ficha"]
+    return fichas
+
+
+def compactar(ruta_jsonl, ruta_json):
+    """
+    Añade las fichas del JSON Lines al fichero final fichas/<coleccion>.json (las nuevas sustituyen a las que
+    ya tenía), con escritura atómica, y vacía el JSON Lines. Si se interrumpe antes de vaciarlo, volver a
+    compactar da el mismo resultado.
+    :param ruta_jsonl: Ruta del fichero .jsonl
+    :param ruta_json: Ruta del fichero .json de salida
+    :return: Número de fichas compactadas
+    """
+    fichas = {}
+    if os.path.exists(ruta_json):
+        with open(ruta_json, "r", encoding="utf-8") as json_file:
+            fichas = json.load(json_file)
+    fichas.update(leer_fichas_jsonl(ruta_jsonl))
+    temporal = ruta_json + ".tmp"
+    with open(temporal, "w", encoding="utf-8") as json_file:
+        json.dump(fichas, json_file, ensure_ascii=False, indent=4)
+        json_file.flush()
+        os.fsync(json_file.fileno())
+    os.replace(temporal, ruta_json)
+    open(ruta_jsonl, "w").close()
+    print(f"{len(fichas)} fichas compactadas en {ruta_json}")
+    return len(fichas)
+
+
+def _ruta_blob(sha):
+    return f"{BLOBS_DIR}/{sha[:2]}/{sha}.jpg"
+
+
+def _sha256_archivo(ruta):
+    sha = hashlib.sha256()
+    with open(ruta, 'rb') as f:
+        for chunk in iter(lambda: f.read(64 * 1024), b''):
+            sha.update(chunk)
+    return sha.hexdigest()
+
+
+def _guardar_blob(img_data):
+    """
+    Escribe la imagen en el almacén de blobs calculando su SHA-256 mientras se descarga (memoria constante).
+    Si ya existía un blob con el mismo contenido, se descarta la copia nueva.
+    :param img_data: Respuesta HTTP en streaming
+    :return: (sha256, ruta del blob, bytes)
+    """
+    os.makedirs(BLOBS_DIR, exist_ok=True)
+    temporal = f"{BLOBS_DIR}/descarga.{threading.get_ident()}.tmp"
+    sha = hashlib.sha256()
+    tamano = 0
+    with open(temporal, 'wb') as img_file:
+        for chunk in img_data.iter_content(64 * 1024):
+            sha.update(chunk)
+            tamano += len(chunk)
+            img_file.write(chunk)
+
+    sha = sha.hexdigest()
+    ruta_blob = _ruta_blob(sha)
+    if os.path.exists(ruta_blob):
+        os.remove(temporal)
+    else:
+        os.makedirs(os.path.dirname(ruta_blob), exist_ok=True)
+        os.replace(temporal, ruta_blob)
+    return sha, ruta_blob, tamano
+
+
+def _enlazar(ruta_blob, img_name):
+    """
+    Publica el blob en su ruta lógica imagenes/<id>/<id>_n.jpg con un enlace duro (o una copia si el sistema
+    de ficheros no los admite). Se sustituye de forma atómica para no modificar nunca el blob a través del enlace.
+    """
+    os.makedirs(os.path.dirname(img_name), exist_ok=True)
+    temporal = f"{img_name}.{threading.get_ident()}.tmp"
+    try:
+        os.link(ruta_blob, temporal)
+    except OSError:
+        shutil.copyfile(ruta_blob, temporal)
+    os.replace(temporal, img_name)
+
+
+def _escribir_manifest(carpeta, inventario_id, entradas):
+    """
+    Guarda el manifest de la ficha: ruta lógica, hash y tamaño de cada imagen.
+    """
+    if not entradas:
+        return
+    os.makedirs(carpeta, exist_ok=True)
+    ruta = f"{carpeta}/manifest.json"
+    with open(ruta + ".tmp", "w", encoding="utf-8") as f:
+        json.dump({"inventario": inventario_id, "imagenes": entradas}, f, ensure_ascii=False, indent=4)
+    os.replace(ruta + ".tmp", ruta)
+
+
+def _pedir_imagen(cliente, img_url, img_name):
+    """
+    Pide una imagen con las cabeceras condicionales guardadas. Solo se considera vigente la copia local si el
+    servidor lo confirma con un 304; en otro caso hay que descargarla y comparar su SHA-256 (`_sin_cambios`).
+    :return: (respuesta, vigente). Si la copia es vigente, la respuesta ya está cerrada y no se descarga.
+    """
+    existe = os.path.exists(img_name)
+    img_data = cliente.get(img_url, headers=cliente.validadores(img_url) if existe else None, timeout=10, stream=True)
+    if existe and img_data.status_code == 304:
+        img_data.close()
+        return img_data, True
+    return img_data, False
+
+
+def _sin_cambios(img_name, sha):
+    """
+    Indica si la copia local de la imagen tiene el mismo contenido que el blob descargado.
+    """
+    return os.path.exists(img_name) and _sha256_archivo(img_name) == sha
+
+
+def descargar_imagenes(inventario_id, ficha_soup, cliente, config):
+    """
+    Descarga las imágenes en alta calidad de un objeto, iterando hasta que detecta una repetición o final de imágenes.
+    :param inventario_id: ID del objeto, utilizado para el nombre de la carpeta
+    :param ficha_soup: BeautifulSoup con el contenido de la ficha completa
+    :param cliente: ClienteHTTP compartido
+    :param config: Configuración de la colección
+    :return: Lista de rutas de las imágenes descargadas
+    """
+    image_paths = []
+    entradas = []  # Manifest de la ficha: ruta, sha256 y bytes de cada imagen
+
+    # Buscar enlace "Ampliar Imagen" que lleva al visor
+    ampliar_link = ficha_soup.find('p', class_='ampliar')
+    if ampliar_link:
+        ampliar_href = ampliar_link.find('a')['href']
+        visor_url = BASE_URL + ampliar_href  # URL del visor de imágenes
+        print(f"URL del visor para {inventario_id}: {visor_url}")  # Depuración de la URL
+    else:
+        print(f"No se encontró el enlace de ampliación para {inventario_id}")
+        return image_paths
+
+    # Buscar el mosaico de imágenes
+    mosaic_table = ficha_soup.find('table', {'class': 'tablaLPR3', 'summary': 'Mosaico de imágenes'})
+    if mosaic_table:
+        mosaic_images = mosaic_table.find_all('img', class_='fotoFC')
+        total_images = len(mosaic_images)
+        print(f"Se encontraron {total_images} imágenes en el mosaico.")  # Depuración de la cantidad de imágenes
+    else:
+        print("No se encontró el mosaico de imágenes.")
+        total_images = 0
+
+    # Inicializar variables
+    img_index = 1
+    seen_hashes = set()  # Usamos un conjunto para detectar repeticiones
+    nombre = config["nombre_carpeta"](inventario_id)
+    carpeta = f"imagenes/{nombre}"
+    print(f"Comenzando descarga de imágenes para {inventario_id}...")  # Depuración inicial
+
+    # Si no hay mosaico de imágenes, descargar la imagen principal
+    if total_images == 0:
+        if not config["imagen_principal"]:
+            return image_paths
+        try:
+            img_url = f"{BASE_URL}Viewer?accion=42&AMuseo={config['museo']}&Ninv={inventario_id}&txt_id_imagen=1&txt_totalImagenes=1&txt_zoom=10"
+            print(f"Descargando imagen principal: {img_url}")  # Depuración de la URL de imagen
+
+            img_name = f"{carpeta}/{nombre}_{img_index}.jpg"
+            img_data, vigente = _pedir_imagen(cliente, img_url, img_name)
+            if vigente:
+                print(f"Imagen sin cambios, no se descarga: {img_name}")
+                image_paths.append(img_name)
+                entradas.append({"ruta": img_name, "sha256": _sha256_archivo(img_name), "bytes": os.path.getsize(img_name)})
+                _escribir_manifest(carpeta, inventario_id, entradas)
+                return image_paths
+
+            # Si la solicitud no fue exitosa, detener
+            if img_data.status_code != 200:
+                print(f"Error al obtener la imagen principal, terminando descarga.")
+                return image_paths
+
+            # Verificar si la respuesta es realmente una imagen
+            content_type = img_data.headers.get('Content-Type', '')
+            if not content_type.startswith('image'):
+                print(f"La URL {img_url} no devolvió una imagen. Deteniendo descarga.")
+                return image_paths
+
+            sha, ruta_blob, tamano = _guardar_blob(img_data)
+            if _sin_cambios(img_name, sha):
+                print(f"Imagen sin cambios: {img_name}")
+            else:
+                _enlazar(ruta_blob, img_name)
+                print(f"Imagen descargada: {img_name}")
+            cliente.guardar_validadores(img_url, img_data)
+            image_paths.append(img_name)
+            entradas.append({"ruta": img_name, "sha256": sha, "bytes": tamano})
+            _escribir_manifest(carpeta, inventario_id, entradas)
+
+        except requests.RequestException as e:
+            print(f"Error en la descarga de la imagen principal: {e}")
+
+        return image_paths
+
+    # Recorrer las imágenes del mosaico
+    while img_index <= total_images:
+        img_url = f"{BASE_URL}Viewer?accion=42&AMuseo={config['museo']}&Ninv={inventario_id}&txt_id_imagen={img_index}&txt_zoom=10"
+        print(f"Descargando imagen: {img_url}")  # Depuración de la URL de imagen
+
+        try:
+            img_name = f"{carpeta}/{nombre}_{img_index}.jpg"
+            img_data, vigente = _pedir_imagen(cliente, img_url, img_name)
+
+            # Si la solicitud no fue exitosa, detener
+            if not vigente and img_data.status_code != 200:
+                print(f"Error al obtener la imagen {img_index}, terminando descarga.")
+                break
+
+            # El SHA-256 se calcula mientras la imagen se escribe en el almacén de blobs; un blob repetido no ocupa disco
+            if vigente:
+                img_hash, ruta_blob, tamano = _sha256_archivo(img_name), None, os.path.getsize(img_name)
+            else:
+                img_hash, ruta_blob, tamano = _guardar_blob(img_data)
+
+            # Si el hash ya fue visto antes, significa que hemos llegado al final
+            if img_hash in seen_hashes:
+                print(f"Fin del ciclo de imágenes detectado en {img_index - 1}, deteniendo la descarga.")
+                break  # Salimos del bucle sin enlazar la imagen duplicada
+
+            seen_hashes.add(img_hash)
+
+            # Enlazar la imagen solo si no es repetida y ha cambiado
+            if vigente:
+                print(f"Imagen sin cambios, no se descarga: {img_name}")
+            else:
+                if _sin_cambios(img_name, img_hash):
+                    print(f"Imagen sin cambios: {img_name}")
+                else:
+                    _enlazar(ruta_blob, img_name)
+                    print(f"Imagen descargada: {img_name}")
+                cliente.guardar_validadores(img_url, img_data)
+            image_paths.append(img_name)
+            entradas.append({"ruta": img_name, "sha256": img_hash, "bytes": tamano})
+
+            img_index += 1  # Incrementar el índice para la siguiente imagen
+
+        except requests.RequestException as e:
+            print(f"Error en la descarga de {img_url}: {e}")
+            break
+
+    _escribir_manifest(carpeta, inventario_id, entradas)
+    print(f"Finalizada la descarga de imágenes para {inventario_id}. Total descargadas: {len(image_paths)}.")
+    return image_paths
+
+
+def procesar_ficha(result, cliente, config):
+    """
+    Obtiene la ficha completa de un resultado del listado y descarga sus imágenes.
+    :param result: Elemento del listado con el botón de ficha completa
+    :param cliente: ClienteHTTP compartido
+    :param config: Configuración de la colección
+    :return: (inventario_id, objeto), o (inventario_id, None) si la ficha se descarta, o None si falla
+    """
+    ficha_button = result.find("input", class_=config["clase_boton"])  # Botón para acceder a la ficha completa de cada resultado
+    ficha_button_name = ficha_button['name']
+    id_value = config["extraer_id"](ficha_button_name)
+    sufijo = config["sufijo_ocultos"]
+
+    # Extraer los valores ocultos para hacer la solicitud POST
+    hidden_value = result.find("input", {"name": f"hiddenIdTabla{id_value}{sufijo}"})
+    hidden_tipo_value = result.find("input", {"name": f"hiddenTipoTabla{id_value}{sufijo}"})
+    if hidden_value and hidden_tipo_value:
+        hidden_value = hidden_value['value']
+        hidden_tipo_value = hidden_tipo_value['value']
+    else:
+        print(f"No se encontraron los campos ocultos para el ID {id_value}")
+
+    ficha_payload = {
+        ficha_button_name: "1",
+        f"hiddenIdTabla{id_value}{sufijo}": hidden_value if hidden_value else '',
+        f"hiddenTipoTabla{id_value}{sufijo}": hidden_tipo_value if hidden_tipo_value else ''
+    }
+
+    # POST para obtener la ficha completa del objeto
+    ficha_response = cliente.post(FICHA_URL, data=ficha_payload)
+
+    # Verificar si la respuesta del POST fue correcta
+    if ficha_response.status_code != 200:
+        print(f"Error al obtener la ficha para {id_value}")
+        return None
+
+    # Parsear la ficha completa
+    ficha_soup = BeautifulSoup(ficha_response.text, 'html.parser')
+
+    objeto = {}
+    table = ficha_soup.find('table', {'summary': 'Tabla de detalle'})  # Tabla con la información del objeto
+
+    inventario_id = None  # Inicializamos la variable
+
+    if table:
+        for row in table.find_all('tr'):
+            header = row.find('th')
+            value = row.find('td')
+            if header and value:
+                key = header.get_text(strip=True)
+                val = value.get_text(strip=True)
+                objeto[key] = val  # Diccionario para guardar Campo->Valor (p.e., "Autor":"Joaquín Sorolla")
+
+                # Si encuentra el campo "Inventario", se usa como clave
+                if key.lower() == "inventario":
+                    inventario_id = val
+
+    if not inventario_id:
+        print(f"Advertencia: No se encontró el número de inventario en la ficha {id_value}. Usando ID alternativo.")
+        inventario_id = id_value  # Si no se encuentra, usa el ID anterior
+
+    if config["normalizar_inventario"]:
+        inventario_id = config["normalizar_inventario"](inventario_id)
+
+    if config["filtrar_inventario"] and not config["filtrar_inventario"](inventario_id):
+        return inventario_id, None
+
+    # Descargar imágenes con el número de inventario correcto
+    imagenes_descargadas = descargar_imagenes(inventario_id, ficha_soup, cliente, config)
+    objeto["Imagenes"] = imagenes_descargadas  # Añade un campo Imagenes en la ficha con las rutas de las imagenes
+    return inventario_id, objeto
+
+
+def procesar_fichas(headers, base_url, output_file, config, max_workers=4, tasa=2.0, capacidad=4):
+    """
+    Función que procesa todas las fichas de una colección, descarga las imágenes y guarda toda la información.
+    Las fichas de cada página se procesan en paralelo; el checkpoint permite reanudar tras una interrupción.
+    Para un refresco completo del catálogo basta con borrar el checkpoint: las páginas e imágenes sin cambios
+    se validan con peticiones condicionales y no se vuelven a descargar.
+    :param headers: Encabezados HTTP para las solicitudes
+    :param base_url: URL del listado de la colección
+    :param output_file: Nombre del fichero de salida en ./fichas (sin extensión)
+    :param config: Configuración de la colección
+    :param max_workers: Número de fichas procesadas a la vez
+    :param tasa: Peticiones por segundo permitidas por host
+    :param capacidad: Ráfaga máxima de peticiones por host
+    """
+    cliente = ClienteHTTP(headers, LimitadorPorHost(tasa=tasa, capacidad=capacidad))
+    os.makedirs("./fichas", exist_ok=True)
+    ruta_salida = f"./fichas/{output_file}.json"
+    ruta_jsonl = f"./fichas/{output_file}.jsonl"
+    checkpoint = Checkpoint(f"./fichas/{output_file}.checkpoint.json")
+
+    _, texto = cliente.get_condicional(base_url)
+    soup = BeautifulSoup(texto, 'html.parser')
+    pagination_info = soup.find('span', class_='navRecursivaMB2, enLinea')  # Navegación de página
+
+    # Extraer el texto de la paginación
+    if pagination_info:
+        pages_text = pagination_info.get_text(strip=True)
+        # Buscar el número total de páginas (ej. "Página 1 de 60")
+        total_pages = int(pages_text.split("de")[-1].strip())  # Esto guarda el número después de "de"
+        print(f"Total de páginas a recorrer: {total_pages}")
+    else:
+        print("No se pudo encontrar la información de la paginación.")
+        return
+
+    # Las fichas de esta ejecución se añaden al JSON Lines; al compactar se unen a las del JSON final
+    escritor = EscritorFichas(ruta_jsonl)
+
+    def tarea(result, id_value):
+        resultado = procesar_ficha(result, cliente, config)
+        if resultado is None:
+            return  # Error de red: no se marca, se reintentará al reanudar
+        inventario_id, objeto = resultado
+        if objeto is not None:
+            # Añadir la ficha al JSON Lines con el inventario como clave
+            escritor.escribir(inventario_id, objeto)
+        checkpoint.marcar_ficha(id_value, inventario_id)
+
+    try:
+        _recorrer_paginas(cliente, base_url, total_pages, config, checkpoint, tarea, max_workers)
+    finally:
+        escritor.cerrar()
+        checkpoint.cerrar()
+        compactar(ruta_jsonl, ruta_salida)
+
+    print(f"Fichas guardadas en {ruta_salida}")
+
+
+def _recorrer_paginas(cliente, base_url, total_pages, config, checkpoint, tarea, max_workers):
+    """
+    Recorre las páginas del listado y procesa en paralelo las fichas pendientes de cada una.
+    """
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        # Bucle principal: recorrer las páginas del resultado
+        for page_num in range(1, total_pages + 1):
+            if checkpoint.pagina_completada(page_num):
+                continue
+            print(f"Recorriendo página {page_num}...")
+
+            # Actualizar el número de página en la URL
+            page_url = f"{base_url}&page={page_num}"
+
+            status_code, texto = cliente.get_condicional(page_url)
+            if status_code != 200:
+                print(f"Error al obtener la página {page_num}")
+                continue
+
+            soup = BeautifulSoup(texto, 'html.parser')
+            results = soup.find_all("div", class_=config["clase_resultado"])
+
+            if not results:
+                print(f"No se encontraron resultados en la página {page_num}.")
+                continue
+
+            print(f"Se encontraron {len(results)} resultados en la página {page_num}.")
+
+            # Procesar en paralelo las fichas pendientes de la página
+            futuros = []
+            for result in results:
+                ficha_button = result.find("input", class_=config["clase_boton"])
+                if not ficha_button:
+                    print("Botón de Ficha Completa no encontrado.")
+                    continue
+                id_value = config["extraer_id"](ficha_button['name'])
+                if checkpoint.ficha_completada(id_value):
+                    continue
+                futuros.append(executor.submit(tarea, result, id_value))
+
+            errores = 0
+            for futuro in futuros:
+                try:
+                    futuro.result()
+                except Exception as e:
+                    errores += 1
+                    print(f"Error al procesar una ficha de la página {page_num}: {e}")
+
+            # La página solo se da por terminada si todas sus fichas se procesaron
+            if errores == 0 and all(
+                checkpoint.ficha_completada(config["extraer_id"](b['name']))
+                for b in (r.find("input", class_=config["clase_boton"]) for r in results) if b
+            ):
+                checkpoint.marcar_pagina(page_num)
+
+
+if __name__ == "__main__":
+    import sys
+
+    if len(sys.argv) == 3 and sys.argv[1] == "compactar":
+        compactar(sys.argv[2], os.path.splitext(sys.argv[2])[0] + ".json")
+    else:
+        print("Uso: python motor_scrap.py compactar fichas/<coleccion>.jsonl")
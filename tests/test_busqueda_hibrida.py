@@ -0,0 +1,46 @@
+"""
+Pruebas de la búsqueda BM25 y la fusión por rango recíproco (utils.busqueda_hibrida).
+"""
+from utils.busqueda_hibrida import IndiceBM25, fusionar_rrf
+
+TEXTOS = [
+    "Sala de los nadadores en la playa",
+    "Retrato de Clotilde en el jardín de la casa",
+    "La playa de Valencia con barcas: playa y pescadores",
+]
+
+
+def test_bm25_ordena_por_puntuacion():
+    indice = IndiceBM25(TEXTOS)
+    # El tercer texto repite "playa"; el segundo no contiene el término y no se devuelve
+    assert indice.buscar("playa") == [2, 0]
+
+
+def test_bm25_ignora_tildes_mayusculas_y_palabras_vacias():
+    indice = IndiceBM25(TEXTOS)
+    assert indice.buscar("¿Dónde está el JARDIN?") == [1]
+    assert indice.buscar("de la en") == []
+
+
+def test_bm25_termino_raro_pesa_mas_que_uno_frecuente():
+    indice = IndiceBM25(TEXTOS)
+    # "valencia" solo aparece en un texto y "playa" en dos
+    assert indice.buscar("playa nadadores", n=3)[0] == 0
+    assert indice.buscar("playa valencia", n=3)[0] == 2
+
+
+def test_bm25_limita_el_numero_de_candidatos():
+    indice = IndiceBM25(TEXTOS)
+    completa = indice.buscar("playa jardin", n=3)
+    assert len(completa) == 3
+    assert indice.buscar("playa jardin", n=1) == completa[:1]
+
+
+def test_rrf_suma_los_rangos_de_todas_las_listas():
+    # 1: 1/61 + 1/62, 3: 1/63 + 1/61, 2: 1/62
+    assert fusionar_rrf([[1, 2, 3], [3, 1]]) == [1, 3, 2]
+
+
+def test_rrf_prima_los_documentos_presentes_en_varias_listas():
+    assert fusionar_rrf([[7, 8], [8, 9]]) == [8, 7, 9]
+    assert fusionar_rrf([[5], []]) == [5]
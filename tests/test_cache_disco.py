@@ -0,0 +1,68 @@
+"""
+Pruebas de la caché de archivos en disco (utils.cache_disco.CacheDisco).
+"""
+import os
+import time
+import threading
+from utils.cache_disco import CacheDisco
+
+
+def _escribir(contenido):
+    def generar(temporal):
+        with open(temporal, "wb") as f:
+            f.write(contenido)
+    return generar
+
+
+def test_expulsa_la_menos_usada_al_superar_el_presupuesto(tmp_path):
+    cache = CacheDisco(str(tmp_path), max_bytes=25)
+    ruta_a = cache.obtener("a.jpg", _escribir(b"a" * 10))
+    time.sleep(0.01)
+    ruta_b = cache.obtener("b.jpg", _escribir(b"b" * 10))
+    time.sleep(0.01)
+    assert cache.obtener("a.jpg", _escribir(b"x")) == ruta_a  # Acierto: "a" pasa a ser la más reciente
+    time.sleep(0.01)
+
+    ruta_c = cache.obtener("c.jpg", _escribir(b"c" * 10))
+
+    assert not os.path.exists(ruta_b)
+    assert os.path.exists(ruta_a) and os.path.exists(ruta_c)
+    estadisticas = cache.estadisticas()
+    assert estadisticas["expulsiones"] == 1
+    assert estadisticas["bytes"] == 20
+    assert estadisticas["aciertos"] == 1
+
+
+def test_no_expulsa_la_entrada_recien_generada(tmp_path):
+    cache = CacheDisco(str(tmp_path), max_bytes=5)
+    ruta = cache.obtener("grande.jpg", _escribir(b"g" * 10))
+    assert os.path.exists(ruta)
+
+
+def test_comparte_la_descarga_en_curso(tmp_path):
+    cache = CacheDisco(str(tmp_path), max_bytes=1000)
+    iniciada, liberar = threading.Event(), threading.Event()
+    llamadas = []
+
+    def generar_lento(temporal):
+        llamadas.append(temporal)
+        iniciada.set()
+        liberar.wait(5)
+        _escribir(b"imagen")(temporal)
+
+    rutas = []
+    primera = threading.Thread(target=lambda: rutas.append(cache.obtener("x.jpg", generar_lento)))
+    primera.start()
+    assert iniciada.wait(5)
+    segunda = threading.Thread(target=lambda: rutas.append(cache.obtener("x.jpg", generar_lento)))
+    segunda.start()
+    while cache.estadisticas()["esperas_compartidas"] == 0:
+        time.sleep(0.01)
+    liberar.set()
+    primera.join(5)
+    segunda.join(5)
+
+    assert len(llamadas) == 1
+    assert len(rutas) == 2 and rutas[0] == rutas[1]
+    with open(rutas[0], "rb") as f:
+        assert f.read() == b"imagen"
@@ -0,0 +1,82 @@
+"""
+Pruebas de la persistencia del scraper (scraping_ceres/motor_scrap.py): checkpoint, JSON Lines de fichas y
+compactación, incluida la reanudación tras una escritura interrumpida.
+"""
+import os
+import sys
+import json
+import pytest
+
+pytest.importorskip("requests")
+pytest.importorskip("bs4")
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "scraping_ceres"))
+from motor_scrap import Checkpoint, EscritorFichas, leer_fichas_jsonl, compactar  # noqa: E402
+
+
+def test_checkpoint_reanuda_desde_el_log_con_la_ultima_linea_a_medias(tmp_path):
+    ruta = str(tmp_path / "coleccion.checkpoint.json")
+    checkpoint = Checkpoint(ruta)
+    checkpoint.marcar_pagina(1)
+    checkpoint.marcar_ficha("id1", "00445")
+    checkpoint.marcar_ficha("id2", "00446")
+    # Interrupción sin cerrar el checkpoint, a mitad de una línea
+    with open(ruta + ".log", "a", encoding="utf-8") as f:
+        f.write('{"ficha": "id3", "inven')
+
+    reanudado = Checkpoint(ruta)
+    assert reanudado.pagina_completada(1)
+    assert reanudado.ficha_completada("id1") and reanudado.ficha_completada("id2")
+    assert not reanudado.ficha_completada("id3")
+    reanudado.cerrar()
+    checkpoint.log.close()
+
+
+def test_checkpoint_compacta_el_log_periodicamente(tmp_path):
+    ruta = str(tmp_path / "coleccion.checkpoint.json")
+    checkpoint = Checkpoint(ruta, compactar_cada=2)
+    for i in range(3):
+        checkpoint.marcar_ficha(f"id{i}", f"0{i}")
+
+    with open(ruta, "r", encoding="utf-8") as f:
+        assert json.load(f)["fichas"] == {"id0": "00", "id1": "01"}
+    with open(ruta + ".log", "r", encoding="utf-8") as f:
+        assert len(f.readlines()) == 1
+
+    checkpoint.cerrar()
+    with open(ruta, "r", encoding="utf-8") as f:
+        assert len(json.load(f)["fichas"]) == 3
+    assert os.path.getsize(ruta + ".log") == 0
+
+
+def test_jsonl_se_queda_la_ultima_version_e_ignora_la_linea_a_medias(tmp_path):
+    ruta = str(tmp_path / "coleccion.jsonl")
+    escritor = EscritorFichas(ruta)
+    escritor.escribir("00445", {"Título": "Nadadores"})
+    escritor.escribir("00446", {"Título": "Clotilde"})
+    escritor.escribir("00445", {"Título": "Nadadores, Jávea"})
+    escritor.cerrar()
+    with open(ruta, "a", encoding="utf-8") as f:
+        f.write('{"inventario": "00447", "fic')
+
+    assert leer_fichas_jsonl(ruta) == {
+        "00445": {"Título": "Nadadores, Jávea"},
+        "00446": {"Título": "Clotilde"},
+    }
+
+
+def test_compactar_une_con_el_json_anterior_y_vacia_el_jsonl(tmp_path):
+    ruta_jsonl, ruta_json = str(tmp_path / "coleccion.jsonl"), str(tmp_path / "coleccion.json")
+    escritor = EscritorFichas(ruta_jsonl)
+    escritor.escribir("00445", {"Título": "Nadadores"})
+    escritor.cerrar()
+    assert compactar(ruta_jsonl, ruta_json) == 1
+    assert os.path.getsize(ruta_jsonl) == 0
+
+    # Segunda ejecución: solo escribe las fichas nuevas o modificadas
+    escritor = EscritorFichas(ruta_jsonl)
+    escritor.escribir("00446", {"Título": "Clotilde"})
+    escritor.cerrar()
+    assert compactar(ruta_jsonl, ruta_json) == 2
+    assert compactar(ruta_jsonl, ruta_json) == 2  # Repetir la compactación no cambia nada
+    with open(ruta_json, "r", encoding="utf-8") as f:
+        assert json.load(f) == {"00445": {"Título": "Nadadores"}, "00446": {"Título": "Clotilde"}}
@@ -0,0 +1,114 @@
+"""
+Pruebas de la barrera del SQL generado (utils.sql_utils.validar_sql y canonizar_sql) y del formato de los
+resultados para el prompt (formatear_resultados).
+"""
+import pytest
+from utils.sql_utils import validar_sql, canonizar_sql, reescribir_predicados, formatear_resultados
+
+
+@pytest.mark.parametrize("sql", [
+    # Funciones que ejecutan el SQL que reciben como texto
+    "select ts_stat('select to_tsvector(usename) from pg_user') from fichas_raw limit 1",
+    "select database_to_xml(true,true,'') from fichas_raw limit 1",
+    "select query_to_xml_and_xmlschema('select * from pg_shadow', true, true, '') from fichas_raw limit 1",
+    "select pg_catalog.ts_stat('select 1') from fichas_raw",
+    "select dblink('host=x', 'select 1') from fichas_raw",
+    "select current_setting('data_directory') from fichas_raw",
+    # Texto con SQL como argumento de una función permitida
+    "select ts_headline('spanish', 'select * from pg_user') from fichas_raw",
+    # Tablas, instrucciones y bloqueos
+    "select usename from pg_user",
+    "select titulo from fichas_raw where inventario in (select usename from pg_user)",
+    "select titulo from fichas_raw for update",
+    "select titulo from fichas_raw for share",
+    "delete from fichas_raw",
+    "select titulo from fichas_raw; drop table fichas_raw",
+])
+def test_rechaza_consultas_peligrosas(sql):
+    with pytest.raises(ValueError):
+        validar_sql(sql)
+    with pytest.raises(ValueError):
+        canonizar_sql(sql)
+
+
+@pytest.mark.parametrize("sql, esperado", [
+    ("SELECT EXTRACT(YEAR FROM now())", "select extract(year from now()) limit 100"),
+    (
+        "select titulo from fichas_raw where EXTRACT(YEAR FROM fecha_ano) = 1",
+        "select titulo from fichas_raw where extract(year from fecha_ano) = 1 limit 100",
+    ),
+    (
+        "select substring(titulo from 1 for 4) from fichas_raw limit 5",
+        "select substring(titulo from 1 for 4) from fichas_raw limit 5",
+    ),
+    (
+        "select count(*) total from fichas_raw f where f.coleccion ilike '%pintura%'",
+        "select count(*) total from fichas_raw f where f.coleccion ilike '%pintura%' limit 100",
+    ),
+    (
+        "select titulo from fichas_raw where busqueda @@ plainto_tsquery('spanish_unaccent', 'playa valencia')",
+        "select titulo from fichas_raw where busqueda @@ plainto_tsquery('spanish_unaccent', 'playa valencia') limit 100",
+    ),
+    (
+        "select titulo from fichas_raw where descripcion ilike '%select%'",
+        "select titulo from fichas_raw where descripcion ilike '%select%' limit 100",
+    ),
+])
+def test_admite_consultas_de_lectura(sql, esperado):
+    assert validar_sql(sql) == esperado
+
+
+def test_acota_limite():
+    assert validar_sql("select titulo from fichas_raw limit 10000").endswith("limit 500")
+    assert validar_sql("select titulo from fichas_raw limit (5)").endswith("limit 5")
+
+
+@pytest.mark.parametrize("sql, esperado", [
+    ("select * from fichas_raw where coleccion = 'Pintura'", "select * from fichas_raw where coleccion = 'pintura'"),
+    ("select * from fichas_raw where coleccion='Pintura'", "select * from fichas_raw where coleccion = 'pintura'"),
+    ("select * from fichas_raw where titulo ILIKE'%Jávea%'", "select * from fichas_raw where titulo ILIKE '%javea%'"),
+    ("select * from fichas_raw where titulo LIKE'%Jávea%'", "select * from fichas_raw where titulo ILIKE '%javea%'"),
+])
+def test_reescribe_predicados_sin_espacios(sql, esperado):
+    assert reescribir_predicados(sql) == esperado
+
+
+def test_misma_clave_de_cache_con_y_sin_espacios():
+    con_espacios = "select titulo from fichas_raw where coleccion = 'Pintura'"
+    sin_espacios = "select titulo from fichas_raw where coleccion='Pintura'"
+    assert canonizar_sql(reescribir_predicados(con_espacios)) == canonizar_sql(reescribir_predicados(sin_espacios))
+
+
+COLUMNAS_FICHA = ["inventario", "titulo", "tecnica", "dimensiones", "imagenes", "coleccion", "autor_a", "datacion",
+                  "descripcion"]
+FILA_FICHA = ("00445", "Nadadores", "oleo", "100 x 80", "['imagenes/00445/00445_1.jpg']", "pintura",
+              "sorolla", "1905", "Niños en la playa")
+
+
+def test_select_asterisco_conserva_columnas_clave_y_referenciadas():
+    sql = "select * from fichas_raw where tecnica ilike '%oleo%'"
+    cabecera = formatear_resultados(COLUMNAS_FICHA, [FILA_FICHA], sql=sql).splitlines()[0]
+    assert cabecera == "inventario,titulo,tecnica,coleccion,autor_a,datacion,descripcion"
+
+
+def test_sin_select_asterisco_solo_quita_imagenes_y_columnas_vacias():
+    sql = "select count(*), " + ", ".join(COLUMNAS_FICHA) + " from fichas_raw"
+    fila = FILA_FICHA[:3] + (None,) + FILA_FICHA[4:]
+    cabecera = formatear_resultados(COLUMNAS_FICHA, [fila], sql=sql).splitlines()[0]
+    assert cabecera == "inventario,titulo,tecnica,coleccion,autor_a,datacion,descripcion"
+
+
+def test_resume_las_filas_que_no_caben_en_el_presupuesto():
+    filas = [(f"{i:05d}", "Un título bastante largo para ocupar presupuesto") for i in range(50)]
+    lineas = formatear_resultados(["inventario", "titulo"], filas, presupuesto_tokens=100).splitlines()
+    mostradas = len(lineas) - 2  # Sin la cabecera ni la línea de resumen
+    assert 0 < mostradas < 50
+    assert lineas[-1] == f"... y {50 - mostradas} filas más"
+    assert sum(len(l) + 1 for l in lineas[:-1]) <= 100 * 4
+
+
+def test_recorta_y_escapa_las_celdas():
+    csv = formatear_resultados(["titulo"], [('Playa, "Valencia"\n' + "x" * 50,)], max_caracteres_celda=20)
+    celda = csv.splitlines()[1]
+    assert celda.startswith('"Playa, ""Valencia"" x') and celda.endswith('…"')
+    assert formatear_resultados(["titulo"], []) == "(sin resultados)"
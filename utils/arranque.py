@@ -0,0 +1,178 @@
+"""
+Arranque de SoroIA: perfil de importaciones, precalentado y servidor con los recursos ya cargados.
+
+- `perfil`: ejecuta las importaciones de app.py en un intérprete limpio con `python -X importtime` y muestra el
+  tiempo de cada importación de la app y de los paquetes que más tardan en cargarse.
+- `precalentar`: crea los recursos compartidos (descarga el modelo de embeddings, construye el índice FAISS si
+  no existe, abre el pool de PostgreSQL...) y termina con código 1 si alguno falla. Sirve como contenedor de
+  inicialización o comprobación antes de enviar tráfico.
+- `servir`: precalienta los recursos en segundo plano y arranca Streamlit en el mismo proceso, de modo que la
+  primera sesión ya los encuentra cargados. La sonda /ready del servidor de métricas (PUERTO_METRICAS) responde
+  503 hasta que termina el precalentado.
+
+La configuración (version_app, uso_pinecone, precarga_fichas) se lee de las constantes de app.py.
+
+Uso:
+    python -m utils.arranque perfil
+    python -m utils.arranque precalentar
+    python -m utils.arranque servir -- --server.port 8501
+"""
+import os
+import re
+import ast
+import sys
+import argparse
+import subprocess
+
+APP = os.path.join(os.path.dirname(__file__), "..", "app.py")
+CONFIGURACION_APP = {"version_app": "local", "uso_pinecone": False, "precarga_fichas": False, "metricas_prometheus": True}
+_LINEA_IMPORTTIME = re.compile(r"import time:\s+(\d+)\s+\|\s+(\d+)\s+\|(\s*)(\S+)")
+
+
+def configuracion_app(ruta=APP):
+    """
+    Lee de app.py las constantes de configuración que afectan a los recursos compartidos.
+
+    Returns:
+        dict: Valores de CONFIGURACION_APP, con los de app.py cuando son literales.
+    """
+    with open(ruta, "r", encoding="utf-8") as f:
+        arbol = ast.parse(f.read())
+    configuracion = dict(CONFIGURACION_APP)
+    for nodo in arbol.body:
+        if isinstance(nodo, ast.Assign) and len(nodo.targets) == 1 and isinstance(nodo.targets[0], ast.Name):
+            nombre = nodo.targets[0].id
+            if nombre in configuracion:
+                try:
+                    configuracion[nombre] = ast.literal_eval(nodo.value)
+                except ValueError:
+                    pass
+    return configuracion
+
+
+def modulos_app(ruta=APP):
+    """
+    Devuelve los módulos que importa app.py en su nivel superior, en orden.
+    """
+    with open(ruta, "r", encoding="utf-8") as f:
+        arbol = ast.parse(f.read())
+    modulos = []
+    for nodo in arbol.body:
+        if isinstance(nodo, ast.Import):
+            modulos += [alias.name for alias in nodo.names]
+        elif isinstance(nodo, ast.ImportFrom) and nodo.module:
+            modulos.append(nodo.module)
+    return list(dict.fromkeys(modulos))
+
+
+def perfil_importaciones(modulos=None, raiz=os.path.join(os.path.dirname(__file__), "..")):
+    """
+    Importa los módulos en un intérprete nuevo con `-X importtime` y resume los tiempos.
+
+    Args:
+        modulos (list, optional): Módulos a importar. Por defecto, los que importa app.py.
+        raiz (str, optional): Directorio desde el que se importan (raíz del proyecto).
+
+    Returns:
+        dict: {"total": µs, "modulos": {módulo: µs acumulados}, "paquetes": {paquete: µs propios}}
+    """
+    modulos = modulos or modulos_app()
+    codigo = "; ".join(f"import {m}" for m in modulos)
+    proceso = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", codigo], cwd=raiz, capture_output=True, text=True
+    )
+    if proceso.returncode != 0:
+        raise RuntimeError(f"Error al importar los módulos de la app:\n{proceso.stderr[-2000:]}")
+
+    acumulados, paquetes = {}, {}
+    for linea in proceso.stderr.splitlines():
+        encontrado = _LINEA_IMPORTTIME.match(linea)
+        if not encontrado:
+            continue
+        propio, acumulado, _, nombre = encontrado.groups()
+        paquete = nombre.split(".")[0]
+        paquetes[paquete] = paquetes.get(paquete, 0) + int(propio)
+        acumulados[nombre] = int(acumulado)
+    return {
+        "total": sum(paquetes.values()),
+        "modulos": {m: acumulados.get(m, 0) for m in modulos},
+        "paquetes": dict(sorted(paquetes.items(), key=lambda p: p[1], reverse=True)),
+    }
+
+
+def mostrar_perfil(perfil, top=15):
+    print(f"Tiempo total de importación: {perfil['total'] / 1e6:.2f} s\n")
+    print(f"{'módulo':<32} {'s':>7}")
+    for modulo, tiempo in perfil["modulos"].items():
+        print(f"{modulo:<32} {tiempo / 1e6:7.3f}")
+    print(f"\n{'paquete':<32} {'s':>7}")
+    for paquete, tiempo in list(perfil["paquetes"].items())[:top]:
+        print(f"{paquete:<32} {tiempo / 1e6:7.3f}")
+
+
+def _registrar():
+    from dotenv import load_dotenv
+    from utils.recursos import registrar_recursos_app
+
+    load_dotenv(os.path.join(os.path.dirname(APP), ".env"))
+    configuracion = configuracion_app()
+    registrar_recursos_app(
+        configuracion["version_app"],
+        uso_pinecone=configuracion["uso_pinecone"],
+        precarga_fichas=configuracion["precarga_fichas"],
+    )
+    return configuracion
+
+
+def precalentar_recursos():
+    """
+    Crea todos los recursos de la app en este proceso y muestra su informe.
+
+    Returns:
+        bool: True si todos se han creado sin errores.
+    """
+    from utils.recursos import precalentar, informe_memoria
+
+    _registrar()
+    tiempos = precalentar()
+    print(informe_memoria())
+    return all(t is not None for t in tiempos.values())
+
+
+def servir(argumentos_streamlit=()):
+    """
+    Precalienta los recursos en segundo plano y arranca Streamlit con app.py en este mismo proceso.
+
+    Args:
+        argumentos_streamlit (iterable, optional): Argumentos adicionales para `streamlit run`.
+    """
+    from utils.recursos import precalentar
+    from utils.trazas_utils import iniciar_servidor_metricas
+
+    configuracion = _registrar()
+    precalentar(en_segundo_plano=True)
+    if configuracion["metricas_prometheus"]:
+        iniciar_servidor_metricas()
+
+    from streamlit.web import cli as stcli
+    sys.argv = ["streamlit", "run", os.path.abspath(APP), *argumentos_streamlit]
+    sys.exit(stcli.main())
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Perfil de arranque, precalentado y servidor de SoroIA.")
+    subparsers = parser.add_subparsers(dest="accion", required=True)
+    parser_perfil = subparsers.add_parser("perfil", help="Tiempo de importación de los módulos de app.py")
+    parser_perfil.add_argument("--modulos", nargs="+", help="Módulos a perfilar en lugar de los de app.py")
+    parser_perfil.add_argument("--top", type=int, default=15, help="Número de paquetes a mostrar")
+    subparsers.add_parser("precalentar", help="Crear los recursos compartidos y comprobar que no fallan")
+    parser_servir = subparsers.add_parser("servir", help="Precalentar y arrancar Streamlit en el mismo proceso")
+    parser_servir.add_argument("streamlit", nargs=argparse.REMAINDER, help="Argumentos para streamlit run")
+    args = parser.parse_args()
+
+    if args.accion == "perfil":
+        mostrar_perfil(perfil_importaciones(args.modulos), top=args.top)
+    elif args.accion == "precalentar":
+        sys.exit(0 if precalentar_recursos() else 1)
+    else:
+        servir([a for a in args.streamlit if a != "--"])
@@ -0,0 +1,170 @@
+"""
+Recuperación híbrida para el RAG: BM25 sobre los chunks del índice FAISS + búsqueda densa, con fusión por rango
+recíproco (RRF) y reordenación opcional con un cross-encoder local.
+
+La búsqueda densa falla con frecuencia en preguntas por nombres exactos (salas, fechas, títulos de cuadros);
+BM25 sobre los mismos chunks las recupera. Cada búsqueda devuelve sus mejores N_CANDIDATOS, las listas se
+fusionan con RRF y, si el reranker está activo y queda presupuesto de latencia, un cross-encoder puntúa como
+mucho MAX_CANDIDATOS_RERANK candidatos. Al LLM solo se le envían los K_DOCUMENTOS mejores.
+
+Configuración por variables de entorno: RAG_K, RAG_RERANKER (1 para activarlo) y RAG_PRESUPUESTO_MS.
+"""
+import os
+import math
+import time
+import threading
+import numpy as np
+from utils.embeddings_utils import embed_query
+from utils.texto_utils import tokenizar
+from utils.trazas_utils import anotar
+
+K_DOCUMENTOS = int(os.getenv("RAG_K", "4"))  # Chunks que se envían al LLM
+N_CANDIDATOS = 20  # Candidatos de cada búsqueda (BM25 y densa) antes de fusionar
+K_RRF = 60  # Constante de la fusión por rango recíproco
+BM25_K1 = 1.5
+BM25_B = 0.75
+RERANKER_ACTIVO = os.getenv("RAG_RERANKER", "0") == "1"
+MODELO_RERANKER = "cross-encoder/mmarco-mMiniLMv2-L12-H384-v1"  # Multilingüe, admite español
+MAX_CANDIDATOS_RERANK = 12  # Candidatos fusionados que puntúa el cross-encoder como máximo
+LOTE_RERANK = 4  # Pares consulta-chunk por llamada al cross-encoder
+PRESUPUESTO_MS = float(os.getenv("RAG_PRESUPUESTO_MS", "300"))  # Latencia máxima de la recuperación
+
+_reranker = None
+_lock_reranker = threading.Lock()
+
+
+class IndiceBM25:
+    """
+    Índice BM25 en memoria con listas invertidas en arrays de numpy.
+
+    Args:
+        textos (list): Textos de los documentos, en el orden de sus posiciones.
+        k1 (float, optional): Saturación de la frecuencia del término. Por defecto BM25_K1.
+        b (float, optional): Normalización por longitud del documento. Por defecto BM25_B.
+    """
+
+    def __init__(self, textos, k1=BM25_K1, b=BM25_B):
+        self.num_documentos = len(textos)
+        postings = {}  # término -> {documento: frecuencia}
+        longitudes = np.zeros(self.num_documentos, dtype=np.float32)
+        for i, texto in enumerate(textos):
+            terminos = tokenizar(texto)
+            longitudes[i] = len(terminos)
+            for termino in terminos:
+                frecuencias = postings.setdefault(termino, {})
+                frecuencias[i] = frecuencias.get(i, 0) + 1
+
+        media = float(longitudes.mean()) if self.num_documentos else 1.0
+        normalizacion = k1 * (1 - b + b * longitudes / max(media, 1e-9))
+        self._terminos = {}  # término -> (documentos, pesos precalculados idf * tf saturada)
+        for termino, frecuencias in postings.items():
+            documentos = np.fromiter(frecuencias.keys(), dtype=np.int32, count=len(frecuencias))
+            tf = np.fromiter(frecuencias.values(), dtype=np.float32, count=len(frecuencias))
+            idf = math.log(1 + (self.num_documentos - len(documentos) + 0.5) / (len(documentos) + 0.5))
+            self._terminos[termino] = (documentos, idf * tf * (k1 + 1) / (tf + normalizacion[documentos]))
+
+    def buscar(self, consulta, n=N_CANDIDATOS):
+        """
+        Devuelve las posiciones de los n documentos con mayor puntuación BM25 para la consulta.
+
+        Returns:
+            list: Posiciones de los documentos, de mayor a menor puntuación (solo las que tienen algún término).
+        """
+        puntuaciones = np.zeros(self.num_documentos, dtype=np.float32)
+        for termino in set(tokenizar(consulta)):
+            if termino in self._terminos:
+                documentos, pesos = self._terminos[termino]
+                puntuaciones[documentos] += pesos
+        candidatos = np.flatnonzero(puntuaciones)
+        if len(candidatos) > n:
+            candidatos = candidatos[np.argpartition(-puntuaciones[candidatos], n - 1)[:n]]
+        return candidatos[np.argsort(-puntuaciones[candidatos], kind="stable")].tolist()
+
+
+def fusionar_rrf(rankings, k=K_RRF):
+    """
+    Fusiona varias listas ordenadas de posiciones con reciprocal rank fusion: sum(1 / (k + rango)).
+
+    Returns:
+        list: Posiciones ordenadas por puntuación fusionada.
+    """
+    puntuaciones = {}
+    for ranking in rankings:
+        for rango, posicion in enumerate(ranking, start=1):
+            puntuaciones[posicion] = puntuaciones.get(posicion, 0.0) + 1.0 / (k + rango)
+    return sorted(puntuaciones, key=puntuaciones.get, reverse=True)
+
+
+def obtener_reranker():
+    """
+    Devuelve el cross-encoder local del proceso, cargándolo la primera vez.
+    """
+    global _reranker
+    if _reranker is None:
+        with _lock_reranker:
+            if _reranker is None:
+                from sentence_transformers import CrossEncoder
+                _reranker = CrossEncoder(MODELO_RERANKER, max_length=512)
+    return _reranker
+
+
+class RecuperadorHibrido:
+    """
+    Retriever híbrido BM25 + FAISS con la misma interfaz `invoke` que los retrievers de LangChain.
+
+    Args:
+        vectordb (FAISS): Vectorstore FAISS cargado (índice y docstore).
+        k (int, optional): Documentos que se devuelven. Por defecto K_DOCUMENTOS.
+        reranker (bool, optional): Reordenar con el cross-encoder. Por defecto RERANKER_ACTIVO.
+        presupuesto_ms (float, optional): Tiempo a partir del cual no se sigue reordenando. Por defecto PRESUPUESTO_MS.
+    """
+
+    def __init__(self, vectordb, k=K_DOCUMENTOS, reranker=RERANKER_ACTIVO, presupuesto_ms=PRESUPUESTO_MS):
+        self.vectordb = vectordb
+        self.k = k
+        self.reranker = reranker
+        self.presupuesto_ms = presupuesto_ms
+        self.documentos = [
+            vectordb.docstore.search(vectordb.index_to_docstore_id[i]) for i in range(vectordb.index.ntotal)
+        ]
+        self.bm25 = IndiceBM25([doc.page_content for doc in self.documentos])
+
+    def _buscar_densa(self, consulta, n):
+        vector = np.asarray([embed_query(consulta)], dtype=np.float32)
+        _, posiciones = self.vectordb.index.search(vector, min(n, len(self.documentos)))
+        return [int(p) for p in posiciones[0] if p >= 0]
+
+    def _reordenar(self, consulta, candidatos, inicio):
+        """
+        Puntúa los candidatos con el cross-encoder por lotes mientras quede presupuesto. Los que no se llegan
+        a puntuar conservan su orden de la fusión, detrás de los puntuados.
+        """
+        modelo = obtener_reranker()
+        puntuados = []
+        for i in range(0, len(candidatos), LOTE_RERANK):
+            if (time.perf_counter() - inicio) * 1000 > self.presupuesto_ms:
+                break
+            lote = candidatos[i:i + LOTE_RERANK]
+            puntuaciones = modelo.predict([(consulta, self.documentos[p].page_content) for p in lote])
+            puntuados += zip(lote, puntuaciones)
+        puntuados.sort(key=lambda par: par[1], reverse=True)
+        orden = [p for p, _ in puntuados]
+        anotar(reordenados=len(orden))
+        return orden + candidatos[len(orden):]
+
+    def invoke(self, consulta, k=None):
+        """
+        Recupera los k chunks más relevantes para la consulta.
+
+        Returns:
+            list: Documentos de LangChain, del más al menos relevante.
+        """
+        k = k or self.k
+        inicio = time.perf_counter()
+        fusionados = fusionar_rrf([self.bm25.buscar(consulta, N_CANDIDATOS), self._buscar_densa(consulta, N_CANDIDATOS)])
+        anotar(candidatos=len(fusionados))
+        if self.reranker and (time.perf_counter() - inicio) * 1000 < self.presupuesto_ms:
+            fusionados = (
+                self._reordenar(consulta, fusionados[:MAX_CANDIDATOS_RERANK], inicio) + fusionados[MAX_CANDIDATOS_RERANK:]
+            )
+        return [self.documentos[p] for p in fusionados[:k]]
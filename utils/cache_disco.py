@@ -0,0 +1,167 @@
+"""
+Caché de archivos en disco con presupuesto de bytes, para las imágenes descargadas de S3 y sus miniaturas.
+
+- Expulsión LRU (usado hace más tiempo) o LFU (usado menos veces) al superar el presupuesto.
+- Escrituras atómicas: se descarga a un archivo temporal y se renombra, nunca se sirve un archivo a medias.
+- Descargas simultáneas de la misma clave deduplicadas: solo una sesión descarga y el resto espera el resultado.
+- Estadísticas de aciertos, fallos, bytes y expulsiones.
+"""
+import os
+import time
+import threading
+from concurrent.futures import Future
+
+
+class CacheDisco:
+    """
+    Caché de archivos en un directorio local.
+
+    Args:
+        directorio (str): Directorio raíz de la caché.
+        max_bytes (int): Presupuesto de bytes en disco.
+        politica (str, optional): 'lru' o 'lfu'. Por defecto 'lru'.
+    """
+
+    def __init__(self, directorio, max_bytes, politica="lru"):
+        if politica not in ("lru", "lfu"):
+            raise ValueError("Política de caché no soportada")
+        self.directorio = directorio
+        self.max_bytes = max_bytes
+        self.politica = politica
+        self._lock = threading.Lock()
+        self._entradas = {}  # clave -> {"bytes", "ultimo_uso", "usos"}
+        self._en_curso = {}  # clave -> Future de la descarga en marcha
+        self._bytes = 0
+        self.stats = {"aciertos": 0, "fallos": 0, "esperas_compartidas": 0, "expulsiones": 0, "errores": 0}
+        os.makedirs(directorio, exist_ok=True)
+        self._indexar()
+
+    def _indexar(self):
+        """
+        Registra los archivos que ya había en disco (por ejemplo, tras reiniciar el contenedor).
+        """
+        for raiz, _, nombres in os.walk(self.directorio):
+            for nombre in nombres:
+                ruta = os.path.join(raiz, nombre)
+                if nombre.endswith(".tmp"):
+                    os.remove(ruta)  # Restos de una escritura interrumpida
+                    continue
+                stat = os.stat(ruta)
+                clave = os.path.relpath(ruta, self.directorio).replace(os.sep, "/")
+                self._entradas[clave] = {"bytes": stat.st_size, "ultimo_uso": stat.st_mtime, "usos": 1}
+                self._bytes += stat.st_size
+
+    def ruta(self, clave):
+        """
+        Ruta en disco correspondiente a una clave.
+        """
+        return os.path.join(self.directorio, clave)
+
+    def obtener(self, clave, generar):
+        """
+        Devuelve la ruta local de la clave, generándola con `generar` si no está en la caché.
+
+        Args:
+            clave (str): Clave relativa (p.e., la clave del objeto en S3).
+            generar (callable): Función que recibe una ruta temporal y escribe en ella el contenido.
+
+        Returns:
+            str: Ruta local del archivo.
+
+        Raises:
+            Exception: El error de `generar` si la descarga falla.
+        """
+        with self._lock:
+            entrada = self._entradas.get(clave)
+            if entrada is not None and os.path.exists(self.ruta(clave)):
+                entrada["ultimo_uso"] = time.time()
+                entrada["usos"] += 1
+                self.stats["aciertos"] += 1
+                return self.ruta(clave)
+
+            futuro = self._en_curso.get(clave)
+            if futuro is not None:
+                # Otra sesión ya está descargando esta clave: se espera a su resultado
+                self.stats["esperas_compartidas"] += 1
+                propietario = False
+            else:
+                futuro = Future()
+                self._en_curso[clave] = futuro
+                self.stats["fallos"] += 1
+                propietario = True
+
+        if not propietario:
+            return futuro.result()
+
+        try:
+            ruta = self._generar(clave, generar)
+            futuro.set_result(ruta)
+            return ruta
+        except Exception as e:
+            with self._lock:
+                self.stats["errores"] += 1
+            futuro.set_exception(e)
+            raise
+        finally:
+            with self._lock:
+                self._en_curso.pop(clave, None)
+
+    def _generar(self, clave, generar):
+        destino = self.ruta(clave)
+        os.makedirs(os.path.dirname(destino), exist_ok=True)
+        temporal = f"{destino}.{threading.get_ident()}.tmp"
+        try:
+            generar(temporal)
+            os.replace(temporal, destino)  # Renombrado atómico
+        finally:
+            if os.path.exists(temporal):
+                os.remove(temporal)
+
+        tamano = os.path.getsize(destino)
+        with self._lock:
+            anterior = self._entradas.get(clave)
+            if anterior:
+                self._bytes -= anterior["bytes"]
+            self._entradas[clave] = {"bytes": tamano, "ultimo_uso": time.time(), "usos": 1}
+            self._bytes += tamano
+            self._expulsar(proteger=clave)
+        return destino
+
+    def _expulsar(self, proteger=None):
+        """
+        Elimina entradas según la política hasta volver al presupuesto de bytes. Se llama con el lock tomado.
+        """
+        if self._bytes <= self.max_bytes:
+            return
+        if self.politica == "lru":
+            orden = sorted(self._entradas, key=lambda c: self._entradas[c]["ultimo_uso"])
+        else:
+            orden = sorted(self._entradas, key=lambda c: (self._entradas[c]["usos"], self._entradas[c]["ultimo_uso"]))
+        for clave in orden:
+            if self._bytes <= self.max_bytes:
+                break
+            if clave == proteger or clave in self._en_curso:
+                continue
+            try:
+                os.remove(self.ruta(clave))
+            except FileNotFoundError:
+                pass
+            self._bytes -= self._entradas.pop(clave)["bytes"]
+            self.stats["expulsiones"] += 1
+
+    def estadisticas(self):
+        """
+        Devuelve las estadísticas de uso de la caché.
+
+        Returns:
+            dict: Aciertos, fallos, esperas compartidas, expulsiones, errores, entradas, bytes y tasa de aciertos.
+        """
+        with self._lock:
+            consultas = self.stats["aciertos"] + self.stats["fallos"]
+            return {
+                **self.stats,
+                "entradas": len(self._entradas),
+                "bytes": self._bytes,
+                "max_bytes": self.max_bytes,
+                "tasa_aciertos": self.stats["aciertos"] / consultas if consultas else 0.0,
+            }
@@ -0,0 +1,349 @@
+"""
+Caché semántica de respuestas delante del pipeline de Groq.
+
+Las consultas se indexan por su embedding: una pregunta suficientemente parecida a otra ya respondida
+(similitud coseno por encima de un umbral) reutiliza la intención, el SQL o el contexto recuperado
+y la respuesta final, sin llamar al LLM. Las entradas caducan por TTL y, al superar el tamaño máximo,
+se eliminan las menos usadas recientemente (LRU). El almacenamiento es una base de datos SQLite local.
+
+Las preguntas que solo se diferencian en un año, un número de inventario o el nombre de una colección tienen
+embeddings casi iguales, así que las respuestas SQL solo se reutilizan si además coinciden exactamente los números
+y las palabras con contenido de la pregunta (firma_consulta). Las respuestas de cada tipo se eliminan cuando
+cambia la versión de su fuente: los datos de fichas_raw para las SQL y el índice del corpus para las RAG.
+
+Además, CacheResultadosSQL guarda en memoria los resultados de las consultas SQL generadas, para que las
+preguntas distintas que producen el mismo SQL no vuelvan a consultar PostgreSQL.
+"""
+import os
+import json
+import time
+import sqlite3
+import threading
+from collections import OrderedDict
+import numpy as np
+from utils.embeddings_utils import embed_query
+from utils.texto_utils import tokenizar
+
+CACHE_DB = os.path.join(os.path.dirname(__file__), "..", "data", "cache", "respuestas.sqlite")
+
+
+def firma_consulta(consulta):
+    """
+    Números y palabras con contenido de una consulta (sin tildes, mayúsculas ni palabras vacías), ordenados.
+    Dos preguntas SQL solo comparten respuesta si tienen la misma firma.
+    """
+    return " ".join(sorted(set(tokenizar(consulta))))
+
+
+class CacheRespuestas:
+    """
+    Caché de respuestas indexada por similitud semántica de la consulta.
+
+    Args:
+        ruta (str, optional): Ruta del fichero SQLite. Por defecto CACHE_DB.
+        umbral (float, optional): Similitud coseno mínima para considerar un acierto. Por defecto 0.95.
+        ttl (int, optional): Segundos de validez de cada entrada. Por defecto 24 horas.
+        max_entradas (int, optional): Número máximo de entradas antes de expulsar por LRU. Por defecto 2000.
+        versiones (dict, optional): Tipo de respuesta -> función sin argumentos que devuelve la versión de
+            su fuente (p.e. {"SQL": versión de fichas_raw, "RAG": clave del índice}); si cambia, se eliminan
+            las respuestas de ese tipo. Por defecto no se comprueba ninguna.
+        intervalo_version (int, optional): Segundos entre comprobaciones de las versiones. Por defecto 60.
+    """
+
+    def __init__(self, ruta=CACHE_DB, umbral=0.95, ttl=24 * 3600, max_entradas=2000, versiones=None,
+                 intervalo_version=60):
+        self.umbral = umbral
+        self.ttl = ttl
+        self.max_entradas = max_entradas
+        self.versiones = versiones or {}
+        self.intervalo_version = intervalo_version
+        self.aciertos = 0
+        self.fallos = 0
+        self.invalidaciones = 0
+        self._comprobado = 0.0
+        self._lock = threading.Lock()
+
+        os.makedirs(os.path.dirname(ruta), exist_ok=True)
+        self._conn = sqlite3.connect(ruta, check_same_thread=False)
+        self._conn.execute("""
+            CREATE TABLE IF NOT EXISTS respuestas (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                consulta TEXT NOT NULL,
+                embedding BLOB NOT NULL,
+                tipo TEXT NOT NULL,
+                sql TEXT,
+                contexto TEXT,
+                respuesta TEXT NOT NULL,
+                imagenes TEXT,
+                creado REAL NOT NULL,
+                ultimo_acceso REAL NOT NULL,
+                firma TEXT
+            )
+        """)
+        if "firma" not in [c[1] for c in self._conn.execute("PRAGMA table_info(respuestas)")]:
+            self._conn.execute("ALTER TABLE respuestas ADD COLUMN firma TEXT")  # Cachés creadas sin firma
+        self._conn.execute("CREATE TABLE IF NOT EXISTS estado (clave TEXT PRIMARY KEY, valor TEXT)")
+        self._conn.commit()
+        self._cargar_embeddings()
+
+    def _cargar_embeddings(self):
+        """
+        Carga en memoria los embeddings normalizados de las entradas vigentes.
+        """
+        filas = self._conn.execute("SELECT id, embedding FROM respuestas").fetchall()
+        self._ids = [fila[0] for fila in filas]
+        if filas:
+            self._matriz = np.vstack([np.frombuffer(fila[1], dtype=np.float32) for fila in filas])
+        else:
+            self._matriz = np.empty((0, 0), dtype=np.float32)
+
+    @staticmethod
+    def _vector(consulta):
+        vector = np.asarray(embed_query(consulta), dtype=np.float32)
+        return vector / (np.linalg.norm(vector) or 1.0)
+
+    def _comprobar_version(self, ahora):
+        """
+        Elimina las respuestas de cada tipo cuya fuente ha cambiado de versión desde que se guardaron. Las
+        versiones se guardan en la propia base de datos, para detectar también las recargas hechas con el
+        proceso parado.
+        """
+        if not self.versiones or ahora - self._comprobado < self.intervalo_version:
+            return
+        self._comprobado = ahora
+        for tipo, leer_version in self.versiones.items():
+            try:
+                version = str(leer_version())
+            except Exception as e:
+                print(f"No se pudo comprobar la versión de las respuestas {tipo}: {e}")
+                continue
+            clave = f"version_{tipo}"
+            with self._lock:
+                fila = self._conn.execute("SELECT valor FROM estado WHERE clave = ?", (clave,)).fetchone()
+                if fila is not None and fila[0] == version:
+                    continue
+                ids = [f[0] for f in self._conn.execute("SELECT id FROM respuestas WHERE tipo = ?", (tipo,)).fetchall()]
+                if ids:
+                    self._eliminar(ids)
+                    self.invalidaciones += 1
+                self._conn.execute("INSERT OR REPLACE INTO estado (clave, valor) VALUES (?, ?)", (clave, version))
+                self._conn.commit()
+
+    def buscar(self, consulta):
+        """
+        Busca una respuesta guardada para una consulta semánticamente equivalente. Se prueban por orden de
+        similitud todas las entradas por encima del umbral, descartando las caducadas y las respuestas SQL
+        cuya firma no coincide.
+
+        Args:
+            consulta (str): Consulta del usuario.
+
+        Returns:
+            dict or None: Diccionario con "tipo", "sql", "contexto", "respuesta", "imagenes" y "similitud",
+            o None si no hay ninguna entrada vigente por encima del umbral.
+        """
+        vector = self._vector(consulta)
+        ahora = time.time()
+        self._comprobar_version(ahora)
+        firma = firma_consulta(consulta)
+        with self._lock:
+            if not self._ids:
+                self.fallos += 1
+                return None
+            similitudes = self._matriz @ vector
+            candidatas = np.flatnonzero(similitudes >= self.umbral)
+            caducadas, fila = [], None
+            for posicion in candidatas[np.argsort(-similitudes[candidatas])]:
+                id_entrada = self._ids[posicion]
+                encontrada = self._conn.execute(
+                    "SELECT tipo, sql, contexto, respuesta, imagenes, creado, firma FROM respuestas WHERE id = ?",
+                    (id_entrada,)
+                ).fetchone()
+                if encontrada is None or ahora - encontrada[5] > self.ttl:
+                    caducadas.append(id_entrada)
+                    continue
+                if encontrada[0] == "SQL" and encontrada[6] != firma:
+                    continue
+                fila, similitud = encontrada, float(similitudes[posicion])
+                break
+            if caducadas:
+                self._eliminar(caducadas)
+            if fila is None:
+                self.fallos += 1
+                return None
+
+            self._conn.execute("UPDATE respuestas SET ultimo_acceso = ? WHERE id = ?", (ahora, id_entrada))
+            self._conn.commit()
+            self.aciertos += 1
+
+        return {
+            "tipo": fila[0],
+            "sql": fila[1],
+            "contexto": json.loads(fila[2]) if fila[2] else None,
+            "respuesta": fila[3],
+            "imagenes": json.loads(fila[4]) if fila[4] else None,
+            "similitud": similitud,
+        }
+
+    def guardar(self, consulta, tipo, respuesta, sql=None, contexto=None, imagenes=None):
+        """
+        Guarda la respuesta a una consulta junto con los datos intermedios del pipeline.
+
+        Args:
+            consulta (str): Consulta del usuario.
+            tipo (str): Intención clasificada ("SQL", "RAG", "INTERACCION" o "NO").
+            respuesta (str): Respuesta final mostrada al usuario.
+            sql (str, optional): Consulta SQL generada.
+            contexto (str or list, optional): Contexto recuperado para RAG.
+            imagenes (list, optional): Imágenes asociadas a la respuesta.
+        """
+        vector = self._vector(consulta)
+        ahora = time.time()
+        self._comprobar_version(ahora)  # La respuesta nueva queda asociada a la versión vigente
+        with self._lock:
+            cursor = self._conn.execute(
+                """INSERT INTO respuestas (consulta, embedding, tipo, sql, contexto, respuesta, imagenes, creado, ultimo_acceso, firma)
+                   VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)""",
+                (
+                    consulta, vector.tobytes(), tipo, sql,
+                    json.dumps(contexto, ensure_ascii=False) if contexto else None,
+                    respuesta,
+                    json.dumps(imagenes, ensure_ascii=False) if imagenes else None,
+                    ahora, ahora, firma_consulta(consulta),
+                )
+            )
+            self._conn.commit()
+            self._ids.append(cursor.lastrowid)
+            self._matriz = np.vstack([self._matriz, vector]) if self._matriz.size else vector.reshape(1, -1)
+            self._expulsar(ahora)
+
+    def _expulsar(self, ahora):
+        """
+        Elimina las entradas caducadas y, si se supera max_entradas, las menos usadas recientemente.
+        """
+        caducadas = [f[0] for f in self._conn.execute(
+            "SELECT id FROM respuestas WHERE creado < ?", (ahora - self.ttl,)
+        ).fetchall()]
+        sobrantes = len(self._ids) - len(caducadas) - self.max_entradas
+        if sobrantes > 0:
+            caducadas += [f[0] for f in self._conn.execute(
+                "SELECT id FROM respuestas WHERE creado >= ? ORDER BY ultimo_acceso ASC LIMIT ?",
+                (ahora - self.ttl, sobrantes)
+            ).fetchall()]
+        if caducadas:
+            self._eliminar(caducadas)
+
+    def _eliminar(self, ids):
+        ids = set(ids)
+        self._conn.executemany("DELETE FROM respuestas WHERE id = ?", [(i,) for i in ids])
+        self._conn.commit()
+        # Se quitan las filas de la matriz en memoria, sin volver a leer todos los embeddings de SQLite
+        conservar = [i for i, id_entrada in enumerate(self._ids) if id_entrada not in ids]
+        self._ids = [self._ids[i] for i in conservar]
+        self._matriz = self._matriz[conservar] if conservar else np.empty((0, 0), dtype=np.float32)
+
+    def vaciar(self):
+        """
+        Elimina todas las entradas de la caché.
+        """
+        with self._lock:
+            self._conn.execute("DELETE FROM respuestas")
+            self._conn.commit()
+            self._cargar_embeddings()
+
+    def estadisticas(self):
+        """
+        Devuelve el número de entradas, aciertos, fallos e invalidaciones de la caché.
+        """
+        return {
+            "entradas": len(self._ids), "aciertos": self.aciertos, "fallos": self.fallos,
+            "invalidaciones": self.invalidaciones,
+        }
+
+
+class CacheResultadosSQL:
+    """
+    Caché en memoria, compartida por todas las sesiones del proceso, de los resultados de las consultas SQL
+    generadas, indexada por el SQL canónico. Las entradas caducan por TTL, se expulsan por LRU al superar el
+    tamaño máximo y se invalidan todas cuando cambia la versión de los datos.
+
+    Args:
+        leer_version (callable): Función sin argumentos que devuelve la versión actual de los datos.
+        ttl (int, optional): Segundos de validez de cada entrada. Por defecto 10 minutos.
+        max_entradas (int, optional): Número máximo de consultas guardadas. Por defecto 500.
+        intervalo_version (int, optional): Segundos entre comprobaciones de la versión. Por defecto 60.
+    """
+
+    def __init__(self, leer_version, ttl=600, max_entradas=500, intervalo_version=60):
+        self.leer_version = leer_version
+        self.ttl = ttl
+        self.max_entradas = max_entradas
+        self.intervalo_version = intervalo_version
+        self.aciertos = 0
+        self.fallos = 0
+        self.invalidaciones = 0
+        self._entradas = OrderedDict()  # clave -> (creado, valor)
+        self._version = None
+        self._comprobado = 0.0
+        self._lock = threading.Lock()
+
+    def _comprobar_version(self, ahora):
+        """
+        Vacía la caché si la versión de los datos ha cambiado desde la última comprobación.
+        """
+        if ahora - self._comprobado < self.intervalo_version:
+            return
+        self._comprobado = ahora
+        try:
+            version = self.leer_version()
+        except Exception as e:
+            print(f"No se pudo comprobar la versión de los datos: {e}")
+            return
+        with self._lock:
+            if self._version is not None and version != self._version:
+                self._entradas.clear()
+                self.invalidaciones += 1
+            self._version = version
+
+    def obtener(self, clave):
+        """
+        Devuelve el resultado guardado para la clave, o None si no está o ha caducado.
+        """
+        ahora = time.time()
+        self._comprobar_version(ahora)
+        with self._lock:
+            entrada = self._entradas.get(clave)
+            if entrada is None or ahora - entrada[0] > self.ttl:
+                self._entradas.pop(clave, None)
+                self.fallos += 1
+                return None
+            self._entradas.move_to_end(clave)
+            self.aciertos += 1
+            return entrada[1]
+
+    def guardar(self, clave, valor):
+        """
+        Guarda el resultado de una consulta, expulsando la menos usada recientemente si se supera el tamaño.
+        """
+        with self._lock:
+            self._entradas[clave] = (time.time(), valor)
+            self._entradas.move_to_end(clave)
+            while len(self._entradas) > self.max_entradas:
+                self._entradas.popitem(last=False)
+
+    def invalidar(self):
+        """
+        Elimina todas las entradas (p.e., tras recargar los datos desde este mismo proceso).
+        """
+        with self._lock:
+            self._entradas.clear()
+            self.invalidaciones += 1
+
+    def estadisticas(self):
+        """
+        Devuelve el número de entradas, aciertos, fallos e invalidaciones de la caché.
+        """
+        return {
+            "entradas": len(self._entradas), "aciertos": self.aciertos, "fallos": self.fallos,
+            "invalidaciones": self.invalidaciones, "version": self._version,
+        }
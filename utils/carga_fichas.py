@@ -0,0 +1,193 @@
+"""
+Carga de las fichas extraídas de CER.es (scraping_ceres -> fichas/<coleccion>.json) en la tabla `fichas_raw`
+que consulta el Text-to-SQL.
+
+- Las claves de cada ficha ("Autor/a", "Lugar de Producción/Ceca"...) se normalizan a las columnas snake_case
+  del prompt de `llm_genera_sql` (autor_a, lugar_de_produccion_ceca...).
+- Los textos se guardan en minúsculas y sin tildes, como indica el prompt (salvo inventario e imagenes).
+- La colección se toma del nombre del fichero y `fecha_ano` se deriva de la datación.
+- La carga es masiva: lotes con COPY a una tabla temporal y upsert por inventario en `fichas_raw`, todo en una
+  única transacción. Cada carga queda registrada en `cargas_fichas` y un fichero sin cambios no se vuelve a cargar.
+- Antes de cargar se aplican las migraciones pendientes de utils.esquema_db (tablas e índices).
+
+Uso:
+    python -m utils.carga_fichas fichas/*.json [--version aws] [--forzar]
+"""
+import os
+import io
+import re
+import csv
+import json
+import hashlib
+import unicodedata
+from utils.esquema_db import aplicar_migraciones
+
+# Columnas de fichas_raw, en el mismo orden que el prompt de llm_genera_sql
+COLUMNAS = [
+    "inventario", "coleccion", "contexto_cultural_estilo", "dimensiones", "iconografia", "historia_del_objeto",
+    "lugar_de_produccion_ceca", "componentes", "tecnica", "conjunto", "titulo", "autor_a", "bibliografia",
+    "descripcion", "lugar_de_procedencia", "nombre_especifico", "clasificacion_razonada", "materia_soporte",
+    "imagenes", "forma_de_ingreso", "firmas_marcas_etiquetas", "datacion", "fecha_ano", "inscripciones_leyendas",
+    "objeto_documento", "clasificacion_generica",
+]
+SIN_NORMALIZAR = {"inventario", "imagenes"}  # Se guardan tal cual: son claves y rutas
+TAMANO_LOTE = 5000  # Fichas por COPY
+
+
+def normalizar_texto(texto):
+    """
+    Pasa un texto a minúsculas y le quita las tildes y diacríticos.
+
+    Args:
+        texto (str): Texto original.
+
+    Returns:
+        str: Texto normalizado.
+    """
+    descompuesto = unicodedata.normalize("NFKD", texto)
+    return "".join(c for c in descompuesto if not unicodedata.combining(c)).lower().strip()
+
+
+def normalizar_clave(clave):
+    """
+    Convierte el nombre de un campo de CER.es en el nombre de columna de fichas_raw.
+    Por ejemplo, "Lugar de Producción/Ceca" -> "lugar_de_produccion_ceca".
+    """
+    return re.sub(r"[^a-z0-9]+", "_", normalizar_texto(clave)).strip("_")
+
+
+def extraer_ano(datacion):
+    """
+    Devuelve el primer año de cuatro cifras de una datación ("Hacia 1905", "1900 - 1910"...), o None.
+    """
+    encontrado = re.search(r"\b(1[0-9]{3}|20[0-9]{2})\b", datacion or "")
+    return int(encontrado.group(1)) if encontrado else None
+
+
+def normalizar_ficha(inventario, ficha, coleccion, ignoradas=None):
+    """
+    Convierte una ficha extraída de CER.es en una fila de fichas_raw.
+
+    Args:
+        inventario (str): Número de inventario (clave de la ficha en el JSON).
+        ficha (dict): Campos de la ficha tal y como se extrajeron.
+        coleccion (str): Colección a la que pertenece.
+        ignoradas (set, optional): Conjunto donde se anotan los campos que no tienen columna.
+
+    Returns:
+        list: Valores de la fila en el orden de COLUMNAS.
+    """
+    fila = dict.fromkeys(COLUMNAS)
+    for clave, valor in ficha.items():
+        columna = normalizar_clave(clave)
+        if columna not in fila or columna in ("inventario", "coleccion", "fecha_ano"):
+            if ignoradas is not None and columna not in fila:
+                ignoradas.add(clave)
+            continue
+        if columna == "imagenes":
+            fila[columna] = json.dumps(valor or [], ensure_ascii=False)
+        elif valor not in (None, ""):
+            fila[columna] = str(valor) if columna in SIN_NORMALIZAR else normalizar_texto(str(valor))
+
+    fila["inventario"] = str(inventario)
+    fila["coleccion"] = normalizar_texto(coleccion)
+    fila["fecha_ano"] = extraer_ano(fila["datacion"])
+    return [fila[c] for c in COLUMNAS]
+
+
+def _copiar_lote(cursor, filas):
+    """
+    Copia un lote a la tabla temporal con COPY y lo integra en fichas_raw con upsert por inventario.
+    """
+    buffer = io.StringIO()
+    csv.writer(buffer).writerows(filas)  # None se escribe como campo vacío sin comillas -> NULL en COPY CSV
+    buffer.seek(0)
+    cursor.execute("TRUNCATE fichas_staging")
+    cursor.copy_expert(f"COPY fichas_staging ({', '.join(COLUMNAS)}) FROM STDIN WITH (FORMAT csv)", buffer)
+    actualizar = ", ".join(f"{c} = EXCLUDED.{c}" for c in COLUMNAS if c != "inventario")
+    cursor.execute(f"""
+        INSERT INTO fichas_raw ({', '.join(COLUMNAS)})
+        SELECT DISTINCT ON (inventario) {', '.join(COLUMNAS)} FROM fichas_staging ORDER BY inventario
+        ON CONFLICT (inventario) DO UPDATE SET {actualizar}
+    """)
+
+
+def _hash_archivo(ruta):
+    sha = hashlib.sha256()
+    with open(ruta, "rb") as f:
+        for bloque in iter(lambda: f.read(1 << 20), b""):
+            sha.update(bloque)
+    return sha.hexdigest()
+
+
+def cargar_fichas(archivos, version_app="local", forzar=False, tamano_lote=TAMANO_LOTE):
+    """
+    Carga uno o varios ficheros fichas/<coleccion>.json en fichas_raw en una única transacción.
+
+    Args:
+        archivos (list): Rutas de los ficheros JSON generados por los scrapers.
+        version_app (str, optional): 'local' o 'aws'. Por defecto 'local'.
+        forzar (bool, optional): Cargar también los ficheros cuyo contenido ya se cargó. Por defecto False.
+        tamano_lote (int, optional): Fichas por COPY. Por defecto TAMANO_LOTE.
+
+    Returns:
+        int: Número de fichas cargadas.
+    """
+    from utils.db_utils import get_db_connection
+
+    conn = get_db_connection(version_app)
+    total = 0
+    try:
+        aplicar_migraciones(conn)
+        with conn.cursor() as cursor:
+            cursor.execute("CREATE TEMP TABLE fichas_staging (LIKE fichas_raw) ON COMMIT DROP")
+
+            for archivo in archivos:
+                coleccion = os.path.splitext(os.path.basename(archivo))[0]
+                hash_archivo = _hash_archivo(archivo)
+                cursor.execute(
+                    "SELECT 1 FROM cargas_fichas WHERE coleccion = %s AND hash = %s", (coleccion, hash_archivo)
+                )
+                if cursor.fetchone() and not forzar:
+                    print(f"{archivo}: sin cambios desde la última carga, se omite.")
+                    continue
+
+                with open(archivo, "r", encoding="utf-8") as f:
+                    fichas = json.load(f)
+                ignoradas = set()
+                filas = [normalizar_ficha(inv, ficha, coleccion, ignoradas) for inv, ficha in fichas.items()]
+                for inicio in range(0, len(filas), tamano_lote):
+                    _copiar_lote(cursor, filas[inicio:inicio + tamano_lote])
+
+                cursor.execute(
+                    "INSERT INTO cargas_fichas (coleccion, archivo, hash, filas) VALUES (%s, %s, %s, %s)",
+                    (coleccion, archivo, hash_archivo, len(filas))
+                )
+                total += len(filas)
+                print(f"{archivo}: {len(filas)} fichas cargadas en fichas_raw (colección '{coleccion}').")
+                if ignoradas:
+                    print(f"  Campos sin columna en fichas_raw: {', '.join(sorted(ignoradas))}")
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+    finally:
+        conn.close()
+    return total
+
+
+if __name__ == "__main__":
+    import time
+    import argparse
+    from dotenv import load_dotenv
+
+    load_dotenv()
+    parser = argparse.ArgumentParser(description="Carga las fichas de CER.es en la tabla fichas_raw.")
+    parser.add_argument("archivos", nargs="+", help="Ficheros fichas/<coleccion>.json")
+    parser.add_argument("--version", choices=["local", "aws"], default="local", help="Base de datos de destino")
+    parser.add_argument("--forzar", action="store_true", help="Recargar aunque el fichero no haya cambiado")
+    args = parser.parse_args()
+
+    inicio = time.perf_counter()
+    cargadas = cargar_fichas(args.archivos, version_app=args.version, forzar=args.forzar)
+    print(f"{cargadas} fichas cargadas en {time.perf_counter() - inicio:.1f} s")
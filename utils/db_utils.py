@@ -1,9 +1,345 @@
+import os
+import time
+import threading
+from collections import OrderedDict
+from contextlib import contextmanager
 import psycopg2
+import psycopg2.errors
+import psycopg2.extensions
+from psycopg2 import pool as pg_pool
+from utils.trazas_utils import tramo
+
+POOL_MIN = 1  # Conexiones abiertas desde el arranque
+POOL_MAX = 10  # Conexiones simultáneas como máximo
+ESPERA_MAX = 30  # Segundos que se espera a que quede libre una conexión del pool
+INTERVALO_SALUD = 60  # Segundos de inactividad a partir de los cuales se comprueba la conexión antes de usarla
+REFRESCO_TOKEN_IAM = 10 * 60  # Los tokens IAM de RDS caducan a los 15 minutos; se renuevan antes
+
+_token_iam = {"token": None, "creado": 0.0}
+_lock_token = threading.Lock()
+_pools = {}
+_lock_pools = threading.Lock()
+
 
 def ejecutar_sql(cursor, query):
     try:
         cursor.execute(query)
         return cursor.fetchall()
     except Exception as e:
-        cursor.connection.rollback() 
+        cursor.connection.rollback()
         raise e
+
+
+def obtener_token_iam(host, port, user, region):
+    """
+    Devuelve un token de autenticación IAM para RDS, reutilizándolo hasta poco antes de que caduque.
+
+    Args:
+        host (str): Host de la instancia RDS.
+        port (str): Puerto de la instancia RDS.
+        user (str): Usuario IAM de la base de datos.
+        region (str): Región de AWS.
+
+    Returns:
+        str: Token de autenticación.
+    """
+    with _lock_token:
+        if _token_iam["token"] is None or time.time() - _token_iam["creado"] > REFRESCO_TOKEN_IAM:
+            import boto3
+            client = boto3.client('rds', region_name=region)
+            _token_iam["token"] = client.generate_db_auth_token(DBHostname=host, Port=port, DBUsername=user, Region=region)
+            _token_iam["creado"] = time.time()
+        return _token_iam["token"]
+
+
+def parametros_conexion(version_app):
+    """
+    Devuelve los parámetros de conexión a PostgreSQL según la versión de la app.
+
+    Args:
+        version_app (str): 'local' para la base de datos local, 'aws' para RDS con autenticación IAM.
+
+    Returns:
+        dict: Argumentos para psycopg2.connect (sin la contraseña en el caso de AWS).
+    """
+    if version_app == 'local':
+        return dict(
+            dbname=os.getenv("DB_NAME"),
+            user=os.getenv("DB_USER"),
+            password=os.getenv("DB_PASSWORD"),
+            host=os.getenv("DB_HOST"),
+            port=os.getenv("DB_PORT")
+        )
+    elif version_app == 'aws':
+        return dict(
+            host=os.getenv("RDS_HOST"),
+            port=os.getenv("RDS_PORT"),
+            database=os.getenv("RDS_NAME"),
+            user=os.getenv("RDS_USER_IAM"),
+            sslmode='require'
+        )
+    else:
+        raise ValueError("Versión de app no soportada")
+
+
+def get_db_connection(version_app):
+    """
+    Abre una conexión nueva a la base de datos, fuera del pool (para scripts y tareas puntuales).
+
+    Args:
+        version_app (str): 'local' o 'aws'.
+
+    Returns:
+        psycopg2.connection: Conexión abierta.
+    """
+    parametros = parametros_conexion(version_app)
+    if version_app == 'aws':
+        parametros["password"] = obtener_token_iam(parametros["host"], parametros["port"], parametros["user"], os.getenv("RDS_REGION"))
+    return psycopg2.connect(**parametros)
+
+
+class Conexion(psycopg2.extensions.connection):
+    """
+    Conexión del pool que recuerda si ya tiene preparada la sentencia de búsqueda de fichas. El estado vive
+    en la propia conexión, así que desaparece con ella cuando el pool la cierra o la sustituye.
+    """
+    ficha_preparada = False
+
+
+class PoolConexiones(pg_pool.ThreadedConnectionPool):
+    """
+    Pool de conexiones compartido por todas las sesiones del proceso.
+
+    Sobre ThreadedConnectionPool añade: espera (en lugar de error) cuando todas las conexiones están en uso,
+    comprobación de salud de las conexiones inactivas, token IAM renovado para cada conexión nueva en AWS
+    y métricas de uso.
+    """
+
+    def __init__(self, version_app, minconn=POOL_MIN, maxconn=POOL_MAX):
+        self.version_app = version_app
+        self._libres = threading.BoundedSemaphore(maxconn)
+        self._ultimo_uso = {}
+        self._lock_metricas = threading.Lock()
+        self.metricas = {
+            "conexiones_creadas": 0, "prestamos": 0, "en_uso": 0, "descartadas": 0,
+            "esperas": 0, "tiempo_espera_total": 0.0,
+        }
+        super().__init__(minconn, maxconn, connection_factory=Conexion, **parametros_conexion(version_app))
+
+    def _connect(self, key=None):
+        # En AWS cada conexión nueva necesita un token vigente como contraseña
+        if self.version_app == 'aws':
+            self._kwargs["password"] = obtener_token_iam(
+                self._kwargs["host"], self._kwargs["port"], self._kwargs["user"], os.getenv("RDS_REGION")
+            )
+        conn = super()._connect(key)
+        self._ultimo_uso[id(conn)] = time.time()
+        self._sumar("conexiones_creadas")
+        return conn
+
+    def _sumar(self, metrica, valor=1):
+        with self._lock_metricas:
+            self.metricas[metrica] += valor
+
+    def _sana(self, conn):
+        if conn.closed:
+            return False
+        if time.time() - self._ultimo_uso.get(id(conn), 0.0) < INTERVALO_SALUD:
+            return True
+        try:
+            with conn.cursor() as cursor:
+                cursor.execute("SELECT 1")
+            conn.rollback()
+            return True
+        except psycopg2.Error:
+            return False
+
+    def prestar(self, timeout=ESPERA_MAX):
+        """
+        Obtiene una conexión sana del pool, esperando si todas están en uso.
+        """
+        inicio = time.time()
+        if not self._libres.acquire(blocking=False):
+            self._sumar("esperas")
+            if not self._libres.acquire(timeout=timeout):
+                raise pg_pool.PoolError(f"No hay conexiones libres tras esperar {timeout} s")
+        self._sumar("tiempo_espera_total", time.time() - inicio)
+        try:
+            conn = self.getconn()
+            while not self._sana(conn):
+                self._sumar("descartadas")
+                self._ultimo_uso.pop(id(conn), None)
+                self.putconn(conn, close=True)
+                conn = self.getconn()
+        except Exception:
+            self._libres.release()
+            raise
+        self._sumar("prestamos")
+        self._sumar("en_uso")
+        return conn
+
+    def devolver(self, conn):
+        """
+        Devuelve una conexión al pool, descartando la transacción que tuviera abierta.
+        """
+        try:
+            cerrar = conn.closed != 0
+            if not cerrar:
+                try:
+                    conn.rollback()
+                except psycopg2.Error:
+                    cerrar = True
+            if cerrar:
+                self._ultimo_uso.pop(id(conn), None)
+                self._sumar("descartadas")
+            else:
+                self._ultimo_uso[id(conn)] = time.time()
+            self.putconn(conn, close=cerrar)
+        finally:
+            self._sumar("en_uso", -1)
+            self._libres.release()
+
+
+def obtener_pool(version_app):
+    """
+    Devuelve el pool de conexiones del proceso para la versión de la app, creándolo la primera vez.
+
+    Args:
+        version_app (str): 'local' o 'aws'.
+
+    Returns:
+        PoolConexiones: Pool compartido.
+    """
+    if version_app not in _pools:
+        with _lock_pools:
+            if version_app not in _pools:
+                _pools[version_app] = PoolConexiones(version_app)
+    return _pools[version_app]
+
+
+@contextmanager
+def conexion(version_app):
+    """
+    Presta una conexión del pool durante el bloque `with` y la devuelve al terminar.
+
+    Args:
+        version_app (str): 'local' o 'aws'.
+
+    Yields:
+        psycopg2.connection: Conexión sana del pool.
+    """
+    pool = obtener_pool(version_app)
+    conn = pool.prestar()
+    try:
+        yield conn
+    finally:
+        pool.devolver(conn)
+
+
+def metricas_pool(version_app):
+    """
+    Devuelve las métricas de uso del pool de la versión de la app.
+
+    Returns:
+        dict: Conexiones creadas, préstamos, en uso, descartadas, esperas y tiempo total de espera.
+    """
+    pool = obtener_pool(version_app)
+    return {**pool.metricas, "libres": len(pool._pool), "max": pool.maxconn}
+
+
+# Caché de fichas para la vista de detalle
+TAMANO_CACHE_FICHAS = 10000  # Número máximo de fichas guardadas en memoria
+TTL_SIN_FICHA = 60  # Segundos que se recuerda que un inventario no existe (puede llegar en la próxima carga)
+_SIN_FICHA = object()  # Marca de inventario consultado que no existe en la base de datos
+_cache_fichas = OrderedDict()
+_lock_fichas = threading.Lock()
+_SQL_PREPARAR_FICHA = 'PREPARE ficha_por_inventario (text) AS SELECT * FROM fichas WHERE "Inventario" = $1 LIMIT 1'
+
+
+def _guardar_ficha(inventario, ficha):
+    with _lock_fichas:
+        _cache_fichas[inventario] = ficha
+        _cache_fichas.move_to_end(inventario)
+        while len(_cache_fichas) > TAMANO_CACHE_FICHAS:
+            _cache_fichas.popitem(last=False)
+
+
+def _consultar_ficha(conn, inventario):
+    """
+    Ejecuta la sentencia preparada de búsqueda de ficha por inventario, preparándola si la conexión aún no la tiene.
+    La conexión debe ser del pool (`Conexion`).
+    """
+    with conn.cursor() as cursor:
+        if not conn.ficha_preparada:
+            cursor.execute(_SQL_PREPARAR_FICHA)
+            conn.ficha_preparada = True
+        try:
+            cursor.execute("EXECUTE ficha_por_inventario (%s)", (inventario,))
+        except psycopg2.errors.InvalidSqlStatementName:
+            # La conexión se recreó y perdió la sentencia preparada
+            conn.rollback()
+            cursor.execute(_SQL_PREPARAR_FICHA)
+            cursor.execute("EXECUTE ficha_por_inventario (%s)", (inventario,))
+        fila = cursor.fetchone()
+        if fila is None:
+            return None
+        columnas = [desc[0] for desc in cursor.description]
+        return dict(zip(columnas, fila))
+
+
+def obtener_ficha(version_app, inventario):
+    """
+    Devuelve la ficha de un objeto por su número de inventario. Las fichas se guardan en una caché LRU
+    en memoria, de modo que las repeticiones de la vista de detalle no consultan la base de datos.
+
+    Args:
+        version_app (str): 'local' o 'aws'.
+        inventario (str): Número de inventario del objeto.
+
+    Returns:
+        dict or None: Diccionario columna -> valor, o None si no existe la ficha.
+    """
+    with _lock_fichas:
+        ficha = _cache_fichas.get(inventario)
+        if isinstance(ficha, tuple):
+            # Entrada negativa (_SIN_FICHA, caducidad): vale solo hasta que caduca
+            if ficha[1] > time.time():
+                return None
+            del _cache_fichas[inventario]
+        elif ficha is not None:
+            _cache_fichas.move_to_end(inventario)
+            return ficha
+
+    with tramo("ficha_db"):
+        with conexion(version_app) as conn:
+            ficha = _consultar_ficha(conn, inventario)
+    _guardar_ficha(inventario, (_SIN_FICHA, time.time() + TTL_SIN_FICHA) if ficha is None else ficha)
+    return ficha
+
+
+def precargar_fichas(version_app, itersize=2000):
+    """
+    Carga en la caché todas las fichas del catálogo (hasta TAMANO_CACHE_FICHAS) en una sola consulta.
+
+    Args:
+        version_app (str): 'local' o 'aws'.
+        itersize (int, optional): Filas por lote del cursor de servidor. Por defecto 2000.
+
+    Returns:
+        int: Número de fichas cargadas.
+    """
+    cargadas = 0
+    with conexion(version_app) as conn:
+        with conn.cursor(name="precarga_fichas") as cursor:
+            cursor.itersize = itersize
+            cursor.execute("SELECT * FROM fichas")
+            columnas = None
+            for fila in cursor:
+                if columnas is None:
+                    columnas = [desc[0] for desc in cursor.description]
+                ficha = dict(zip(columnas, fila))
+                _guardar_ficha(ficha["Inventario"], ficha)
+                cargadas += 1
+                if cargadas >= TAMANO_CACHE_FICHAS:
+                    break
+    return cargadas
@@ -0,0 +1,106 @@
+"""
+Servicio de embeddings compartido por todo el proceso.
+
+El modelo de sentence-transformers se carga una sola vez y lo usan tanto el índice FAISS como
+las consultas a Pinecone. Las consultas repetidas se sirven desde una caché LRU de embeddings.
+
+langchain_huggingface (y con él torch y transformers) se importa al cargar el modelo, no al importar el módulo.
+"""
+import threading
+from functools import lru_cache
+
+MODELO_EMBEDDINGS = "sentence-transformers/all-MiniLM-L12-v2"
+TAMANO_BATCH = 64  # Número de textos por llamada al modelo en embed_documents
+TAMANO_CACHE_CONSULTAS = 2048  # Número de embeddings de consulta que se guardan en memoria
+
+_modelo = None
+_lock_modelo = threading.Lock()
+_embeddings_compartidos = None
+
+
+def obtener_modelo():
+    """
+    Devuelve el modelo de embeddings del proceso, cargándolo la primera vez.
+
+    Returns:
+        HuggingFaceEmbeddings: Modelo de embeddings compartido.
+    """
+    global _modelo
+    if _modelo is None:
+        with _lock_modelo:
+            if _modelo is None:
+                from langchain_huggingface import HuggingFaceEmbeddings
+                _modelo = HuggingFaceEmbeddings(model_name=MODELO_EMBEDDINGS)
+    return _modelo
+
+
+@lru_cache(maxsize=TAMANO_CACHE_CONSULTAS)
+def _embed_query_cache(texto):
+    return tuple(obtener_modelo().embed_query(texto))
+
+
+def embed_query(texto):
+    """
+    Obtiene el embedding de una consulta, usando la caché LRU si ya se ha calculado antes.
+
+    Args:
+        texto (str): Texto de la consulta.
+
+    Returns:
+        list: Vector de embedding.
+    """
+    return list(_embed_query_cache(texto.strip()))
+
+
+def embed_documents(textos, batch_size=TAMANO_BATCH):
+    """
+    Obtiene los embeddings de una lista de textos, procesándolos por lotes.
+
+    Args:
+        textos (list): Lista de textos.
+        batch_size (int, optional): Número de textos por lote. Por defecto TAMANO_BATCH.
+
+    Returns:
+        list: Lista de vectores de embedding, en el mismo orden que los textos.
+    """
+    modelo = obtener_modelo()
+    vectores = []
+    for i in range(0, len(textos), batch_size):
+        vectores.extend(modelo.embed_documents(textos[i:i + batch_size]))
+    return vectores
+
+
+def info_cache():
+    """
+    Devuelve las estadísticas de la caché de embeddings de consulta (aciertos, fallos, tamaño).
+    """
+    return _embed_query_cache.cache_info()
+
+
+def _clase_embeddings_compartidos():
+    from langchain_core.embeddings import Embeddings
+
+    class EmbeddingsCompartidos(Embeddings):
+        """
+        Adaptador de LangChain sobre el servicio de embeddings compartido, para usarlo en vectorstores.
+        """
+
+        def embed_documents(self, texts):
+            return embed_documents(texts)
+
+        def embed_query(self, text):
+            return embed_query(text)
+
+    return EmbeddingsCompartidos
+
+
+def obtener_embeddings():
+    """
+    Devuelve el objeto Embeddings de LangChain compartido por el proceso.
+    """
+    global _embeddings_compartidos
+    if _embeddings_compartidos is None:
+        with _lock_modelo:
+            if _embeddings_compartidos is None:
+                _embeddings_compartidos = _clase_embeddings_compartidos()()
+    return _embeddings_compartidos
@@ -0,0 +1,149 @@
+"""
+Esquema y migraciones de la base de datos del catálogo (tabla `fichas_raw`).
+
+Las migraciones se aplican en orden y quedan registradas en `esquema_migraciones`, de modo que se pueden
+ejecutar tantas veces como se quiera. Además de las tablas, crean los índices que sirven las consultas que
+genera el Text-to-SQL:
+
+- Índices GIN de trigramas (pg_trgm) sobre las columnas de texto, que resuelven `ILIKE '%palabra%'` sin
+  recorrer la tabla entera.
+- Una columna generada `busqueda` (tsvector) con la configuración `spanish_unaccent` (stemming en español y sin
+  tildes) sobre título, descripción, clasificación razonada e historia del objeto, con su índice GIN.
+
+Uso:
+    python -m utils.esquema_db [--version aws]
+"""
+
+COLUMNAS_TRIGRAMAS = [
+    "descripcion", "clasificacion_razonada", "historia_del_objeto", "titulo", "autor_a", "tecnica",
+    "materia_soporte", "lugar_de_produccion_ceca", "firmas_marcas_etiquetas", "forma_de_ingreso",
+]
+CONFIG_TEXTO = "spanish_unaccent"
+
+_SQL_BUSQUEDA = " || ".join([
+    f"setweight(to_tsvector('{CONFIG_TEXTO}'::regconfig, coalesce(titulo, '')), 'A')",
+    f"setweight(to_tsvector('{CONFIG_TEXTO}'::regconfig, coalesce(descripcion, '')), 'B')",
+    f"setweight(to_tsvector('{CONFIG_TEXTO}'::regconfig, coalesce(clasificacion_razonada, '')), 'B')",
+    f"setweight(to_tsvector('{CONFIG_TEXTO}'::regconfig, coalesce(historia_del_objeto, '')), 'C')",
+])
+
+# (versión, descripción, SQL). Nunca se modifica una migración publicada: los cambios van en una nueva.
+MIGRACIONES = [
+    (1, "tablas fichas_raw y cargas_fichas", """
+        CREATE TABLE IF NOT EXISTS fichas_raw (
+            inventario text, coleccion text, contexto_cultural_estilo text, dimensiones text, iconografia text,
+            historia_del_objeto text, lugar_de_produccion_ceca text, componentes text, tecnica text, conjunto text,
+            titulo text, autor_a text, bibliografia text, descripcion text, lugar_de_procedencia text,
+            nombre_especifico text, clasificacion_razonada text, materia_soporte text, imagenes text,
+            forma_de_ingreso text, firmas_marcas_etiquetas text, datacion text, fecha_ano integer,
+            inscripciones_leyendas text, objeto_documento text, clasificacion_generica text
+        );
+        CREATE UNIQUE INDEX IF NOT EXISTS fichas_raw_inventario_key ON fichas_raw (inventario);
+        CREATE TABLE IF NOT EXISTS cargas_fichas (
+            id serial PRIMARY KEY,
+            coleccion text NOT NULL,
+            archivo text NOT NULL,
+            hash text NOT NULL,
+            filas integer NOT NULL,
+            fecha timestamptz NOT NULL DEFAULT now()
+        );
+    """),
+    (2, "extensiones pg_trgm y unaccent", """
+        CREATE EXTENSION IF NOT EXISTS pg_trgm;
+        CREATE EXTENSION IF NOT EXISTS unaccent;
+    """),
+    (3, f"configuración de búsqueda {CONFIG_TEXTO}", f"""
+        DO $$
+        BEGIN
+            IF NOT EXISTS (SELECT 1 FROM pg_ts_config WHERE cfgname = '{CONFIG_TEXTO}') THEN
+                CREATE TEXT SEARCH CONFIGURATION {CONFIG_TEXTO} (COPY = spanish);
+                ALTER TEXT SEARCH CONFIGURATION {CONFIG_TEXTO}
+                    ALTER MAPPING FOR hword, hword_part, word WITH unaccent, spanish_stem;
+            END IF;
+        END $$;
+    """),
+    (4, "índices de trigramas", "\n".join(
+        f"CREATE INDEX IF NOT EXISTS fichas_raw_{c}_trgm ON fichas_raw USING gin ({c} gin_trgm_ops);"
+        for c in COLUMNAS_TRIGRAMAS
+    )),
+    (5, "columna de texto completo busqueda", f"""
+        ALTER TABLE fichas_raw ADD COLUMN IF NOT EXISTS busqueda tsvector GENERATED ALWAYS AS ({_SQL_BUSQUEDA}) STORED;
+        CREATE INDEX IF NOT EXISTS fichas_raw_busqueda_gin ON fichas_raw USING gin (busqueda);
+    """),
+    (6, "índices de coleccion y fecha_ano", """
+        CREATE INDEX IF NOT EXISTS fichas_raw_coleccion ON fichas_raw (coleccion);
+        CREATE INDEX IF NOT EXISTS fichas_raw_fecha_ano ON fichas_raw (fecha_ano);
+        ANALYZE fichas_raw;
+    """),
+]
+
+
+def aplicar_migraciones(conn):
+    """
+    Aplica las migraciones pendientes dentro de la transacción de la conexión (sin hacer commit).
+    Un bloqueo consultivo evita que dos procesos migren a la vez.
+
+    Args:
+        conn (psycopg2.connection): Conexión abierta.
+
+    Returns:
+        list: Versiones aplicadas en esta llamada.
+    """
+    aplicadas = []
+    with conn.cursor() as cursor:
+        cursor.execute("SELECT pg_advisory_xact_lock(hashtext('esquema_migraciones'))")
+        cursor.execute("""
+            CREATE TABLE IF NOT EXISTS esquema_migraciones (
+                version integer PRIMARY KEY,
+                descripcion text NOT NULL,
+                aplicada timestamptz NOT NULL DEFAULT now()
+            )
+        """)
+        cursor.execute("SELECT version FROM esquema_migraciones")
+        existentes = {fila[0] for fila in cursor.fetchall()}
+        for version, descripcion, sql in MIGRACIONES:
+            if version in existentes:
+                continue
+            cursor.execute(sql)
+            cursor.execute(
+                "INSERT INTO esquema_migraciones (version, descripcion) VALUES (%s, %s)", (version, descripcion)
+            )
+            aplicadas.append(version)
+            print(f"Migración {version} aplicada: {descripcion}")
+    return aplicadas
+
+
+def migrar(version_app="local"):
+    """
+    Abre una conexión, aplica las migraciones pendientes y hace commit.
+
+    Args:
+        version_app (str, optional): 'local' o 'aws'. Por defecto 'local'.
+
+    Returns:
+        list: Versiones aplicadas.
+    """
+    from utils.db_utils import get_db_connection
+
+    conn = get_db_connection(version_app)
+    try:
+        aplicadas = aplicar_migraciones(conn)
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+    finally:
+        conn.close()
+    return aplicadas
+
+
+if __name__ == "__main__":
+    import argparse
+    from dotenv import load_dotenv
+
+    load_dotenv()
+    parser = argparse.ArgumentParser(description="Aplica las migraciones pendientes del esquema de fichas_raw.")
+    parser.add_argument("--version", choices=["local", "aws"], default="local", help="Base de datos de destino")
+    args = parser.parse_args()
+    aplicadas = migrar(args.version)
+    print(f"{len(aplicadas)} migraciones aplicadas." if aplicadas else "El esquema ya estaba al día.")
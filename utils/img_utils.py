@@ -1,10 +1,52 @@
 import streamlit as st
-from utils.db_utils import ejecutar_sql
 import ast
 import uuid
-import boto3
 import os
 import base64
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from utils.cache_disco import CacheDisco
+from utils.trazas_utils import tramo, en_contexto
+
+BUCKET_NAME = 'museosorolla'
+S3_CACHE_DIR = './data_s3_cache'  # Imágenes originales descargadas de S3
+S3_CACHE_MAX_BYTES = int(os.getenv("S3_CACHE_MAX_BYTES", 2 * 1024 ** 3))  # Presupuesto en disco de las originales
+S3_CACHE_POLITICA = os.getenv("S3_CACHE_POLITICA", "lru")  # 'lru' o 'lfu'
+MINIATURAS_DIR = './data_miniaturas'  # Miniaturas generadas, junto a ./data_s3_cache
+ANCHO_MINIATURA = 150  # Ancho con el que se muestran las imágenes en el chat
+MAX_BYTES_MINIATURAS = 200 * 1024 * 1024  # Tamaño máximo en disco de las miniaturas
+DESCARGAS_SIMULTANEAS = 8  # Hilos para descargar imágenes y generar miniaturas en paralelo
+ESPERA_MINIATURA = 20  # Segundos máximos de espera por una miniatura antes de mostrar el hueco vacío
+
+_executor_imagenes = ThreadPoolExecutor(max_workers=DESCARGAS_SIMULTANEAS, thread_name_prefix="miniaturas")
+_cache_s3 = None
+_cache_miniaturas = None
+_lock_caches = threading.Lock()
+
+
+def obtener_caches_imagenes():
+    """
+    Devuelve las cachés en disco de imágenes de S3 y de miniaturas, compartidas por todo el proceso.
+
+    Returns:
+        tuple: (CacheDisco de originales, CacheDisco de miniaturas)
+    """
+    global _cache_s3, _cache_miniaturas
+    if _cache_s3 is None:
+        with _lock_caches:
+            if _cache_s3 is None:
+                _cache_miniaturas = CacheDisco(MINIATURAS_DIR, MAX_BYTES_MINIATURAS)
+                _cache_s3 = CacheDisco(S3_CACHE_DIR, S3_CACHE_MAX_BYTES, politica=S3_CACHE_POLITICA)
+    return _cache_s3, _cache_miniaturas
+
+
+def estadisticas_cache_imagenes():
+    """
+    Devuelve las estadísticas de las cachés de imágenes originales y de miniaturas.
+    """
+    cache_s3, cache_miniaturas = obtener_caches_imagenes()
+    return {"s3": cache_s3.estadisticas(), "miniaturas": cache_miniaturas.estadisticas()}
+
 
 def obtener_ruta_final(path, version_app, s3_client=None):
     """
@@ -32,24 +74,95 @@ def obtener_ruta_final(path, version_app, s3_client=None):
         except Exception:
             s3_key = str(path)
 
-        BUCKET_NAME = 'museosorolla'
-        LOCAL_DIR = './data_s3_cache' 
+        # Descargar solo si no está ya en la caché local (con presupuesto de bytes y expulsión)
+        cache_s3, _ = obtener_caches_imagenes()
+        def descargar(temporal):
+            with tramo("descarga_s3", clave=s3_key):
+                s3_client.download_file(BUCKET_NAME, s3_key, temporal)
 
-        # Ruta local donde se guardará
-        local_path = os.path.join(LOCAL_DIR, s3_key)
-        # Crear el directorio si no existe
-        os.makedirs(os.path.dirname(local_path), exist_ok=True)
-        # Descargar solo si no existe ya
-        if not os.path.exists(local_path):
-            try:
-                s3_client.download_file(BUCKET_NAME, s3_key, local_path)
-            except Exception as e:
-                print(f"Error al descargar {s3_key} desde S3: {e}")
-                return None
+        try:
+            return cache_s3.obtener(s3_key, descargar)
+        except Exception as e:
+            print(f"Error al descargar {s3_key} desde S3: {e}")
+            return None
+
+def clave_miniatura(path):
+    """
+    Devuelve la clave en la caché de miniaturas correspondiente a la ruta de una imagen.
+    """
+    try:
+        parsed = ast.literal_eval(path) if isinstance(path, str) else path
+        clave = parsed[0] if isinstance(parsed, list) else str(parsed)
+    except Exception:
+        clave = str(path)
+    return os.path.splitext(clave)[0] + f"_{ANCHO_MINIATURA}.jpg"
+
+
+def obtener_miniatura(path, version_app, s3_client=None):
+    """
+    Devuelve la ruta de la miniatura de una imagen, descargando la imagen original y generando
+    la miniatura si aún no existe. Pensada para ejecutarse en el pool de hilos de imágenes.
+
+    Args:
+        path (str or list): Ruta o lista de rutas de la imagen.
+        version_app (str): 'local' o 'aws'.
+        s3_client (boto3.client, optional): Cliente S3 para descargar la imagen original.
+
+    Returns:
+        str or None: Ruta local de la miniatura (o de la original si no se pudo generar), o None si falla la descarga.
+    """
+    from PIL import Image
+
+    _, cache_miniaturas = obtener_caches_imagenes()
 
-        return local_path
+    with tramo("miniatura") as datos:
+        datos["generada"] = False
 
-def mostrar_imagenes_en_chat(imagenes, query_id, version_app='local', s3_client=None):
+        # La imagen original solo se descarga si la miniatura no está ya en la caché
+        def generar(temporal):
+            datos["generada"] = True
+            for intento in range(2):
+                original = obtener_ruta_final(path, version_app, s3_client=s3_client)
+                if original is None:
+                    raise FileNotFoundError(f"No se pudo obtener la imagen {path}")
+                try:
+                    img = Image.open(original)
+                    break
+                except FileNotFoundError:
+                    # Otra sesión ha expulsado la original de la caché de S3 entre la descarga y la apertura:
+                    # se vuelve a pedir una vez (la caché la descarga de nuevo)
+                    if intento == 1:
+                        raise
+            with img:
+                img.thumbnail((ANCHO_MINIATURA, ANCHO_MINIATURA * 4))
+                img.convert("RGB").save(temporal, "JPEG", quality=85)
+
+        try:
+            return cache_miniaturas.obtener(clave_miniatura(path), generar)
+        except Exception as e:
+            print(f"Error al generar la miniatura de {path}: {e}")
+            return obtener_ruta_final(path, version_app, s3_client=s3_client)
+
+
+def prefetch_miniaturas(imagenes, version_app, s3_client=None):
+    """
+    Lanza en paralelo la descarga y generación de las miniaturas de una lista de imágenes.
+
+    Args:
+        imagenes (list): Lista de diccionarios con la clave "path".
+        version_app (str): 'local' o 'aws'.
+        s3_client (boto3.client, optional): Cliente S3 para descargar las imágenes.
+
+    Returns:
+        list: Futuros con la ruta de cada miniatura, en el mismo orden que las imágenes.
+    """
+    return [
+        _executor_imagenes.submit(en_contexto(obtener_miniatura), imagen["path"], version_app, s3_client)
+        for imagen in imagenes
+    ]
+
+
+def mostrar_imagenes_en_chat(imagenes, query_id, version_app='local', s3_client=None, miniaturas=None):
     """
     Muestra las imágenes en el chat de Streamlit.
 
@@ -58,6 +171,7 @@ def mostrar_imagenes_en_chat(imagenes, query_id, version_app='local', s3_client=
         query_id (str): Identificador único de la consulta.
         version_app (str, optional): 'local' o 'aws'. Por defecto 'local'.
         s3_client (boto3.client, optional): Cliente S3 para descarga si es necesario.
+        miniaturas (list, optional): Futuros devueltos por prefetch_miniaturas si la descarga ya se lanzó antes.
     """
     if not imagenes:
         return
@@ -65,11 +179,22 @@ def mostrar_imagenes_en_chat(imagenes, query_id, version_app='local', s3_client=
     st.markdown("#### Imágenes encontradas")
     cols = st.columns(min(len(imagenes), 4))
 
+    # Descargar y generar todas las miniaturas en paralelo antes de pintarlas
+    if miniaturas is None:
+        miniaturas = prefetch_miniaturas(imagenes, version_app, s3_client=s3_client)
+
     for i, imagen_dict in enumerate(imagenes):
         col = cols[i % 4]
         with col:
-            imagen_path = obtener_ruta_final(imagen_dict["path"], version_app, s3_client=s3_client)
-            st.image(imagen_path, width=150)
+            try:
+                imagen_path = miniaturas[i].result(timeout=ESPERA_MINIATURA)
+            except Exception as e:
+                print(f"Error al obtener la miniatura de {imagen_dict['path']}: {e}")
+                imagen_path = None
+            if imagen_path:
+                st.image(imagen_path, width=ANCHO_MINIATURA)
+            else:
+                st.warning("Imagen no disponible")
 
             inventario = imagen_dict["path"].split("/")[1]
             st.markdown(f"**Nº Inv.: {inventario}**")
@@ -82,13 +207,14 @@ def mostrar_imagenes_en_chat(imagenes, query_id, version_app='local', s3_client=
                 }
 
 
-def mostrar_detalle_imagen(cursor, version_app):
+def mostrar_detalle_imagen(version_app, s3_client=None):
     """
     Muestra la vista detallada de una imagen seleccionada desde el estado de Streamlit.
+    La ficha se obtiene de la caché de fichas, así que los re-renderizados no consultan la base de datos.
 
     Args:
-        cursor: Cursor de la base de datos para ejecutar consultas.
-        version_app (str): 'local' o 'aws' para determinar la fuente de la imagen.
+        version_app (str): 'local' o 'aws' para determinar la fuente de la imagen y la base de datos.
+        s3_client (boto3.client, optional): Cliente S3 para descargar la imagen si no está en la caché.
     """
     # Verificamos si hay una imagen seleccionada
     if "vista_detalle" not in st.session_state or not st.session_state.vista_detalle:
@@ -99,20 +225,19 @@ def mostrar_detalle_imagen(cursor, version_app):
     col1, col2 = st.columns([2, 3])  # Dividimos la pantalla en dos columnas
     with col1:
         # Mostrar imagen ampliada
-        imagen_path = obtener_ruta_final(detalle["path"], version_app)
-        st.image(imagen_path, caption="Vista ampliada", use_container_width=True)
+        imagen_path = obtener_ruta_final(detalle["path"], version_app, s3_client=s3_client)
+        if imagen_path:
+            st.image(imagen_path, caption="Vista ampliada", use_container_width=True)
+        else:
+            st.warning("No se pudo cargar la imagen.")
 
     with col2:
-        # Buscar detalles de la obra en la base de datos usando el inventario
-        consulta = f'SELECT * FROM fichas WHERE "Inventario" = \'{detalle["inventario"]}\' LIMIT 1;'
-        resultados = ejecutar_sql(cursor, consulta)
+        # Buscar detalles de la obra usando el inventario (caché de fichas o base de datos)
+        from utils.db_utils import obtener_ficha
+        ficha_dict = obtener_ficha(version_app, detalle["inventario"])
 
         # Verificar si hay resultados
-        if resultados:
-            ficha = resultados[0]
-            columnas = [desc[0] for desc in cursor.description]
-
-            ficha_dict = dict(zip(columnas, ficha))
+        if ficha_dict:
 
             # Orden de campos prioritarios
             orden_prioritario = [
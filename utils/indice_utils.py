@@ -0,0 +1,423 @@
+"""
+Construcción y carga del índice FAISS persistente sobre los textos del Museo Sorolla.
+
+El índice se construye una sola vez (paso de build) y se guarda en disco junto a su docstore,
+versionado por un hash del contenido del corpus y de la configuración del chunker y del modelo.
+En tiempo de ejecución se carga una única vez por proceso y se comparte entre todas las sesiones.
+
+La actualización es incremental: un manifiesto guarda el hash y los IDs de chunk de cada archivo,
+de modo que solo se embeben los archivos nuevos o modificados y se borran los vectores de los eliminados,
+tanto en FAISS como en el namespace de Pinecone.
+
+Uso:
+    python -m utils.indice_utils              # construye o actualiza el índice FAISS
+    python -m utils.indice_utils --forzar     # reconstruye el índice desde cero
+    python -m utils.indice_utils --pinecone   # sincroniza además el índice de Pinecone
+
+LangChain y FAISS se importan dentro de las funciones que los usan, para que importar este módulo no los cargue.
+"""
+import os
+import json
+import shutil
+import pickle
+import hashlib
+import threading
+from utils.embeddings_utils import MODELO_EMBEDDINGS, obtener_embeddings, embed_documents
+
+# Ruta a los textos de Wikipedia y Ministerio de Cultura Museo Sorolla
+TEXT_DIR = os.path.join(os.path.dirname(__file__), "..", "data", "textos")
+# Ruta donde se guardan las versiones del índice FAISS
+INDEX_DIR = os.path.join(os.path.dirname(__file__), "..", "data", "indices", "faiss")
+# Manifiesto de lo que hay subido al namespace de Pinecone
+PINECONE_MANIFEST = os.path.join(os.path.dirname(__file__), "..", "data", "indices", "pinecone_manifest.json")
+PINECONE_INDEX = "textos-sorolla"
+PINECONE_NAMESPACE = "documentos"
+
+# Configuración que forma parte de la clave de versión del índice
+CONFIG_INDICE = {
+    "formato": 1,
+    "modelo": MODELO_EMBEDDINGS,
+    "semantic_search": True,
+    "chunk_size": 500,
+    "chunk_overlap": 60,
+    "separators": ["\n\n", "\n", ".", " "],
+}
+VERSIONES_CONSERVADAS = 2  # Número de versiones antiguas del índice que se mantienen en disco
+
+_indices_cargados = {}  # Índices cargados en este proceso, por clave de versión
+_lock_indices = threading.Lock()
+_indice_pinecone = None  # Handle del índice de Pinecone compartido por el proceso
+_lock_pinecone = threading.Lock()
+
+
+def cargar_documentos(archivos=None):
+    """
+    Carga todos los documentos de texto desde el directorio TEXT_DIR.
+
+    Args:
+        archivos (iterable, optional): Nombres de archivo a cargar. Por defecto, todos los .txt.
+
+    Returns:
+        list: Lista de objetos LC_Document, cada uno con el contenido y metadatos del archivo.
+    """
+    from langchain.docstore.document import Document as LC_Document
+
+    documentos = []
+    # Recorrer todos los archivos .txt en el directorio TEXT_DIR
+    for archivo in sorted(os.listdir(TEXT_DIR)):
+        if archivo.endswith(".txt") and (archivos is None or archivo in archivos):  # Solo procesar archivos .txt
+            ruta_completa = os.path.join(TEXT_DIR, archivo)
+            with open(ruta_completa, "r", encoding="utf-8") as f:
+                texto = f.read()
+                documentos.append(LC_Document(page_content=texto, metadata={"source": archivo}))
+    return documentos
+
+
+def dividir_documentos(documentos, config=CONFIG_INDICE):
+    """
+    Divide los documentos en chunks según la configuración del índice.
+
+    Args:
+        documentos (list): Lista de LC_Document.
+        config (dict, optional): Configuración del chunker. Por defecto CONFIG_INDICE.
+
+    Returns:
+        list: Lista de chunks (LC_Document).
+    """
+    from langchain.text_splitter import RecursiveCharacterTextSplitter, CharacterTextSplitter
+
+    if config["semantic_search"]:
+        splitter = RecursiveCharacterTextSplitter(
+                    chunk_size=config["chunk_size"],
+                    chunk_overlap=config["chunk_overlap"],
+                    separators=config["separators"]  # primero intenta cortar por párrafos, luego frases
+                )
+    else:
+        splitter = CharacterTextSplitter(
+            separator="",            # sin importar saltos de línea
+            chunk_size=700,         # o 1500
+            chunk_overlap=80
+        )
+    return splitter.split_documents(documentos)
+
+
+def hash_corpus(text_dir=TEXT_DIR):
+    """
+    Calcula el hash SHA-256 de cada archivo .txt del corpus.
+
+    Args:
+        text_dir (str, optional): Directorio del corpus. Por defecto TEXT_DIR.
+
+    Returns:
+        dict: Diccionario {nombre_archivo: hash_hex}.
+    """
+    hashes = {}
+    for archivo in sorted(os.listdir(text_dir)):
+        if archivo.endswith(".txt"):
+            with open(os.path.join(text_dir, archivo), "rb") as f:
+                hashes[archivo] = hashlib.sha256(f.read()).hexdigest()
+    return hashes
+
+
+def clave_indice(hashes, config=CONFIG_INDICE):
+    """
+    Obtiene la clave de versión del índice a partir del corpus y la configuración.
+
+    Args:
+        hashes (dict): Hashes por archivo devueltos por hash_corpus.
+        config (dict, optional): Configuración del chunker y del modelo.
+
+    Returns:
+        str: Clave hexadecimal de 16 caracteres.
+    """
+    contenido = json.dumps({"config": config, "archivos": hashes}, sort_keys=True)
+    return hashlib.sha256(contenido.encode("utf-8")).hexdigest()[:16]
+
+
+def _id_chunk(archivo, hash_archivo, i):
+    """
+    ID estable de un chunk: depende del archivo, de su contenido y de la posición del chunk.
+    """
+    prefijo = hashlib.sha256(f"{archivo}:{hash_archivo}".encode("utf-8")).hexdigest()[:16]
+    return f"{prefijo}-{i:04d}"
+
+
+def _chunks_de_archivos(archivos, hashes):
+    """
+    Carga y divide en chunks los archivos indicados, asignando a cada chunk su ID estable.
+
+    Returns:
+        tuple: (lista de chunks, lista de IDs, dict {archivo: {"hash", "chunks"}})
+    """
+    chunks, ids, entradas = [], [], {}
+    for documento in cargar_documentos(archivos):
+        archivo = documento.metadata["source"]
+        chunks_archivo = dividir_documentos([documento])
+        ids_archivo = [_id_chunk(archivo, hashes[archivo], i) for i in range(len(chunks_archivo))]
+        for chunk, id_chunk in zip(chunks_archivo, ids_archivo):
+            chunk.metadata["chunk_id"] = id_chunk
+        chunks.extend(chunks_archivo)
+        ids.extend(ids_archivo)
+        entradas[archivo] = {"hash": hashes[archivo], "chunks": ids_archivo}
+    return chunks, ids, entradas
+
+
+def calcular_cambios(archivos_previos, hashes):
+    """
+    Compara el manifiesto anterior con el estado actual del corpus.
+
+    Args:
+        archivos_previos (dict): {archivo: {"hash", "chunks"}} del manifiesto anterior.
+        hashes (dict): Hashes actuales devueltos por hash_corpus.
+
+    Returns:
+        tuple: (archivos nuevos o modificados, IDs de chunk a borrar)
+    """
+    pendientes = [a for a, h in hashes.items() if a not in archivos_previos or archivos_previos[a]["hash"] != h]
+    ids_borrar = [
+        id_chunk
+        for a, entrada in archivos_previos.items()
+        if a not in hashes or entrada["hash"] != hashes[a]
+        for id_chunk in entrada["chunks"]
+    ]
+    return pendientes, ids_borrar
+
+
+def _leer_manifest(ruta):
+    try:
+        with open(ruta, "r", encoding="utf-8") as f:
+            return json.load(f)
+    except (FileNotFoundError, json.JSONDecodeError):
+        return None
+
+
+def _version_anterior(index_dir):
+    """
+    Devuelve (ruta, manifiesto) de la última versión del índice reutilizable para una actualización incremental.
+    """
+    try:
+        with open(os.path.join(index_dir, "ACTUAL"), "r", encoding="utf-8") as f:
+            clave = f.read().strip()
+    except FileNotFoundError:
+        return None, None
+    ruta = os.path.join(index_dir, clave)
+    manifest = _leer_manifest(os.path.join(ruta, "manifest.json"))
+    # Solo sirve si se construyó con la misma configuración y guarda los IDs de chunk
+    if not manifest or manifest.get("config") != CONFIG_INDICE:
+        return None, None
+    if not all(isinstance(e, dict) for e in manifest["archivos"].values()):
+        return None, None
+    return ruta, manifest
+
+
+def construir_indice(forzar=False, index_dir=INDEX_DIR):
+    """
+    Construye o actualiza el índice FAISS del corpus y lo guarda en disco con su docstore y un manifiesto.
+    Si existe una versión anterior con la misma configuración, solo se embeben los archivos nuevos o
+    modificados y se borran los chunks de los archivos modificados o eliminados.
+
+    Args:
+        forzar (bool, optional): Reconstruir desde cero aunque exista una versión reutilizable. Por defecto False.
+        index_dir (str, optional): Directorio raíz de las versiones del índice.
+
+    Returns:
+        str: Ruta de la carpeta con la versión del índice.
+    """
+    hashes = hash_corpus()
+    clave = clave_indice(hashes)
+    ruta = os.path.join(index_dir, clave)
+    if os.path.exists(os.path.join(ruta, "manifest.json")) and not forzar:
+        return ruta
+
+    from langchain_community.vectorstores import FAISS
+
+    ruta_previa, manifest_previo = (None, None) if forzar else _version_anterior(index_dir)
+    if manifest_previo:
+        # Actualización incremental sobre la versión anterior
+        archivos = {a: e for a, e in manifest_previo["archivos"].items() if a in hashes and e["hash"] == hashes[a]}
+        pendientes, ids_borrar = calcular_cambios(manifest_previo["archivos"], hashes)
+        chunks, ids, entradas = _chunks_de_archivos(pendientes, hashes)
+        vectordb = FAISS.load_local(ruta_previa, obtener_embeddings(), allow_dangerous_deserialization=True)
+        if ids_borrar:
+            vectordb.delete(ids_borrar)
+        if chunks:
+            vectordb.add_documents(chunks, ids=ids)
+        archivos.update(entradas)
+        print(f"Actualización incremental: {len(pendientes)} archivos embebidos, {len(ids_borrar)} chunks borrados")
+    else:
+        chunks, ids, archivos = _chunks_de_archivos(None, hashes)
+        vectordb = FAISS.from_documents(chunks, embedding=obtener_embeddings(), ids=ids)
+
+    # Escribir en una carpeta temporal y renombrar, para no dejar versiones a medias
+    ruta_tmp = ruta + ".tmp"
+    shutil.rmtree(ruta_tmp, ignore_errors=True)
+    vectordb.save_local(ruta_tmp)  # index.faiss + index.pkl (docstore)
+    num_chunks = sum(len(e["chunks"]) for e in archivos.values())
+    manifest = {"clave": clave, "config": CONFIG_INDICE, "archivos": archivos, "num_chunks": num_chunks}
+    with open(os.path.join(ruta_tmp, "manifest.json"), "w", encoding="utf-8") as f:
+        json.dump(manifest, f, ensure_ascii=False, indent=4)
+    shutil.rmtree(ruta, ignore_errors=True)
+    os.replace(ruta_tmp, ruta)
+    with open(os.path.join(index_dir, "ACTUAL"), "w", encoding="utf-8") as f:
+        f.write(clave)
+
+    _limpiar_versiones_antiguas(index_dir, clave)
+    print(f"Índice FAISS guardado en {ruta} ({num_chunks} chunks)")
+    return ruta
+
+
+def version_indice(uso_pinecone=False, index_dir=INDEX_DIR, manifest_path=PINECONE_MANIFEST):
+    """
+    Devuelve la clave del índice que sirve el RAG: la versión ACTUAL del índice FAISS o la del corpus subido
+    a Pinecone según su manifiesto. Cambia cada vez que se reindexa el corpus.
+
+    Returns:
+        str: Clave del índice, o "" si todavía no se ha construido.
+    """
+    if uso_pinecone:
+        manifest = _leer_manifest(manifest_path)
+        if not manifest:
+            return ""
+        return clave_indice({a: e["hash"] for a, e in manifest["archivos"].items()}, config=manifest.get("config"))
+    try:
+        with open(os.path.join(index_dir, "ACTUAL"), "r", encoding="utf-8") as f:
+            return f.read().strip()
+    except FileNotFoundError:
+        return ""
+
+
+def obtener_indice_pinecone():
+    """
+    Devuelve el handle del índice de Pinecone, creando el cliente una sola vez por proceso.
+
+    Returns:
+        pinecone.Index: Índice PINECONE_INDEX.
+    """
+    global _indice_pinecone
+    if _indice_pinecone is None:
+        with _lock_pinecone:
+            if _indice_pinecone is None:
+                from pinecone import Pinecone
+                _indice_pinecone = Pinecone(api_key=os.getenv('PINECONE_API_KEY')).Index(PINECONE_INDEX)
+    return _indice_pinecone
+
+
+def sincronizar_pinecone(forzar=False, manifest_path=PINECONE_MANIFEST, batch_size=100):
+    """
+    Sincroniza el namespace de Pinecone con el corpus: sube los chunks de los archivos nuevos o
+    modificados y borra los vectores de los archivos modificados o eliminados.
+
+    Args:
+        forzar (bool, optional): Vaciar el namespace y subir todo el corpus. Por defecto False.
+        manifest_path (str, optional): Ruta del manifiesto de lo subido a Pinecone.
+        batch_size (int, optional): Número de vectores por petición. Por defecto 100.
+    """
+    index = obtener_indice_pinecone()
+    hashes = hash_corpus()
+    manifest = None if forzar else _leer_manifest(manifest_path)
+
+    if manifest is None or manifest.get("config") != CONFIG_INDICE:
+        # Sin manifiesto no se conocen los IDs subidos: se vacía el namespace y se sube todo
+        index.delete(delete_all=True, namespace=PINECONE_NAMESPACE)
+        archivos_previos = {}
+    else:
+        archivos_previos = manifest["archivos"]
+
+    pendientes, ids_borrar = calcular_cambios(archivos_previos, hashes)
+    for i in range(0, len(ids_borrar), batch_size):
+        index.delete(ids=ids_borrar[i:i + batch_size], namespace=PINECONE_NAMESPACE)
+
+    chunks, ids, entradas = _chunks_de_archivos(pendientes, hashes)
+    vectores = embed_documents([c.page_content for c in chunks])
+    for i in range(0, len(chunks), batch_size):
+        index.upsert(
+            vectors=[
+                {"id": id_chunk, "values": vector, "metadata": {"text": chunk.page_content, "source": chunk.metadata["source"]}}
+                for id_chunk, vector, chunk in zip(ids[i:i + batch_size], vectores[i:i + batch_size], chunks[i:i + batch_size])
+            ],
+            namespace=PINECONE_NAMESPACE,
+        )
+
+    archivos = {a: e for a, e in archivos_previos.items() if a in hashes and e["hash"] == hashes[a]}
+    archivos.update(entradas)
+    os.makedirs(os.path.dirname(manifest_path), exist_ok=True)
+    with open(manifest_path, "w", encoding="utf-8") as f:
+        json.dump({"config": CONFIG_INDICE, "archivos": archivos}, f, ensure_ascii=False, indent=4)
+    print(f"Pinecone sincronizado: {len(pendientes)} archivos subidos, {len(ids_borrar)} vectores borrados")
+
+
+def _limpiar_versiones_antiguas(index_dir, clave_actual):
+    """
+    Elimina las versiones del índice más antiguas, conservando la actual y VERSIONES_CONSERVADAS más.
+    """
+    versiones = [
+        os.path.join(index_dir, d) for d in os.listdir(index_dir)
+        if d != clave_actual and os.path.isdir(os.path.join(index_dir, d)) and not d.endswith(".tmp")
+    ]
+    versiones.sort(key=os.path.getmtime, reverse=True)
+    for ruta in versiones[VERSIONES_CONSERVADAS:]:
+        shutil.rmtree(ruta, ignore_errors=True)
+
+
+def _leer_indice(ruta):
+    """
+    Lee una versión del índice de disco, mapeando en memoria el fichero FAISS si es posible.
+    """
+    import faiss
+    from langchain_community.vectorstores import FAISS
+
+    ruta_faiss = os.path.join(ruta, "index.faiss")
+    try:
+        index = faiss.read_index(ruta_faiss, faiss.IO_FLAG_MMAP | faiss.IO_FLAG_READ_ONLY)
+    except RuntimeError:
+        # Algunos tipos de índice no admiten mmap: se leen completos en memoria
+        index = faiss.read_index(ruta_faiss)
+
+    with open(os.path.join(ruta, "index.pkl"), "rb") as f:
+        docstore, index_to_docstore_id = pickle.load(f)
+
+    return FAISS(
+        embedding_function=obtener_embeddings(),
+        index=index,
+        docstore=docstore,
+        index_to_docstore_id=index_to_docstore_id,
+    )
+
+
+def cargar_indice(index_dir=INDEX_DIR):
+    """
+    Devuelve el vectorstore FAISS de la versión actual del corpus, compartido por todo el proceso.
+    Si la versión no existe en disco, la construye primero.
+
+    Args:
+        index_dir (str, optional): Directorio raíz de las versiones del índice.
+
+    Returns:
+        FAISS: Vectorstore listo para búsqueda.
+    """
+    clave = clave_indice(hash_corpus())
+    vectordb = _indices_cargados.get(clave)
+    if vectordb is not None:
+        return vectordb
+
+    with _lock_indices:
+        # Otra sesión puede haberlo cargado mientras esperábamos el lock
+        if clave not in _indices_cargados:
+            ruta = construir_indice(index_dir=index_dir)
+            _indices_cargados.clear()  # Solo se mantiene en memoria la versión vigente
+            _indices_cargados[clave] = _leer_indice(ruta)
+        return _indices_cargados[clave]
+
+
+if __name__ == "__main__":
+    import argparse
+    from dotenv import load_dotenv
+
+    load_dotenv('./.env')
+    parser = argparse.ArgumentParser(description="Construye o actualiza el índice FAISS persistente del corpus.")
+    parser.add_argument("--forzar", action="store_true", help="Reconstruir desde cero en lugar de actualizar")
+    parser.add_argument("--pinecone", action="store_true", help="Sincronizar también el namespace de Pinecone")
+    args = parser.parse_args()
+    construir_indice(forzar=args.forzar)
+    if args.pinecone:
+        sincronizar_pinecone(forzar=args.forzar)
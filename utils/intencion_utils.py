@@ -0,0 +1,203 @@
+"""
+Clasificador local de intención (SQL, RAG, INTERACCION o NO) para evitar la llamada al LLM.
+
+Es una regresión logística multinomial sobre los embeddings de la consulta, entrenada con las preguntas
+etiquetadas de evaluacion/data/clasificacion_intenciones_museo_sorolla.csv. Solo se usa cuando la
+probabilidad de la clase predicha supera un umbral; en otro caso se recurre al LLM.
+
+Uso:
+    python -m utils.intencion_utils entrenar   # entrena y guarda el modelo
+    python -m utils.intencion_utils evaluar    # validación cruzada frente a la clasificación del LLM
+"""
+import os
+import csv
+import time
+import threading
+import numpy as np
+from utils.embeddings_utils import embed_query, embed_documents
+
+DATASET = os.path.join(os.path.dirname(__file__), "..", "evaluacion", "data", "clasificacion_intenciones_museo_sorolla.csv")
+MODELO_PATH = os.path.join(os.path.dirname(__file__), "..", "data", "modelos", "clasificador_intencion.npz")
+ETIQUETAS = ["INTERACCION", "NO", "RAG", "SQL"]
+UMBRAL_CONFIANZA = 0.85  # Probabilidad mínima para responder sin llamar al LLM
+
+_modelo = None
+_modelo_cargado = False
+_lock_modelo = threading.Lock()
+
+
+def cargar_dataset(ruta=DATASET):
+    """
+    Lee las preguntas etiquetadas del dataset de evaluación.
+
+    Args:
+        ruta (str, optional): Ruta del CSV. Por defecto DATASET.
+
+    Returns:
+        tuple: (lista de preguntas, lista de intenciones, lista de clasificaciones del LLM)
+    """
+    preguntas, intenciones, clasificaciones_llm = [], [], []
+    with open(ruta, "r", encoding="utf-8") as f:
+        for fila in csv.DictReader(f):
+            preguntas.append(fila["pregunta"])
+            intenciones.append(fila["intencion"].strip().upper())
+            clasificaciones_llm.append((fila.get("clasificacion") or "").strip().upper())
+    return preguntas, intenciones, clasificaciones_llm
+
+
+def _normalizar(X):
+    return X / np.maximum(np.linalg.norm(X, axis=1, keepdims=True), 1e-12)
+
+
+def _softmax(Z):
+    Z = Z - Z.max(axis=1, keepdims=True)
+    E = np.exp(Z)
+    return E / E.sum(axis=1, keepdims=True)
+
+
+def _entrenar_softmax(X, y, l2=1e-3, lr=1.0, epocas=800):
+    """
+    Ajusta una regresión logística multinomial con descenso de gradiente.
+    """
+    n, d = X.shape
+    Y = np.eye(len(ETIQUETAS))[y]
+    W = np.zeros((d, len(ETIQUETAS)))
+    b = np.zeros(len(ETIQUETAS))
+    for _ in range(epocas):
+        G = (_softmax(X @ W + b) - Y) / n
+        W -= lr * (X.T @ G + l2 * W)
+        b -= lr * G.sum(axis=0)
+    return W, b
+
+
+def _predecir(modelo, X):
+    P = _softmax(X @ modelo["W"] + modelo["b"])
+    return P.argmax(axis=1), P.max(axis=1)
+
+
+def entrenar(ruta=DATASET, modelo_path=MODELO_PATH):
+    """
+    Entrena el clasificador local con todo el dataset y lo guarda en disco.
+
+    Args:
+        ruta (str, optional): Ruta del CSV de entrenamiento.
+        modelo_path (str, optional): Ruta del fichero .npz del modelo.
+    """
+    global _modelo, _modelo_cargado
+    preguntas, intenciones, _ = cargar_dataset(ruta)
+    X = _normalizar(np.asarray(embed_documents(preguntas), dtype=np.float64))
+    y = np.array([ETIQUETAS.index(i) for i in intenciones])
+    W, b = _entrenar_softmax(X, y)
+
+    os.makedirs(os.path.dirname(modelo_path), exist_ok=True)
+    np.savez(modelo_path, W=W, b=b, etiquetas=np.array(ETIQUETAS))
+    with _lock_modelo:
+        _modelo, _modelo_cargado = None, False  # Forzar la recarga del modelo nuevo
+    print(f"Clasificador de intención entrenado con {len(preguntas)} preguntas y guardado en {modelo_path}")
+
+
+def cargar_clasificador(modelo_path=MODELO_PATH):
+    """
+    Carga el clasificador local una vez por proceso.
+
+    Returns:
+        dict or None: Pesos del modelo, o None si no se ha entrenado todavía.
+    """
+    global _modelo, _modelo_cargado
+    if not _modelo_cargado:
+        with _lock_modelo:
+            if not _modelo_cargado:
+                if os.path.exists(modelo_path):
+                    datos = np.load(modelo_path)
+                    if list(datos["etiquetas"]) == ETIQUETAS:
+                        _modelo = {"W": datos["W"], "b": datos["b"]}
+                else:
+                    print(f"Clasificador de intención local no encontrado en {modelo_path}; se usará solo el LLM.")
+                _modelo_cargado = True
+    return _modelo
+
+
+def clasificar_local(mensaje):
+    """
+    Clasifica la intención de un mensaje con el modelo local.
+
+    Args:
+        mensaje (str): Mensaje del usuario.
+
+    Returns:
+        tuple: (etiqueta, probabilidad), o (None, 0.0) si no hay modelo entrenado.
+    """
+    modelo = cargar_clasificador()
+    if modelo is None:
+        return None, 0.0
+    X = _normalizar(np.asarray([embed_query(mensaje)], dtype=np.float64))
+    idx, prob = _predecir(modelo, X)
+    return ETIQUETAS[idx[0]], float(prob[0])
+
+
+def evaluar(ruta=DATASET, umbrales=(0.5, 0.7, 0.8, 0.85, 0.9, 0.95), k=5, semilla=42):
+    """
+    Evalúa el clasificador local con validación cruzada y lo compara con la clasificación del LLM
+    guardada en el dataset (la misma usada para la matriz de confusión de 1_evaluacion_INTENCION).
+    Para cada umbral muestra el porcentaje de consultas que evitan la llamada a Groq y la precisión
+    del sistema combinado (modelo local si supera el umbral, LLM en otro caso).
+
+    Args:
+        ruta (str, optional): Ruta del CSV de evaluación.
+        umbrales (tuple, optional): Umbrales de confianza a evaluar.
+        k (int, optional): Número de particiones de la validación cruzada. Por defecto 5.
+        semilla (int, optional): Semilla para barajar el dataset.
+    """
+    preguntas, intenciones, clasificaciones_llm = cargar_dataset(ruta)
+    X = _normalizar(np.asarray(embed_documents(preguntas), dtype=np.float64))
+    y = np.array([ETIQUETAS.index(i) for i in intenciones])
+    llm = np.array(clasificaciones_llm)
+    reales = np.array(intenciones)
+
+    # Predicciones fuera de muestra con validación cruzada
+    orden = np.random.default_rng(semilla).permutation(len(y))
+    pred = np.zeros(len(y), dtype=int)
+    prob = np.zeros(len(y))
+    for particion in np.array_split(orden, k):
+        entrenamiento = np.setdiff1d(orden, particion)
+        W, b = _entrenar_softmax(X[entrenamiento], y[entrenamiento])
+        pred[particion], prob[particion] = _predecir({"W": W, "b": b}, X[particion])
+
+    inicio = time.perf_counter()
+    for _ in range(1000):
+        _predecir({"W": W, "b": b}, X[:1])
+    ms_modelo = (time.perf_counter() - inicio)  # 1000 repeticiones -> segundos = ms por consulta
+
+    acc_llm = float(np.mean(llm == reales))
+    acc_local = float(np.mean(pred == y))
+    print(f"Preguntas: {len(y)}  |  validación cruzada de {k} particiones")
+    print(f"Precisión solo LLM: {acc_llm:.3f}")
+    print(f"Precisión solo modelo local: {acc_local:.3f}")
+    print(f"Tiempo del modelo local (sin embedding): {ms_modelo:.3f} ms por consulta\n")
+    print(f"{'umbral':>7} {'sin LLM':>8} {'prec. local':>12} {'prec. combinada':>16} {'delta':>7}")
+    for umbral in umbrales:
+        confiado = prob >= umbral
+        combinada = np.where(confiado, np.array(ETIQUETAS)[pred], llm)
+        acc_comb = float(np.mean(combinada == reales))
+        acc_conf = float(np.mean(pred[confiado] == y[confiado])) if confiado.any() else float("nan")
+        print(f"{umbral:>7.2f} {confiado.mean():>8.1%} {acc_conf:>12.3f} {acc_comb:>16.3f} {acc_comb - acc_llm:>+7.3f}")
+
+    # Matriz de confusión del sistema combinado con el umbral por defecto
+    combinada = np.where(prob >= UMBRAL_CONFIANZA, np.array(ETIQUETAS)[pred], llm)
+    print(f"\nMatriz de confusión (combinada, umbral {UMBRAL_CONFIANZA}); filas reales, columnas predichas:")
+    print(" " * 12 + "".join(f"{e:>12}" for e in ETIQUETAS))
+    for real in ETIQUETAS:
+        fila = [int(np.sum((reales == real) & (combinada == p))) for p in ETIQUETAS]
+        print(f"{real:>12}" + "".join(f"{n:>12}" for n in fila))
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Clasificador local de intención.")
+    parser.add_argument("accion", choices=["entrenar", "evaluar"])
+    args = parser.parse_args()
+    if args.accion == "entrenar":
+        entrenar()
+    else:
+        evaluar()
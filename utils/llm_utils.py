@@ -1,8 +1,10 @@
 import os
 from dotenv import load_dotenv
-from groq import Groq
 import re
 import streamlit as st
+from utils.intencion_utils import clasificar_local, UMBRAL_CONFIANZA
+from utils.sql_utils import reescribir_predicados, validar_sql, formatear_resultados
+from utils.trazas_utils import tramo, registrar_uso
 
 def obtener_contexto_chat(n=2):
     """
@@ -26,19 +28,59 @@ def obtener_contexto_chat(n=2):
     return contexto
 
 
-def clasificar_intencion(client, llm_modelname, mensaje, contexto=""):
+def stream_texto(completion):
     """
-    Clasifica la intención de un mensaje del usuario usando un modelo LLM.
+    Devuelve, a medida que llegan, los fragmentos de texto de una respuesta de Groq en streaming.
+
+    Args:
+        completion: Respuesta de client.chat.completions.create(..., stream=True).
+
+    Yields:
+        str: Fragmento de texto generado.
+    """
+    for chunk in completion:
+        # El último fragmento de Groq trae el uso de tokens en x_groq.usage
+        x_groq = getattr(chunk, "x_groq", None)
+        if x_groq is not None:
+            registrar_uso(getattr(x_groq, "usage", None))
+        if not chunk.choices:
+            continue
+        texto = chunk.choices[0].delta.content
+        if texto:
+            yield texto
+
+
+def clasificar_intencion(client, llm_modelname, mensaje, contexto="", umbral_local=UMBRAL_CONFIANZA, prediccion_local=None):
+    """
+    Clasifica la intención de un mensaje del usuario. Primero prueba con el clasificador local
+    y solo llama al modelo LLM si la confianza no supera el umbral.
 
     Args:
         client: Cliente de Groq.
         llm_modelname (str): Nombre del modelo LLM a utilizar.
         mensaje (str): Mensaje del usuario a clasificar.
         contexto (str, optional): Contexto de la conversación anterior.
+        umbral_local (float, optional): Confianza mínima del clasificador local. None para usar siempre el LLM.
+        prediccion_local (tuple, optional): (etiqueta, probabilidad) del clasificador local si ya se calculó.
 
     Returns:
         str: Una de las categorías "SQL", "RAG", "INTERACCION" o "NO".
     """
+    with tramo("clasificacion") as datos:
+        # El clasificador local no ve el historial, así que solo se usa sin contexto
+        if umbral_local is not None and not contexto:
+            etiqueta, confianza = prediccion_local or clasificar_local(mensaje)
+            if etiqueta and confianza >= umbral_local:
+                datos.update(local=True, confianza=round(confianza, 3))
+                return etiqueta
+        datos["local"] = False
+        return _clasificar_llm(client, llm_modelname, mensaje, contexto)
+
+
+def _clasificar_llm(client, llm_modelname, mensaje, contexto):
+    """
+    Clasifica la intención de un mensaje con el LLM.
+    """
     prompt_clasificador = f"""
         Eres un experto asistente para visitantes del Museo Sorolla. Clasifica esta consulta como:
         - "SQL" si se refiere a datos concretos que puedan estar en una base de datos del museo sorolla (hay colecciones de mobiliario, cartas, escultura, textiles, pintura, fotografia,dibujo, joyeria, ceramica), 
@@ -59,6 +101,7 @@ def clasificar_intencion(client, llm_modelname, mensaje, contexto=""):
         stream=False
     )
 
+    registrar_uso(getattr(completion, "usage", None))
     return completion.choices[0].message.content.strip().upper()
 
 
@@ -74,6 +117,21 @@ def responder_interaccion(client, llm_modelname, mensaje):
     Returns:
         str: Respuesta generada por el asistente.
     """
+    return "".join(responder_interaccion_stream(client, llm_modelname, mensaje)).strip()
+
+
+def responder_interaccion_stream(client, llm_modelname, mensaje):
+    """
+    Versión en streaming de responder_interaccion: devuelve la respuesta token a token.
+
+    Args:
+        client: Cliente de Groq.
+        llm_modelname (str): Nombre del modelo LLM a utilizar.
+        mensaje (str): Mensaje de interacción del usuario.
+
+    Yields:
+        str: Fragmentos de la respuesta generada por el asistente.
+    """
     prompt_interaccion = f"""
         Eres un experto asistente para visitantes del Museo Sorolla. Responde de forma amable y natural a la siguiente interacción del usuario, sin necesidad de buscar información adicional.
 
@@ -91,11 +149,7 @@ def responder_interaccion(client, llm_modelname, mensaje):
         stream=True
     )
 
-    respuesta = ""
-    for chunk in completion:
-        respuesta += chunk.choices[0].delta.content or ""
-
-    return respuesta.strip()
+    yield from stream_texto(completion)
 
 
 def llm_genera_sql(client, llm_modelname, mensaje, contexto=""):
@@ -112,7 +166,7 @@ def llm_genera_sql(client, llm_modelname, mensaje, contexto=""):
         str: Consulta SQL generada.
 
     Raises:
-        ValueError: Si la consulta generada no comienza con 'SELECT'.
+        ValueError: Si la consulta generada no es un único SELECT sobre las tablas y columnas permitidas.
     """
 
     # Preparar el prompt para generar la consulta SQL
@@ -145,9 +199,12 @@ def llm_genera_sql(client, llm_modelname, mensaje, contexto=""):
         - objeto_documento
         - clasificacion_generica
         - fecha_ano
+        - busqueda (tsvector de texto completo sobre titulo, descripcion, clasificacion_razonada e historia_del_objeto)
 
         Ten en cuenta lo siguiente:
-        - La base de datos contiene texto en minúsculas y sin tildes. Usa `ILIKE` con operador % para encontrar coincidencias aproximadas.
+        - La base de datos contiene texto en minúsculas y sin tildes. Usa `ILIKE` con operador % para encontrar coincidencias aproximadas, escribiendo la palabra clave en minúsculas y sin tildes (al menos 3 letras).
+        - No apliques funciones a las columnas (`lower(columna)`, `unaccent(columna)`, `CAST`...): impiden usar los índices.
+        - Para buscar varias palabras o un tema en los campos largos puedes usar `busqueda @@ plainto_tsquery('spanish_unaccent', 'palabras clave')`.
         - Para búsquedas temáticas o de contenido, es mucho más probable que las palabras clave relevantes estén en las columnas `descripcion`, `clasificacion_razonada` y `historia_del_objeto`, incluso si hay otras columnas como `lugar_de_produccion_ceca` o `tecnica` que parezcan relevantes pero no siempre están rellenas. **Prioriza siempre estos campos largos para búsquedas por palabras clave.**
         - Si se menciona un número que no parece una fecha, probablemente se refiere al `inventario`.
         - A menos que el usuario especifique lo contrario, limita los resultados a 10 filas.
@@ -163,26 +220,27 @@ def llm_genera_sql(client, llm_modelname, mensaje, contexto=""):
         """
 
     # Generar la consulta SQL usando el modelo LLM
-    completion = client.chat.completions.create(
-        model=llm_modelname,
-        messages=[{"role": "user", "content": prompt_sql}],
-        temperature=0.0,
-        max_completion_tokens=512,
-        top_p=1,
-        stream=True
-    )
-
-    # Obtener la respuesta de la consulta SQL y comprobar que es válida (solo consultas SELECT)
-    sql_respuesta = ""
-    for chunk in completion:
-        sql_respuesta += chunk.choices[0].delta.content or ""
-
-    if not sql_respuesta.lower().startswith("select"):
-        raise ValueError("La consulta SQL generada no es válida. Debe comenzar con 'SELECT'.")
+    with tramo("generacion_sql"):
+        completion = client.chat.completions.create(
+            model=llm_modelname,
+            messages=[{"role": "user", "content": prompt_sql}],
+            temperature=0.0,
+            max_completion_tokens=512,
+            top_p=1,
+            stream=True
+        )
+
+        # Obtener la respuesta de la consulta SQL y comprobar que es válida.
+        # El SQL no se muestra al usuario y hace falta completo para ejecutarlo, así que aquí se acumula.
+        sql_respuesta = "".join(stream_texto(completion))
+
+    # Filtros de texto en la forma que resuelven los índices de fichas_raw (ver utils.esquema_db)
+    # y validación: un único SELECT sobre tablas y columnas permitidas, con LIMIT
+    sql_respuesta = validar_sql(reescribir_predicados(sql_respuesta))
 
     return sql_respuesta
     
-def llm_sql_respuesta(client, llm_modelname, consulta, sql_respuesta, resultados, contexto_previo=""):
+def llm_sql_respuesta(client, llm_modelname, consulta, sql_respuesta, resultados, contexto_previo="", columnas=None):
     """
     Genera una respuesta explicativa para el usuario basada en los resultados de una consulta SQL.
 
@@ -191,13 +249,38 @@ def llm_sql_respuesta(client, llm_modelname, consulta, sql_respuesta, resultados
         llm_modelname (str): Nombre del modelo LLM a utilizar.
         consulta (str): Pregunta original del usuario.
         sql_respuesta (str): Consulta SQL generada.
-        resultados (str): Resultados obtenidos de la base de datos.
+        resultados (list or str): Filas obtenidas de la base de datos.
         contexto_previo (str, optional): Contexto de la conversación anterior.
+        columnas (list, optional): Nombres de las columnas. Si se indican, los resultados se pasan al prompt
+            como un CSV compacto y acotado (ver formatear_resultados).
 
     Returns:
         str: Respuesta generada por el asistente.
     """
-    prompt_respuesta = prompt_respuesta = f"""
+    return "".join(llm_sql_respuesta_stream(client, llm_modelname, consulta, sql_respuesta, resultados, contexto_previo, columnas)).strip()
+
+
+def llm_sql_respuesta_stream(client, llm_modelname, consulta, sql_respuesta, resultados, contexto_previo="", columnas=None):
+    """
+    Versión en streaming de llm_sql_respuesta: devuelve la explicación token a token.
+
+    Args:
+        client: Cliente de Groq.
+        llm_modelname (str): Nombre del modelo LLM a utilizar.
+        consulta (str): Pregunta original del usuario.
+        sql_respuesta (str): Consulta SQL generada.
+        resultados (list or str): Filas obtenidas de la base de datos.
+        contexto_previo (str, optional): Contexto de la conversación anterior.
+        columnas (list, optional): Nombres de las columnas. Si se indican, los resultados se pasan al prompt
+            como un CSV compacto y acotado (ver formatear_resultados).
+
+    Yields:
+        str: Fragmentos de la respuesta generada por el asistente.
+    """
+    if columnas is not None:
+        resultados = formatear_resultados(columnas, resultados, sql=sql_respuesta)
+
+    prompt_respuesta = f"""
             Eres un asistente del Museo Sorolla. Tu tarea es responder a los visitantes basándote en la información del contexto.
 
             Consulta del usuario: '{consulta}'
@@ -217,10 +300,5 @@ def llm_sql_respuesta(client, llm_modelname, consulta, sql_respuesta, resultados
         stream=True
     )
 
-    print(f"RESULTADOS: {resultados}") # debug
     # Obtener la respuesta generada para la explicación
-    respuesta = ""
-    for chunk in completion:
-        respuesta += chunk.choices[0].delta.content or ""
-    
-    return respuesta.strip()
+    yield from stream_texto(completion)
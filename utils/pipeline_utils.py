@@ -0,0 +1,100 @@
+"""
+Orquestación concurrente de los pasos de una consulta.
+
+`manejar_consulta` ejecutaba la clasificación, la recuperación y la respuesta una detrás de otra. Aquí la
+recuperación de contexto (embedding de la consulta y búsqueda en FAISS/Pinecone) se lanza de forma especulativa
+mientras se clasifica la intención: si la etiqueta es RAG el contexto ya está listo (o casi) al terminar la
+clasificación; si no lo es, el resultado se descarta. Los pasos bloqueantes (Groq, FAISS) se ejecutan en un
+pool de hilos que se puede inyectar, y las funciones no dependen de Streamlit.
+
+Descartar un paso especulativo solo cancela el futuro de asyncio que lo envuelve: si el hilo ya lo había
+empezado, se ejecuta hasta el final (y ocupa su hilo del pool) aunque su resultado no se use. Por eso quien
+llama solo debe especular cuando es probable que se use el resultado.
+"""
+import asyncio
+import functools
+import threading
+import contextvars
+from concurrent.futures import ThreadPoolExecutor
+
+HILOS_PIPELINE = 8  # Hilos del pool compartido para los pasos especulativos
+
+_executor = None
+_lock_executor = threading.Lock()
+
+
+def obtener_executor():
+    """
+    Devuelve el pool de hilos compartido del pipeline, creándolo la primera vez.
+    """
+    global _executor
+    if _executor is None:
+        with _lock_executor:
+            if _executor is None:
+                _executor = ThreadPoolExecutor(max_workers=HILOS_PIPELINE, thread_name_prefix="pipeline")
+    return _executor
+
+
+def _en_executor(executor, funcion, *args, **kwargs):
+    # Se copia el contexto para que los pasos conserven la traza de la consulta (utils.trazas_utils)
+    loop = asyncio.get_running_loop()
+    return loop.run_in_executor(executor, contextvars.copy_context().run, functools.partial(funcion, *args, **kwargs))
+
+
+def _descartar(futuro):
+    """
+    Marca como consumido el resultado de un paso especulativo que no se va a usar (evita avisos de asyncio
+    por excepciones no recogidas). Solo se evita la ejecución si el paso no ha empezado todavía: un paso ya en
+    marcha en el pool no se puede interrumpir y termina igualmente.
+    """
+    if not futuro.cancel():
+        futuro.add_done_callback(lambda f: f.cancelled() or f.exception())
+
+
+async def clasificar_con_especulacion_async(clasificar, especulaciones, executor=None):
+    """
+    Clasifica la intención y, a la vez, ejecuta los pasos especulativos de cada intención.
+
+    Args:
+        clasificar (callable): Función sin argumentos que devuelve la intención ("SQL", "RAG"...).
+        especulaciones (dict): Intención -> función sin argumentos que prepara su paso siguiente
+            (p.e. {"RAG": lambda: recuperar_contexto(consulta)}).
+        executor (Executor, optional): Pool donde se ejecutan los pasos. Por defecto, el del pipeline.
+
+    Returns:
+        tuple: (intención, resultado del paso especulativo de esa intención o None si no tenía).
+    """
+    executor = executor or obtener_executor()
+    tarea_clasificacion = _en_executor(executor, clasificar)
+    tareas = {tipo: _en_executor(executor, funcion) for tipo, funcion in especulaciones.items()}
+
+    try:
+        tipo = await tarea_clasificacion
+    except BaseException:
+        for tarea in tareas.values():
+            _descartar(tarea)
+        raise
+
+    for otro, tarea in tareas.items():
+        if otro != tipo:
+            _descartar(tarea)
+    if tipo not in tareas:
+        return tipo, None
+    return tipo, await tareas[tipo]
+
+
+def clasificar_con_especulacion(clasificar, especulaciones, executor=None):
+    """
+    Versión síncrona de clasificar_con_especulacion_async, para llamarla desde el script de Streamlit.
+
+    Returns:
+        tuple: (intención, resultado del paso especulativo de esa intención o None).
+    """
+    corutina = clasificar_con_especulacion_async(clasificar, especulaciones, executor=executor)
+    try:
+        asyncio.get_running_loop()
+    except RuntimeError:
+        return asyncio.run(corutina)
+    # Ya hay un bucle de eventos en este hilo: se ejecuta en un hilo aparte con su propio bucle
+    with ThreadPoolExecutor(max_workers=1) as hilo:
+        return hilo.submit(asyncio.run, corutina).result()
@@ -1,64 +1,53 @@
 import os
-from langchain_community.vectorstores import FAISS
-from langchain_huggingface import HuggingFaceEmbeddings
-from langchain.text_splitter import RecursiveCharacterTextSplitter, CharacterTextSplitter
-from langchain.docstore.document import Document as LC_Document
-from pinecone import Pinecone
 from dotenv import load_dotenv
+from utils.indice_utils import cargar_indice, obtener_indice_pinecone, PINECONE_NAMESPACE
+from utils.embeddings_utils import embed_query
+from utils.busqueda_hibrida import RecuperadorHibrido, K_DOCUMENTOS
+from utils.llm_utils import stream_texto
+from utils.trazas_utils import tramo
 
 
 load_dotenv('../.env')
 
-# Ruta a los textos de Wikipedia y Ministerio de Cultura Museo Sorolla
-TEXT_DIR = os.path.join(os.path.dirname(__file__), "..", "data", "textos")
-
-def cargar_documentos():
+def construir_retriever(k=K_DOCUMENTOS):
     """
-    Carga todos los documentos de texto desde el directorio TEXT_DIR.
+    Devuelve un retriever híbrido (BM25 + FAISS con fusión RRF) sobre el índice FAISS persistente del corpus.
+    El índice se construye en disco la primera vez y se comparte entre todas las sesiones del proceso.
+
+    Args:
+        k (int, optional): Número de chunks que devuelve cada búsqueda. Por defecto K_DOCUMENTOS.
 
     Returns:
-        list: Lista de objetos LC_Document, cada uno con el contenido y metadatos del archivo.
+        RecuperadorHibrido: Un objeto retriever con método invoke(consulta).
     """
-    documentos = []
-    # Recorrer todos los archivos .txt en el directorio TEXT_DIR
-    for archivo in os.listdir(TEXT_DIR):
-        if archivo.endswith(".txt"):  # Solo procesar archivos .txt
-            ruta_completa = os.path.join(TEXT_DIR, archivo)
-            with open(ruta_completa, "r", encoding="utf-8") as f:
-                texto = f.read()
-                documentos.append(LC_Document(page_content=texto, metadata={"source": archivo}))
-    return documentos
+    vectordb = cargar_indice()
+    return RecuperadorHibrido(vectordb, k=k)
 
-def construir_retriever():
+def recuperar_contexto(consulta, retriever=None):
     """
-    Construye un retriever semántico usando FAISS y HuggingFaceEmbeddings.
+    Recupera el contexto relevante para una consulta usando un retriever local o Pinecone.
+
+    Args:
+        consulta (str): Consulta del usuario.
+        retriever (optional): Retriever local para búsqueda semántica. Si no se proporciona, usa Pinecone.
 
     Returns:
-        BaseRetriever: Un objeto retriever para búsqueda semántica de documentos.
+        str or list: Contexto recuperado (texto unido con FAISS, lista de textos con Pinecone).
     """
-    documentos = cargar_documentos()
-    semantic_search = True  
-    if semantic_search:
-        splitter = RecursiveCharacterTextSplitter(
-                    chunk_size=500,
-                    chunk_overlap=60,
-                    separators=["\n\n", "\n", ".", " "]  # primero intenta cortar por párrafos, luego frases
-                )
-        chunks = splitter.split_documents(documentos)
-
-    else:
-        splitter = CharacterTextSplitter(
-            separator="",            # sin importar saltos de línea
-            chunk_size=700,         # o 1500
-            chunk_overlap=80       
-        )
-
-        chunks = splitter.split_documents(documentos)
-
-    embeddings = HuggingFaceEmbeddings(model_name="sentence-transformers/all-MiniLM-L12-v2")
-    vectordb = FAISS.from_documents(chunks, embedding=embeddings)
-
-    return vectordb.as_retriever()  
+    with tramo("recuperacion", motor="faiss" if retriever else "pinecone") as datos:
+        # version local faiss
+        if retriever:
+            documentos = retriever.invoke(consulta)
+            contexto = "\n\n".join([doc.page_content for doc in documentos])
+            datos["documentos"] = len(documentos)
+        else:
+            # version pinecone
+            index = obtener_indice_pinecone()
+            query_vector = embed_query(consulta)
+            results = index.query(vector=query_vector, top_k=K_DOCUMENTOS, namespace=PINECONE_NAMESPACE, include_metadata=True)
+            contexto = [texto['metadata']['text'] for texto in results['matches']]
+            datos["documentos"] = len(contexto)
+    return contexto
 
 def generar_respuesta_rag(client, llm_modelname, consulta, retriever=None, contexto_anterior=""):
     """
@@ -74,19 +63,24 @@ def generar_respuesta_rag(client, llm_modelname, consulta, retriever=None, conte
     Returns:
         tuple: (respuesta generada por el LLM, contexto utilizado para la respuesta)
     """
-    # version local faiss
-    if retriever:
-        documentos = retriever.invoke(consulta)
-        contexto = "\n\n".join([doc.page_content for doc in documentos[:6]])
-    else:
-        # version pinecone
-        pc = Pinecone(api_key=os.getenv('PINECONE_API_KEY'))
-        index = pc.Index("textos-sorolla")
-        embeddings_model = HuggingFaceEmbeddings(model_name="sentence-transformers/all-MiniLM-L12-v2")
-        query_vector = embeddings_model.embed_query(consulta) 
-        results = index.query(vector=query_vector, top_k=5, namespace="documentos", include_metadata=True)
-        contexto = [texto['metadata']['text'] for texto in results['matches']]
+    contexto = recuperar_contexto(consulta, retriever=retriever)
+    respuesta = "".join(generar_respuesta_rag_stream(client, llm_modelname, consulta, contexto, contexto_anterior))
+    return respuesta.strip(), contexto
+
+def generar_respuesta_rag_stream(client, llm_modelname, consulta, contexto, contexto_anterior=""):
+    """
+    Genera en streaming la respuesta RAG a partir de un contexto ya recuperado.
 
+    Args:
+        client: Cliente Groq.
+        llm_modelname (str): Nombre del modelo LLM a utilizar.
+        consulta (str): Consulta del usuario.
+        contexto (str or list): Contexto devuelto por recuperar_contexto.
+        contexto_anterior (str, optional): Contexto de la conversación anterior.
+
+    Yields:
+        str: Fragmentos de la respuesta generada por el LLM.
+    """
     # Llamar al llm para generar la respuesta
     prompt = f"""
             Eres un asistente del Museo Sorolla. Responde a la siguiente consulta del usuario utilizando solo el contexto proporcionado. Adapta la longitud de la respuesta al tipo de pregunta.
@@ -105,8 +99,4 @@ def generar_respuesta_rag(client, llm_modelname, consulta, retriever=None, conte
         top_p=1,
         stream=True
     )
-    print(f"CONTEXTO: {contexto}") # para depuración
-    respuesta = ""
-    for chunk in completion:
-        respuesta += chunk.choices[0].delta.content or ""
-    return respuesta.strip(), contexto
+    yield from stream_texto(completion)
@@ -0,0 +1,290 @@
+"""
+Registro de los recursos pesados compartidos por todas las sesiones del proceso.
+
+El modelo de embeddings, el índice FAISS (o el handle de Pinecone), el pool de PostgreSQL, los clientes de Groq
+y S3 y las cachés son seguros entre hilos y ocupan memoria o conexiones: se crean una sola vez por proceso y todas
+las sesiones de Streamlit los comparten, de modo que en `st.session_state` solo queda el historial del chat.
+
+Cada recurso se registra con una función que lo crea y se inicializa de forma perezosa la primera vez que se
+pide con `obtener`. `precalentar` los inicializa todos al arrancar el servidor (en segundo plano si se pide),
+y `memoria` informa del tiempo de carga y de la memoria que ocupó cada uno (aumento de la memoria residente del
+proceso durante su creación, aproximado si se cargan varios a la vez).
+
+Uso:
+    python -m utils.recursos --version local   # precalienta los recursos y muestra la memoria de cada uno
+"""
+import os
+import time
+import argparse
+import threading
+
+_recursos = {}  # nombre -> Recurso
+_lock_registro = threading.Lock()
+_precalentado = threading.Event()  # Se activa cuando termina el primer precalentado
+
+
+def memoria_residente():
+    """
+    Devuelve la memoria residente (RSS) actual del proceso en bytes, o None si no se puede medir.
+    """
+    try:
+        with open("/proc/self/statm", "r") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError, IndexError):
+        pass
+    try:
+        import resource
+        import sys
+        # En macOS ru_maxrss está en bytes y en Linux en KB; es el máximo, no el actual
+        maximo = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        return maximo if sys.platform == "darwin" else maximo * 1024
+    except (ImportError, OSError):
+        return None
+
+
+class Recurso:
+    """
+    Objeto compartido que se crea la primera vez que se pide.
+
+    Args:
+        nombre (str): Nombre del recurso en el registro.
+        fabrica (callable): Función sin argumentos que crea el recurso.
+        descripcion (str, optional): Texto para el informe de memoria.
+    """
+
+    def __init__(self, nombre, fabrica, descripcion=""):
+        self.nombre = nombre
+        self.fabrica = fabrica
+        self.descripcion = descripcion
+        self.valor = None
+        self.cargado = False
+        self.segundos_carga = None
+        self.memoria_bytes = None
+        self.error = None
+        self._lock = threading.Lock()
+
+    def obtener(self):
+        """
+        Devuelve el recurso, creándolo si es la primera vez. Las sesiones que lo piden mientras se crea esperan.
+        """
+        if not self.cargado:
+            with self._lock:
+                if not self.cargado:
+                    rss_antes = memoria_residente()
+                    inicio = time.perf_counter()
+                    try:
+                        self.valor = self.fabrica()
+                    except Exception as e:
+                        self.error = f"{type(e).__name__}: {e}"
+                        raise
+                    self.segundos_carga = time.perf_counter() - inicio
+                    rss_despues = memoria_residente()
+                    if rss_antes is not None and rss_despues is not None:
+                        self.memoria_bytes = max(rss_despues - rss_antes, 0)
+                    self.error = None
+                    self.cargado = True
+        return self.valor
+
+    def info(self):
+        return {
+            "descripcion": self.descripcion,
+            "cargado": self.cargado,
+            "segundos_carga": self.segundos_carga,
+            "memoria_bytes": self.memoria_bytes,
+            "error": self.error,
+        }
+
+
+def registrar(nombre, fabrica, descripcion=""):
+    """
+    Registra un recurso compartido. Si ya estaba registrado se conserva el existente, para que las
+    reejecuciones del script de Streamlit no lo vuelvan a crear.
+
+    Args:
+        nombre (str): Nombre del recurso.
+        fabrica (callable): Función sin argumentos que crea el recurso.
+        descripcion (str, optional): Texto para el informe de memoria.
+
+    Returns:
+        Recurso: Recurso registrado.
+    """
+    with _lock_registro:
+        if nombre not in _recursos:
+            _recursos[nombre] = Recurso(nombre, fabrica, descripcion)
+        return _recursos[nombre]
+
+
+def obtener(nombre):
+    """
+    Devuelve el recurso compartido `nombre`, creándolo la primera vez.
+
+    Raises:
+        KeyError: Si el recurso no está registrado.
+    """
+    try:
+        recurso = _recursos[nombre]
+    except KeyError:
+        raise KeyError(f"Recurso no registrado: {nombre}") from None
+    return recurso.obtener()
+
+
+def registrados():
+    return list(_recursos)
+
+
+def precalentar(nombres=None, en_segundo_plano=False):
+    """
+    Crea los recursos registrados antes de que lleguen las consultas, uno detrás de otro para que la medida de
+    memoria de cada uno sea fiable. Los errores se registran y no interrumpen el resto.
+
+    Args:
+        nombres (list, optional): Recursos a precalentar. Por defecto, todos los registrados.
+        en_segundo_plano (bool, optional): Precalentar en un hilo aparte y devolverlo. Por defecto False.
+
+    Returns:
+        dict or threading.Thread: Segundos de carga de cada recurso (None si falló), o el hilo si es en segundo plano.
+    """
+    nombres = list(nombres) if nombres is not None else registrados()
+
+    def _precalentar():
+        tiempos = {}
+        for nombre in nombres:
+            try:
+                obtener(nombre)
+                tiempos[nombre] = _recursos[nombre].segundos_carga
+            except Exception as e:
+                print(f"No se pudo precalentar el recurso {nombre}: {e}")
+                tiempos[nombre] = None
+        _precalentado.set()
+        return tiempos
+
+    if en_segundo_plano:
+        hilo = threading.Thread(target=_precalentar, daemon=True, name="precalentado")
+        hilo.start()
+        return hilo
+    return _precalentar()
+
+
+def listo():
+    """
+    Indica si ha terminado el precalentado de los recursos (con o sin errores), para las sondas de disponibilidad.
+    """
+    return _precalentado.is_set()
+
+
+def memoria():
+    """
+    Devuelve el estado de los recursos registrados y la memoria residente del proceso.
+
+    Returns:
+        dict: {"rss_bytes": int, "recursos": {nombre: {cargado, segundos_carga, memoria_bytes, error, ...}}}
+    """
+    return {
+        "rss_bytes": memoria_residente(),
+        "recursos": {nombre: recurso.info() for nombre, recurso in _recursos.items()},
+    }
+
+
+def registrar_recursos_app(version_app, uso_pinecone=False, precarga_fichas=False):
+    """
+    Registra los recursos que usa app.py. Los módulos se importan dentro de cada fábrica, de modo que solo
+    se cargan las dependencias de los recursos que realmente se piden.
+
+    Args:
+        version_app (str): 'local' o 'aws'.
+        uso_pinecone (bool, optional): Usar Pinecone en lugar del índice FAISS local. Por defecto False.
+        precarga_fichas (bool, optional): Cargar todas las fichas en memoria al precalentar. Por defecto False.
+    """
+    def groq():
+        from groq import Groq
+        return Groq(api_key=os.getenv("GROQ_API_KEY"))
+
+    def s3():
+        import boto3
+        return boto3.client('s3')
+
+    def modelo_embeddings():
+        from utils.embeddings_utils import obtener_modelo
+        return obtener_modelo()
+
+    def retriever():
+        from utils.rag_utils import construir_retriever
+        return construir_retriever()
+
+    def indice_pinecone():
+        from utils.indice_utils import obtener_indice_pinecone
+        return obtener_indice_pinecone()
+
+    def clasificador_intencion():
+        from utils.intencion_utils import cargar_clasificador
+        return cargar_clasificador()
+
+    def cache_respuestas():
+        from utils.cache_utils import CacheRespuestas
+        from utils.sql_utils import version_datos
+        from utils.indice_utils import version_indice
+        return CacheRespuestas(versiones={
+            "SQL": lambda: version_datos(version_app),
+            "RAG": lambda: version_indice(uso_pinecone=uso_pinecone),
+        })
+
+    def reranker():
+        from utils.busqueda_hibrida import obtener_reranker
+        return obtener_reranker()
+
+    def pool_db():
+        from utils.db_utils import obtener_pool
+        return obtener_pool(version_app)
+
+    def fichas():
+        from utils.db_utils import precargar_fichas
+        return precargar_fichas(version_app)
+
+    registrar("groq", groq, "Cliente de Groq")
+    registrar("s3", s3, "Cliente de S3")
+    registrar("modelo_embeddings", modelo_embeddings, "Modelo de embeddings (sentence-transformers)")
+    if uso_pinecone:
+        registrar("indice_pinecone", indice_pinecone, "Handle del índice de Pinecone")
+    else:
+        registrar("retriever", retriever, "Índice FAISS, BM25 y retriever híbrido")
+        from utils.busqueda_hibrida import RERANKER_ACTIVO
+        if RERANKER_ACTIVO:
+            registrar("reranker", reranker, "Cross-encoder para reordenar los chunks")
+    registrar("clasificador_intencion", clasificador_intencion, "Clasificador local de intención")
+    registrar("cache_respuestas", cache_respuestas, "Caché semántica de respuestas")
+    registrar(f"pool_db_{version_app}", pool_db, f"Pool de conexiones a PostgreSQL ({version_app})")
+    if precarga_fichas:
+        registrar(f"fichas_{version_app}", fichas, "Fichas del catálogo precargadas")
+
+
+def _mb(valor):
+    return f"{valor / 1024 ** 2:8.1f}" if valor is not None else "       -"
+
+
+def informe_memoria():
+    """
+    Devuelve una tabla de texto con el tiempo de carga, la memoria y el estado de cada recurso.
+    """
+    estado = memoria()
+    lineas = [f"{'recurso':<24} {'segundos':>9} {'MB':>8}  estado"]
+    for nombre, info in estado["recursos"].items():
+        segundos = f"{info['segundos_carga']:9.2f}" if info["segundos_carga"] is not None else "        -"
+        situacion = info["error"] or ("ok" if info["cargado"] else "pendiente")
+        lineas.append(f"{nombre:<24} {segundos} {_mb(info['memoria_bytes'])}  {situacion}")
+    lineas.append(f"Memoria residente del proceso: {_mb(estado['rss_bytes']).strip()} MB")
+    return "\n".join(lineas)
+
+
+if __name__ == "__main__":
+    from dotenv import load_dotenv
+
+    parser = argparse.ArgumentParser(description="Precalienta los recursos compartidos y muestra su memoria.")
+    parser.add_argument("--version", default="local", choices=["local", "aws"], help="Versión de la app")
+    parser.add_argument("--pinecone", action="store_true", help="Usar Pinecone en lugar de FAISS")
+    parser.add_argument("--precarga-fichas", action="store_true", help="Precargar las fichas del catálogo")
+    args = parser.parse_args()
+
+    load_dotenv('./.env')
+    registrar_recursos_app(args.version, uso_pinecone=args.pinecone, precarga_fichas=args.precarga_fichas)
+    precalentar()
+    print(informe_memoria())
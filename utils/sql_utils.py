@@ -0,0 +1,509 @@
+"""
+Utilidades sobre las consultas SQL que genera el LLM para la tabla `fichas_raw`.
+
+`reescribir_predicados` deja los filtros de texto en una forma que pueden resolver los índices de
+utils.esquema_db: los textos de la tabla ya están en minúsculas y sin tildes, así que se quitan las llamadas
+a lower()/unaccent() sobre las columnas (que impiden usar los índices de trigramas) y se normalizan los
+literales de LIKE/ILIKE/= para que coincidan con los datos.
+
+`validar_sql` es la barrera entre el SQL generado y la base de datos: analiza la sentencia token a token y solo
+admite un único SELECT sobre las tablas y columnas permitidas, con funciones de una lista cerrada y sin textos que
+contengan SQL como argumento; añade o acota el LIMIT.
+`ejecutar_sql_seguro` la ejecuta en una transacción de solo lectura con statement_timeout y un cursor de servidor
+que no trae más de un número máximo de filas.
+
+`ejecutar_sql_cacheado` añade delante una caché de resultados por SQL canónico, compartida por el proceso e
+invalidada cuando una carga nueva de fichas (utils.carga_fichas) cambia la versión de los datos.
+
+psycopg2 y utils.db_utils solo se importan dentro de las funciones que van a la base de datos, de modo que la
+validación y el formato de resultados no cargan el driver.
+"""
+import re
+import uuid
+import threading
+from utils.carga_fichas import COLUMNAS, SIN_NORMALIZAR, normalizar_texto
+from utils.cache_utils import CacheResultadosSQL
+from utils.trazas_utils import tramo
+
+# Columnas guardadas en minúsculas y sin tildes
+COLUMNAS_TEXTO = {c for c in COLUMNAS if c not in SIN_NORMALIZAR and c != "fecha_ano"}
+
+_LITERAL = r"'((?:[^']|'')*)'"
+_RE_FUNCION_COLUMNA = re.compile(r"\b(?:lower|unaccent)\s*\(\s*((?:\w+\.)?(\w+))\s*\)", re.IGNORECASE)
+_RE_FUNCION_LITERAL = re.compile(r"\b(?:lower|unaccent)\s*\(\s*" + _LITERAL + r"\s*\)", re.IGNORECASE)
+_RE_PREDICADO = re.compile(
+    r"\b((?:\w+\.)?(\w+))\s*(NOT\s+)?(I?LIKE|=)\s*" + _LITERAL, re.IGNORECASE
+)
+
+
+def _literal_normalizado(literal):
+    return "'" + normalizar_texto(literal.replace("''", "'")).replace("'", "''") + "'"
+
+
+def reescribir_predicados(sql):
+    """
+    Reescribe los filtros de texto de una consulta para que usen los índices de fichas_raw.
+
+    - `lower(col)` / `unaccent(col)` -> `col` en las columnas de texto normalizado.
+    - `lower('Texto')` / `unaccent('Texto')` -> `'texto'`.
+    - `col LIKE 'Jávea%'` -> `col ILIKE 'javea%'`, y `col = 'Óleo'` -> `col = 'oleo'`.
+
+    Args:
+        sql (str): Consulta SQL generada.
+
+    Returns:
+        str: Consulta equivalente sobre los datos normalizados.
+    """
+    def quitar_funcion(m):
+        return m.group(1) if m.group(2).lower() in COLUMNAS_TEXTO else m.group(0)
+
+    anterior = None
+    while anterior != sql:  # Funciones anidadas: lower(unaccent(col))
+        anterior = sql
+        sql = _RE_FUNCION_COLUMNA.sub(quitar_funcion, sql)
+    sql = _RE_FUNCION_LITERAL.sub(lambda m: _literal_normalizado(m.group(1)), sql)
+
+    def normalizar_predicado(m):
+        columna, nombre, negacion, operador, literal = m.groups()
+        if nombre.lower() not in COLUMNAS_TEXTO:
+            return m.group(0)
+        operador = "=" if operador == "=" else "ILIKE"
+        if negacion and operador == "=":
+            return m.group(0)
+        return f"{columna} {negacion or ''}{operador} {_literal_normalizado(literal)}"
+
+    return _RE_PREDICADO.sub(normalizar_predicado, sql)
+
+
+# Barrera de seguridad del SQL generado
+TABLAS_PERMITIDAS = {"fichas_raw"}
+COLUMNAS_PERMITIDAS = set(COLUMNAS) | {"busqueda"}
+LIMITE_POR_DEFECTO = 100  # LIMIT que se añade si la consulta no lo tiene
+LIMITE_MAXIMO = 500  # LIMIT máximo permitido
+TIMEOUT_MS = 5000  # statement_timeout de cada consulta generada
+MAX_FILAS = 500  # Filas que se traen como máximo del cursor de servidor
+
+_PALABRAS_PROHIBIDAS = {
+    "insert", "update", "delete", "merge", "drop", "create", "alter", "truncate", "grant", "revoke", "copy",
+    "into", "lock", "vacuum", "analyze", "call", "do", "execute", "prepare", "deallocate", "set", "reset",
+    "listen", "notify", "unlisten", "refresh", "comment", "cluster", "reindex", "discard", "declare", "fetch",
+    "with", "begin", "commit", "rollback", "savepoint", "show", "import", "security",
+}
+# Funciones escalares, de agregación y de ventana admitidas. Cualquier otra (ts_stat, query_to_xml, dblink...)
+# se rechaza, porque algunas ejecutan el SQL que reciben como texto y saltarían la lista de tablas permitidas.
+_FUNCIONES_PERMITIDAS = {
+    # Agregación y ventana
+    "count", "sum", "avg", "min", "max", "string_agg", "array_agg", "bool_and", "bool_or", "every",
+    "row_number", "rank", "dense_rank", "percent_rank", "cume_dist", "ntile", "lag", "lead",
+    "first_value", "last_value",
+    # Texto
+    "lower", "upper", "initcap", "unaccent", "trim", "btrim", "ltrim", "rtrim", "length", "char_length",
+    "substring", "substr", "left", "right", "replace", "concat", "concat_ws", "position", "strpos", "split_part",
+    "lpad", "rpad", "reverse", "regexp_replace", "regexp_match", "regexp_matches", "similarity", "word_similarity",
+    # Números y fechas
+    "abs", "round", "floor", "ceil", "ceiling", "trunc", "mod", "power", "sqrt", "extract", "date_part",
+    "date_trunc", "now", "age", "make_date", "to_char", "to_number", "to_date",
+    # Condicionales
+    "coalesce", "nullif", "greatest", "least",
+    # Texto completo
+    "to_tsvector", "to_tsquery", "plainto_tsquery", "phraseto_tsquery", "websearch_to_tsquery",
+    "ts_rank", "ts_rank_cd", "ts_headline",
+}
+# Literal que parece una sentencia SQL (argumento de una función que la ejecutaría)
+_RE_SQL_EN_TEXTO = re.compile(
+    r"\b(select|insert|update|delete|merge|table|values|execute|copy|call)\b", re.IGNORECASE
+)
+_PALABRAS_CLAVE = {
+    "select", "distinct", "on", "from", "where", "and", "or", "not", "in", "is", "null", "like", "ilike", "similar",
+    "to", "between", "group", "by", "order", "asc", "desc", "nulls", "first", "last", "limit", "offset", "having",
+    "as", "case", "when", "then", "else", "end", "join", "inner", "left", "right", "full", "outer", "cross", "using",
+    "union", "all", "intersect", "except", "exists", "any", "some", "true", "false", "cast", "interval", "filter",
+    "over", "partition", "rows", "range", "preceding", "following", "unbounded", "current", "row", "escape",
+    "lateral", "natural", "integer", "int", "bigint", "smallint", "numeric", "decimal", "real", "double",
+    "precision", "float", "text", "varchar", "char", "character", "varying", "boolean", "date", "timestamp",
+    "tsvector", "tsquery", "regconfig", "for",
+    # Campos de EXTRACT/date_part y calificadores de TRIM
+    "year", "month", "day", "hour", "minute", "second", "century", "decade", "millennium", "quarter", "week",
+    "dow", "doy", "epoch", "both", "leading", "trailing",
+}
+# Posiciones tras las que un identificador desconocido es un alias implícito (`COUNT(*) total`, `fichas_raw f`)
+_FIN_EXPRESION = {"ident", "cadena", "numero", "cierre"}
+
+_RE_TOKEN = re.compile(r"""
+      (?P<espacio>\s+)
+    | (?P<comentario>--[^\n]*|/\*.*?\*/)
+    | (?P<cadena>'(?:[^']|'')*')
+    | (?P<citado>"(?:[^"]|"")+")
+    | (?P<numero>\d+(?:\.\d+)?)
+    | (?P<ident>[A-Za-z_][A-Za-z0-9_$]*)
+    | (?P<op>::|<=|>=|<>|!=|\|\||@@|[-+*/%=<>~!^])
+    | (?P<punt>[(),.;])
+""", re.VERBOSE | re.DOTALL)
+
+
+def tokenizar(sql):
+    """
+    Divide una sentencia SQL en tokens (tipo, texto), descartando espacios y comentarios.
+
+    Raises:
+        ValueError: Si aparece un carácter que no forma parte de ningún token admitido (p.e. `$$`).
+    """
+    tokens, pos = [], 0
+    while pos < len(sql):
+        m = _RE_TOKEN.match(sql, pos)
+        if m is None:
+            raise ValueError(f"Carácter no permitido en la consulta SQL: {sql[pos]!r}")
+        tipo = m.lastgroup
+        if tipo not in ("espacio", "comentario"):
+            texto = m.group(0)
+            if tipo == "ident":
+                texto = texto.lower()
+            elif tipo == "punt":
+                tipo = {"(": "apertura", ")": "cierre"}.get(texto, "punt")
+            tokens.append((tipo, texto))
+        pos = m.end()
+    return tokens
+
+
+def _unir(tokens):
+    """
+    Reconstruye la sentencia a partir de los tokens con un espaciado canónico.
+    """
+    partes = []
+    for i, (tipo, texto) in enumerate(tokens):
+        anterior = tokens[i - 1] if i else None
+        pegado = anterior is not None and (
+            texto in (",", ")", ".") or anterior[1] in ("(", ".", "::") or texto == "::"
+            or (texto == "(" and anterior[0] == "ident" and anterior[1] not in _PALABRAS_CLAVE)
+        )
+        partes.append(texto if pegado or not partes else " " + texto)
+    return "".join(partes)
+
+
+def _es_palabra(token, *palabras):
+    return token[0] == "ident" and token[1] in palabras
+
+
+def validar_sql(sql, limite_defecto=LIMITE_POR_DEFECTO, limite_maximo=LIMITE_MAXIMO):
+    """
+    Comprueba que el SQL generado es un único SELECT de solo lectura sobre tablas y columnas permitidas
+    y le añade (o acota) el LIMIT.
+
+    Args:
+        sql (str): Consulta SQL generada por el LLM.
+        limite_defecto (int, optional): LIMIT que se añade si no hay ninguno. Por defecto LIMITE_POR_DEFECTO.
+        limite_maximo (int, optional): LIMIT máximo. Por defecto LIMITE_MAXIMO.
+
+    Returns:
+        str: Consulta validada, con espaciado canónico y LIMIT.
+
+    Raises:
+        ValueError: Si la consulta no cumple alguna de las reglas.
+    """
+    tokens = tokenizar(sql.strip())
+    while tokens and tokens[-1] == ("punt", ";"):
+        tokens.pop()
+    if not tokens or not _es_palabra(tokens[0], "select"):
+        raise ValueError("La consulta SQL generada no es válida. Debe comenzar con 'SELECT'.")
+    if ("punt", ";") in tokens:
+        raise ValueError("Solo se permite una sentencia SQL.")
+
+    # Primera pasada: palabras y funciones prohibidas, tablas y alias
+    alias = set()
+    profundidad = 0
+    for i, (tipo, texto) in enumerate(tokens):
+        siguiente = tokens[i + 1] if i + 1 < len(tokens) else (None, None)
+        anterior = tokens[i - 1] if i else (None, None)
+        if tipo == "apertura":
+            profundidad += 1
+        elif tipo == "cierre":
+            profundidad -= 1
+            if profundidad < 0:
+                raise ValueError("Paréntesis desequilibrados en la consulta SQL.")
+        elif tipo == "citado":
+            raise ValueError("No se permiten identificadores entre comillas dobles.")
+        elif tipo == "cadena" and _en_llamada_funcion(tokens, i) and _RE_SQL_EN_TEXTO.search(texto):
+            raise ValueError("No se permiten sentencias SQL como texto en los argumentos de una función.")
+        elif tipo == "ident":
+            if texto in _PALABRAS_PROHIBIDAS:
+                raise ValueError(f"Instrucción no permitida en la consulta SQL: {texto.upper()}")
+            if texto == "for" and (profundidad == 0 or siguiente[1] in ("update", "share", "no", "key")):
+                # FOR solo se admite dentro de funciones (`substring(col from 1 for 4)`), no FOR UPDATE/SHARE
+                raise ValueError("Instrucción no permitida en la consulta SQL: FOR")
+            if (siguiente[0] == "apertura" and texto not in _PALABRAS_CLAVE and anterior[1] != "::"
+                    and texto not in _FUNCIONES_PERMITIDAS):
+                raise ValueError(f"Función no permitida en la consulta SQL: {texto}")
+            if anterior[1] == "as" or (
+                anterior[0] in _FIN_EXPRESION and anterior[1] not in _PALABRAS_CLAVE
+                and texto not in _PALABRAS_CLAVE and siguiente[1] not in ("(", ".")
+                and texto not in COLUMNAS_PERMITIDAS
+            ):
+                alias.add(texto)
+            if anterior[1] in ("from", "join", ",") and _es_tabla(tokens, i):
+                nombre = texto
+                if siguiente[1] == ".":
+                    if texto != "public":
+                        raise ValueError(f"Esquema no permitido en la consulta SQL: {texto}")
+                    nombre = tokens[i + 2][1] if i + 2 < len(tokens) else ""
+                if nombre not in TABLAS_PERMITIDAS:
+                    raise ValueError(f"Tabla no permitida en la consulta SQL: {nombre}")
+    if profundidad != 0:
+        raise ValueError("Paréntesis desequilibrados en la consulta SQL.")
+
+    # Segunda pasada: todo identificador es palabra clave, función, tabla, alias o columna permitida
+    for i, (tipo, texto) in enumerate(tokens):
+        if tipo != "ident":
+            continue
+        siguiente = tokens[i + 1] if i + 1 < len(tokens) else (None, None)
+        anterior = tokens[i - 1] if i else (None, None)
+        if (texto in _PALABRAS_CLAVE or texto in alias or texto in TABLAS_PERMITIDAS or texto == "public"
+                or siguiente[1] == "(" or anterior[1] == "::"):
+            continue
+        if texto not in COLUMNAS_PERMITIDAS:
+            raise ValueError(f"Columna no permitida en la consulta SQL: {texto}")
+
+    return _unir(_acotar_limite(tokens, limite_defecto, limite_maximo))
+
+
+def _en_llamada_funcion(tokens, i):
+    """
+    Indica si el token i está entre los paréntesis de una llamada a función (`extract(year from fecha)`),
+    y no en una subconsulta o una lista (`IN (...)`, `EXISTS (...)`).
+    """
+    profundidad = 0
+    for j in range(i - 1, -1, -1):
+        tipo = tokens[j][0]
+        if tipo == "cierre":
+            profundidad += 1
+        elif tipo == "apertura":
+            if profundidad == 0:
+                return j > 0 and tokens[j - 1][0] == "ident" and tokens[j - 1][1] not in _PALABRAS_CLAVE
+            profundidad -= 1
+    return False
+
+
+def _es_tabla(tokens, i):
+    """
+    Indica si el identificador i está en posición de tabla: tras FROM/JOIN, o tras una coma dentro de un FROM.
+    El FROM de las funciones (`extract(year from now())`, `substring(col from 1)`) no introduce tablas.
+    """
+    if _en_llamada_funcion(tokens, i):
+        return False
+    if tokens[i - 1][1] != ",":
+        return True
+    profundidad = 0
+    for j in range(i - 1, -1, -1):
+        tipo, texto = tokens[j]
+        if tipo == "cierre":
+            profundidad += 1
+        elif tipo == "apertura":
+            if profundidad == 0:
+                return False
+            profundidad -= 1
+        elif profundidad == 0 and tipo == "ident" and texto in ("select", "where", "group", "order", "having", "on"):
+            return False
+        elif profundidad == 0 and _es_palabra(tokens[j], "from", "join"):
+            return True
+    return False
+
+
+def _acotar_limite(tokens, limite_defecto, limite_maximo):
+    """
+    Añade LIMIT al nivel superior de la consulta si no lo tiene, o lo acota a limite_maximo.
+    """
+    profundidad = 0
+    for i, (tipo, texto) in enumerate(tokens):
+        if tipo == "apertura":
+            profundidad += 1
+        elif tipo == "cierre":
+            profundidad -= 1
+        elif profundidad == 0 and _es_palabra((tipo, texto), "limit"):
+            valor = tokens[i + 1] if i + 1 < len(tokens) else (None, None)
+            if valor[0] == "apertura" and tokens[i + 2:i + 4] and tokens[i + 2][0] == "numero" and tokens[i + 3:i + 4] == [("cierre", ")")]:
+                tokens, valor = tokens[:i + 1] + [tokens[i + 2]] + tokens[i + 4:], tokens[i + 2]  # LIMIT (10)
+            if valor[0] == "numero" and "." not in valor[1] and int(valor[1]) <= limite_maximo:
+                return tokens
+            # LIMIT ALL, expresiones o valores por encima del máximo
+            fin = i + 2
+            if valor[0] == "apertura":
+                nivel = 0
+                for fin in range(i + 1, len(tokens)):
+                    nivel += {"apertura": 1, "cierre": -1}.get(tokens[fin][0], 0)
+                    if nivel == 0:
+                        break
+                fin += 1
+            return tokens[:i + 1] + [("numero", str(limite_maximo))] + tokens[fin:]
+    return tokens + [("ident", "limit"), ("numero", str(limite_defecto))]
+
+
+def ejecutar_sql_seguro(conn, sql, timeout_ms=TIMEOUT_MS, max_filas=MAX_FILAS):
+    """
+    Valida y ejecuta una consulta generada en una transacción de solo lectura con tiempo máximo,
+    leyendo con un cursor de servidor como mucho max_filas filas.
+
+    Args:
+        conn (psycopg2.connection): Conexión prestada del pool.
+        sql (str): Consulta SQL generada.
+        timeout_ms (int, optional): statement_timeout en milisegundos. Por defecto TIMEOUT_MS.
+        max_filas (int, optional): Número máximo de filas leídas. Por defecto MAX_FILAS.
+
+    Returns:
+        tuple: (lista de nombres de columna, lista de filas)
+
+    Raises:
+        ValueError: Si la consulta no supera la validación.
+        TimeoutError: Si la consulta supera timeout_ms.
+    """
+    import psycopg2.errors
+
+    sql = validar_sql(sql)
+    try:
+        with conn.cursor() as cursor:
+            cursor.execute("SET TRANSACTION READ ONLY")
+            cursor.execute("SELECT set_config('statement_timeout', %s, true)", (str(int(timeout_ms)),))
+        with conn.cursor(name=f"consulta_{uuid.uuid4().hex}") as cursor:
+            cursor.itersize = max_filas
+            cursor.execute(sql)
+            filas = cursor.fetchmany(max_filas)
+            columnas = [desc[0] for desc in cursor.description]
+        return columnas, filas
+    except psycopg2.errors.QueryCanceled:
+        raise TimeoutError(f"La consulta SQL ha superado el tiempo máximo de {timeout_ms} ms.")
+    finally:
+        conn.rollback()  # Cierra la transacción y el cursor de servidor antes de devolver la conexión
+
+
+# Caché de resultados de las consultas generadas
+_caches_sql = {}
+_lock_caches_sql = threading.Lock()
+
+
+def canonizar_sql(sql):
+    """
+    Forma canónica de una consulta: predicados y literales normalizados, espaciado y mayúsculas uniformes y LIMIT
+    explícito. Dos consultas con la misma forma canónica devuelven el mismo resultado.
+    """
+    return validar_sql(reescribir_predicados(sql))
+
+
+def version_datos(version_app):
+    """
+    Versión de los datos de fichas_raw: el identificador de la última carga registrada en cargas_fichas.
+    """
+    import psycopg2.errors
+    from utils.db_utils import conexion
+
+    with conexion(version_app) as conn:
+        with conn.cursor() as cursor:
+            try:
+                cursor.execute("SELECT coalesce(max(id), 0) FROM cargas_fichas")
+            except psycopg2.errors.UndefinedTable:
+                return 0
+            return cursor.fetchone()[0]
+
+
+def obtener_cache_sql(version_app):
+    """
+    Devuelve la caché de resultados SQL del proceso para la versión de la app, creándola la primera vez.
+    """
+    if version_app not in _caches_sql:
+        with _lock_caches_sql:
+            if version_app not in _caches_sql:
+                _caches_sql[version_app] = CacheResultadosSQL(lambda: version_datos(version_app))
+    return _caches_sql[version_app]
+
+
+def invalidar_cache_sql():
+    """
+    Vacía las cachés de resultados SQL del proceso.
+    """
+    for cache in list(_caches_sql.values()):
+        cache.invalidar()
+
+
+def ejecutar_sql_cacheado(version_app, sql):
+    """
+    Ejecuta una consulta generada con ejecutar_sql_seguro, reutilizando el resultado si la misma consulta
+    canónica se ejecutó hace poco. Solo se toma una conexión del pool cuando hay que ir a la base de datos.
+
+    Args:
+        version_app (str): 'local' o 'aws'.
+        sql (str): Consulta SQL generada.
+
+    Returns:
+        tuple: (lista de nombres de columna, lista de filas)
+    """
+    with tramo("ejecucion_sql") as datos:
+        clave = canonizar_sql(sql)
+        cache = obtener_cache_sql(version_app)
+        resultado = cache.obtener(clave)
+        datos["cache"] = resultado is not None
+        if resultado is None:
+            from utils.db_utils import conexion
+            with conexion(version_app) as conn:
+                resultado = ejecutar_sql_seguro(conn, clave)
+            cache.guardar(clave, resultado)
+        datos["filas"] = len(resultado[1])
+    return resultado
+
+
+# Formato compacto de los resultados para el prompt de respuesta
+COLUMNAS_CLAVE = ["inventario", "titulo", "autor_a", "coleccion", "datacion", "descripcion"]  # Se conservan con SELECT *
+PRESUPUESTO_TOKENS = 1500  # Tokens aproximados de resultados en el prompt
+MAX_CARACTERES_CELDA = 300  # Caracteres máximos por celda
+CARACTERES_POR_TOKEN = 4  # Estimación para texto en español
+
+
+def _celda(valor, max_caracteres):
+    if valor is None:
+        return ""
+    texto = " ".join(str(valor).split())  # Saltos de línea y espacios repetidos
+    if len(texto) > max_caracteres:
+        texto = texto[:max_caracteres - 1].rstrip() + "…"
+    if any(c in texto for c in ',"'):
+        texto = '"' + texto.replace('"', '""') + '"'
+    return texto
+
+
+def formatear_resultados(columnas, filas, sql=None, presupuesto_tokens=PRESUPUESTO_TOKENS,
+                         max_caracteres_celda=MAX_CARACTERES_CELDA):
+    """
+    Convierte el resultado de una consulta en un CSV compacto para el prompt del LLM, con un presupuesto de tokens.
+
+    - Se descartan la columna de imágenes (el LLM no debe mencionar rutas) y las columnas vacías en todas las filas.
+    - Con `SELECT *` solo se conservan las columnas clave y las que aparecen en el resto de la consulta.
+    - Cada celda se recorta a max_caracteres_celda y las filas que no caben se resumen en "... y N filas más".
+
+    Args:
+        columnas (list): Nombres de las columnas.
+        filas (list): Filas del resultado.
+        sql (str, optional): Consulta ejecutada, para saber qué columnas se usan.
+        presupuesto_tokens (int, optional): Tokens aproximados disponibles. Por defecto PRESUPUESTO_TOKENS.
+        max_caracteres_celda (int, optional): Caracteres por celda. Por defecto MAX_CARACTERES_CELDA.
+
+    Returns:
+        str: Resultados en formato CSV con cabecera.
+    """
+    if not filas:
+        return "(sin resultados)"
+
+    indices = [i for i, c in enumerate(columnas) if c != "imagenes"]
+    if sql and len(indices) > len(COLUMNAS_CLAVE):
+        tokens = tokenizar(sql)
+        fin_select = tokens.index(("ident", "from")) if ("ident", "from") in tokens else len(tokens)
+        if any(tokens[j] == ("op", "*") and tokens[j - 1][1] != "(" for j in range(1, fin_select)):
+            referenciadas = {texto for tipo, texto in tokens[fin_select:] if tipo == "ident"}
+            indices = [i for i in indices if columnas[i] in COLUMNAS_CLAVE or columnas[i] in referenciadas]
+    indices = [i for i in indices if any(fila[i] not in (None, "") for fila in filas)] or indices[:1]
+
+    presupuesto = presupuesto_tokens * CARACTERES_POR_TOKEN
+    lineas = [",".join(columnas[i] for i in indices)]
+    usados = len(lineas[0])
+    for n, fila in enumerate(filas):
+        linea = ",".join(_celda(fila[i], max_caracteres_celda) for i in indices)
+        if usados + len(linea) + 1 > presupuesto and n > 0:
+            lineas.append(f"... y {len(filas) - n} filas más")
+            break
+        lineas.append(linea)
+        usados += len(linea) + 1
+    return "\n".join(lineas)
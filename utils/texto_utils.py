@@ -0,0 +1,24 @@
+"""
+Tokenización de textos en español compartida por la búsqueda BM25 (utils.busqueda_hibrida) y la firma de las
+consultas de la caché de respuestas (utils.cache_utils).
+"""
+import re
+import unicodedata
+
+PALABRAS_VACIAS = set("""
+a al algo ante como con cual cuando de del desde donde durante e el ella ellas ellos en entre era es esa ese eso
+esta este esto fue ha hay la las le les lo los mas me mi muy no nos o para pero por que quien se sin sobre su sus
+tambien te tiene un una uno unos unas y ya yo cuales cuantos cuantas
+""".split())
+
+
+def tokenizar(texto):
+    """
+    Divide un texto en términos: minúsculas, sin tildes y sin palabras vacías.
+
+    Returns:
+        list: Términos del texto.
+    """
+    texto = unicodedata.normalize("NFKD", texto.lower())
+    texto = "".join(c for c in texto if not unicodedata.combining(c))
+    return [t for t in re.findall(r"\w+", texto) if t not in PALABRAS_VACIAS]
@@ -0,0 +1,285 @@
+"""
+Trazas de latencia del pipeline de consultas.
+
+Cada consulta abre una traza con su query_id y cada paso (clasificación, generación de SQL, ejecución en la base
+de datos, recuperación, respuesta, miniaturas, descargas de S3...) registra un tramo con su duración y atributos
+(tokens de Groq, acierto de caché, número de filas...). Los tramos se:
+
+- escriben en un fichero JSON Lines (TRAZAS_JSONL), que rota al superar TRAZAS_MAX_BYTES conservando
+  TRAZAS_COPIAS ficheros anteriores (trazas.jsonl.1, .2...),
+- acumulan en histogramas que se sirven en formato Prometheus (iniciar_servidor_metricas),
+- guardan en la traza de la consulta, para mostrar el desglose en modo desarrollo.
+
+La traza activa se propaga con contextvars; las funciones que se ejecutan en otros hilos deben lanzarse con
+`en_contexto` para conservarla.
+"""
+import os
+import json
+import time
+import threading
+import contextvars
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+TRAZAS_JSONL = os.getenv("TRAZAS_JSONL", os.path.join(os.path.dirname(__file__), "..", "data", "trazas", "trazas.jsonl"))
+TRAZAS_ACTIVAS = os.getenv("TRAZAS_ACTIVAS", "1") == "1"
+TRAZAS_MAX_BYTES = int(os.getenv("TRAZAS_MAX_BYTES", 50 * 1024 ** 2))
+TRAZAS_COPIAS = int(os.getenv("TRAZAS_COPIAS", "3"))
+PUERTO_METRICAS = int(os.getenv("PUERTO_METRICAS", "9464"))
+HOST_METRICAS = os.getenv("HOST_METRICAS", "127.0.0.1")  # 0.0.0.0 para exponerlo fuera de la máquina
+LIMITES_HISTOGRAMA = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+_traza_actual = contextvars.ContextVar("traza_actual", default=None)
+_tramo_actual = contextvars.ContextVar("tramo_actual", default=None)
+_lock_fichero = threading.Lock()
+_lock_metricas = threading.Lock()
+_histogramas = {}  # tramo -> {"cubetas": [...], "suma": float, "cuenta": int}
+_tokens = {}  # (tramo, tipo) -> tokens
+_servidor = None
+
+
+class Traza:
+    """
+    Tramos registrados durante una consulta.
+    """
+
+    def __init__(self, query_id):
+        self.query_id = query_id
+        self.inicio = time.time()
+        self.tramos = []
+        self._lock = threading.Lock()
+
+    def agregar(self, tramo):
+        with self._lock:
+            self.tramos.append(tramo)
+
+    def desglose(self):
+        """
+        Texto con la duración de cada tramo en orden de inicio, para el modo desarrollo.
+        """
+        with self._lock:
+            tramos = sorted(self.tramos, key=lambda t: t["inicio"])
+        lineas = [f"Desglose de latencia ({self.query_id}):"]
+        for tramo in tramos:
+            extra = {k: v for k, v in tramo.items() if k not in ("query_id", "tramo", "inicio", "duracion_ms")}
+            detalle = f"  {extra}" if extra else ""
+            lineas.append(f"- {tramo['tramo']}: {tramo['duracion_ms']:.0f} ms{detalle}")
+        return "\n".join(lineas)
+
+
+def iniciar_traza(query_id):
+    """
+    Abre la traza de una consulta en el contexto actual.
+
+    Returns:
+        Traza: Traza activa.
+    """
+    traza = Traza(query_id)
+    _traza_actual.set(traza)
+    return traza
+
+
+def traza_actual():
+    return _traza_actual.get()
+
+
+def cerrar_traza():
+    """
+    Desactiva la traza del contexto actual, para que los tramos posteriores no se atribuyan a la consulta.
+    """
+    _traza_actual.set(None)
+
+
+def en_contexto(funcion):
+    """
+    Envuelve una función para que, ejecutada en otro hilo, registre sus tramos en la traza actual.
+    """
+    contexto = contextvars.copy_context()
+    return lambda *args, **kwargs: contexto.run(funcion, *args, **kwargs)
+
+
+def anotar(**atributos):
+    """
+    Añade atributos al tramo en curso (p.e. tokens de Groq o número de filas).
+    """
+    tramo = _tramo_actual.get()
+    if tramo is not None:
+        tramo.update(atributos)
+
+
+def registrar_uso(uso):
+    """
+    Anota en el tramo en curso los tokens de una respuesta de Groq (objeto `usage`).
+    """
+    if uso is None:
+        return
+    anotar(
+        tokens_prompt=getattr(uso, "prompt_tokens", None),
+        tokens_respuesta=getattr(uso, "completion_tokens", None),
+    )
+
+
+@contextmanager
+def tramo(nombre, **atributos):
+    """
+    Mide la duración de un bloque y la registra como tramo de la traza actual.
+
+    Args:
+        nombre (str): Nombre del tramo (p.e. "clasificacion").
+        **atributos: Atributos iniciales del tramo.
+    """
+    if not TRAZAS_ACTIVAS:
+        yield {}
+        return
+    datos = dict(atributos)
+    token = _tramo_actual.set(datos)
+    inicio = time.time()
+    reloj = time.perf_counter()
+    try:
+        yield datos
+    except BaseException as e:
+        datos["error"] = type(e).__name__
+        raise
+    finally:
+        _tramo_actual.reset(token)
+        _cerrar(nombre, inicio, time.perf_counter() - reloj, datos)
+
+
+def trazar_stream(nombre, generador, **atributos):
+    """
+    Envuelve un generador de texto en streaming para registrarlo como tramo, con el tiempo hasta el primer fragmento.
+    """
+    with tramo(nombre, **atributos) as datos:
+        reloj = time.perf_counter()
+        primero = True
+        for fragmento in generador:
+            if primero:
+                datos["primer_token_ms"] = round((time.perf_counter() - reloj) * 1000, 1)
+                primero = False
+            yield fragmento
+
+
+def _cerrar(nombre, inicio, duracion, datos):
+    traza = _traza_actual.get()
+    registro = {
+        "query_id": traza.query_id if traza else None,
+        "tramo": nombre,
+        "inicio": inicio,
+        "duracion_ms": round(duracion * 1000, 1),
+        **datos,
+    }
+    if traza is not None:
+        traza.agregar(registro)
+    _observar(nombre, duracion, datos)
+    try:
+        with _lock_fichero:
+            os.makedirs(os.path.dirname(TRAZAS_JSONL), exist_ok=True)
+            _rotar()
+            with open(TRAZAS_JSONL, "a", encoding="utf-8") as f:
+                f.write(json.dumps(registro, ensure_ascii=False, default=str) + "\n")
+    except OSError as e:
+        print(f"No se pudo escribir la traza: {e}")
+
+
+def _rotar():
+    """
+    Si el fichero de trazas supera TRAZAS_MAX_BYTES, lo renombra a .1 (y desplaza los anteriores hasta
+    TRAZAS_COPIAS, borrando el más antiguo). Se llama con _lock_fichero adquirido.
+    """
+    try:
+        if os.path.getsize(TRAZAS_JSONL) < TRAZAS_MAX_BYTES:
+            return
+    except FileNotFoundError:
+        return
+    if TRAZAS_COPIAS <= 0:
+        os.remove(TRAZAS_JSONL)
+        return
+    for i in range(TRAZAS_COPIAS - 1, 0, -1):
+        if os.path.exists(f"{TRAZAS_JSONL}.{i}"):
+            os.replace(f"{TRAZAS_JSONL}.{i}", f"{TRAZAS_JSONL}.{i + 1}")
+    os.replace(TRAZAS_JSONL, f"{TRAZAS_JSONL}.1")
+
+
+def _observar(nombre, duracion, datos):
+    with _lock_metricas:
+        histograma = _histogramas.setdefault(
+            nombre, {"cubetas": [0] * len(LIMITES_HISTOGRAMA), "suma": 0.0, "cuenta": 0, "errores": 0}
+        )
+        for i, limite in enumerate(LIMITES_HISTOGRAMA):
+            if duracion <= limite:
+                histograma["cubetas"][i] += 1
+        histograma["suma"] += duracion
+        histograma["cuenta"] += 1
+        if "error" in datos:
+            histograma["errores"] += 1
+        for tipo in ("tokens_prompt", "tokens_respuesta"):
+            if datos.get(tipo):
+                _tokens[(nombre, tipo)] = _tokens.get((nombre, tipo), 0) + datos[tipo]
+
+
+def metricas_prometheus():
+    """
+    Devuelve las métricas acumuladas en el formato de texto de Prometheus.
+    """
+    lineas = [
+        "# HELP soroia_tramo_segundos Duración de los tramos del pipeline de consultas.",
+        "# TYPE soroia_tramo_segundos histogram",
+    ]
+    with _lock_metricas:
+        for nombre, h in sorted(_histogramas.items()):
+            for limite, cuenta in zip(LIMITES_HISTOGRAMA, h["cubetas"]):
+                lineas.append(f'soroia_tramo_segundos_bucket{{tramo="{nombre}",le="{limite}"}} {cuenta}')
+            lineas.append(f'soroia_tramo_segundos_bucket{{tramo="{nombre}",le="+Inf"}} {h["cuenta"]}')
+            lineas.append(f'soroia_tramo_segundos_sum{{tramo="{nombre}"}} {h["suma"]:.6f}')
+            lineas.append(f'soroia_tramo_segundos_count{{tramo="{nombre}"}} {h["cuenta"]}')
+        lineas += ["# HELP soroia_tramo_errores_total Tramos terminados con excepción.",
+                   "# TYPE soroia_tramo_errores_total counter"]
+        for nombre, h in sorted(_histogramas.items()):
+            lineas.append(f'soroia_tramo_errores_total{{tramo="{nombre}"}} {h["errores"]}')
+        lineas += ["# HELP soroia_groq_tokens_total Tokens de Groq por tramo y tipo.",
+                   "# TYPE soroia_groq_tokens_total counter"]
+        for (nombre, tipo), total in sorted(_tokens.items()):
+            lineas.append(f'soroia_groq_tokens_total{{tramo="{nombre}",tipo="{tipo}"}} {total}')
+    return "\n".join(lineas) + "\n"
+
+
+class _ManejadorMetricas(BaseHTTPRequestHandler):
+    def do_GET(self):
+        if self.path == "/metrics":
+            estado, cuerpo = 200, metricas_prometheus()
+        elif self.path == "/ready":
+            # Sonda de disponibilidad: 503 hasta que termina el precalentado de los recursos. Solo el estado; el
+            # detalle de los recursos se consulta con `python -m utils.recursos`
+            from utils.recursos import listo
+            estado, cuerpo = (200, "ok\n") if listo() else (503, "pendiente\n")
+        else:
+            self.send_error(404)
+            return
+        cuerpo = cuerpo.encode("utf-8")
+        self.send_response(estado)
+        self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+        self.send_header("Content-Length", str(len(cuerpo)))
+        self.end_headers()
+        self.wfile.write(cuerpo)
+
+    def log_message(self, *args):
+        pass
+
+
+def iniciar_servidor_metricas(puerto=PUERTO_METRICAS, host=HOST_METRICAS):
+    """
+    Sirve /metrics en formato Prometheus y la sonda /ready en un hilo aparte, una vez por proceso.
+    Por defecto solo escucha en 127.0.0.1 (HOST_METRICAS).
+
+    Returns:
+        ThreadingHTTPServer or None: Servidor, o None si el puerto no está disponible.
+    """
+    global _servidor
+    if _servidor is None:
+        try:
+            _servidor = ThreadingHTTPServer((host, puerto), _ManejadorMetricas)
+        except OSError as e:
+            print(f"No se pudo iniciar el servidor de métricas en {host}:{puerto}: {e}")
+            return None
+        threading.Thread(target=_servidor.serve_forever, daemon=True, name="metricas").start()
+    return _servidor